@@ -1,4 +1,17 @@
-from db_setup import run_setup
+from contextlib import asynccontextmanager
+
+from db_setup import (
+    run_setup,
+    get_pool,
+    close_pool,
+    get_async_pool,
+    close_async_pool,
+)
+from autocomplete import start_autocomplete_listener
+from digests import start_digest_scheduler
+from hashing import password_hasher
+from lookups import load_lookups
+from revocations import load_revocations
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -26,9 +39,36 @@ tags_metadata = [
         "name": "users",
         "description": "Operations with users info.",
     },
+    {
+        "name": "health",
+        "description": "Runtime statistics for the API.",
+    },
 ]
 
-app = FastAPI(title="Hemnet Clone API", version="1.0.0", openapi_tags=tags_metadata)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    get_pool()
+    await get_async_pool()
+    load_lookups()
+    load_revocations()
+    autocomplete_listener = await start_autocomplete_listener()
+    digest_scheduler = start_digest_scheduler()
+    yield
+    autocomplete_listener.cancel()
+    if digest_scheduler is not None:
+        digest_scheduler.cancel()
+    password_hasher.close()
+    await close_async_pool()
+    close_pool()
+
+
+app = FastAPI(
+    title="Hemnet Clone API",
+    version="1.0.0",
+    openapi_tags=tags_metadata,
+    lifespan=lifespan,
+)
 
 origins = ["http://localhost:5173", "http://127.0.0.1:5173"]
 
@@ -0,0 +1,109 @@
+from typing import Any, AsyncIterator, Mapping, Sequence, Optional, TypeAlias
+from psycopg import AsyncConnection
+from psycopg.rows import dict_row
+from prepared import Statement
+
+_SQLParams: TypeAlias = Sequence[Any] | Mapping[str, Any]
+
+
+async def fetch_all(
+    connection: AsyncConnection,
+    query: str,
+    parameters: Optional[_SQLParams] = None,
+    prepare: Optional[bool] = None,
+):
+    """
+    Async twin of db.fetch_all, returns many rows as dicts.
+    prepare=True prepares the query on this connection right away instead of
+    after psycopg's usual handful of executions.
+    """
+    async with connection.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute(query, parameters, prepare=prepare)
+        return await cursor.fetchall()
+
+
+async def fetch_one(
+    connection: AsyncConnection,
+    query: str,
+    parameters: Optional[_SQLParams] = None,
+    prepare: Optional[bool] = None,
+):
+    """
+    Async twin of db.fetch_one, returns a single row as a dict.
+    """
+    async with connection.cursor(row_factory=dict_row) as cursor:
+        await cursor.execute(query, parameters, prepare=prepare)
+        return await cursor.fetchone()
+
+
+async def fetch_all_prepared(
+    connection: AsyncConnection,
+    statement: Statement,
+    parameters: Optional[Sequence[Any]] = None,
+):
+    """
+    Async twin of db.fetch_all_prepared. psycopg keeps the prepared statement in
+    the connection's cache, bounded by prepared_max (see db_setup).
+    """
+    return await fetch_all(connection, statement.sql, parameters, prepare=True)
+
+
+async def fetch_one_prepared(
+    connection: AsyncConnection,
+    statement: Statement,
+    parameters: Optional[Sequence[Any]] = None,
+):
+    """
+    Async twin of db.fetch_one_prepared.
+    """
+    return await fetch_one(connection, statement.sql, parameters, prepare=True)
+
+
+async def iter_rows(
+    connection: AsyncConnection,
+    query: str,
+    parameters: Optional[_SQLParams] = None,
+    batch_size: int = 1000,
+    name: str = "rows",
+) -> AsyncIterator[dict]:
+    """
+    Async twin of db.iter_rows, streams rows as dicts from a server-side cursor.
+    """
+    async with connection.transaction():
+        async with connection.cursor(name, row_factory=dict_row) as cursor:
+            cursor.itersize = batch_size
+            await cursor.execute(query, parameters)
+            while True:
+                rows = await cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+
+
+async def execute_returning(
+    connection: AsyncConnection,
+    query: str,
+    parameters: Optional[_SQLParams] = None,
+):
+    """
+    Async twin of db.execute_returning (e.g. INSERT ... RETURNING ...).
+    """
+    async with connection.transaction():
+        async with connection.cursor(row_factory=dict_row) as cursor:
+            await cursor.execute(query, parameters)
+            return await cursor.fetchone()
+
+
+async def execute_with_row_count(
+    connection: AsyncConnection,
+    query: str,
+    parameters: Optional[_SQLParams] = None,
+):
+    """
+    Async twin of db.execute_with_row_count.
+    """
+    async with connection.transaction():
+        async with connection.cursor() as cursor:
+            await cursor.execute(query, parameters)
+            return cursor.rowcount
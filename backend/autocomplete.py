@@ -0,0 +1,255 @@
+import asyncio
+import bisect
+import heapq
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Iterable, List
+
+import psycopg
+import psycopg2
+from psycopg.conninfo import make_conninfo
+
+from db import fetch_all
+from db_setup import CONNECTION_SETTINGS, PoolTimeout, pooled_connection
+
+_TERMS_QUERY = """
+    SELECT id, title, city, municipality, postal_code
+    FROM listing_search
+    {where}
+"""
+
+# prefixes up to this length match a large part of the index, their best TOP_K
+# suggestions are kept ready instead of being ranked on every keystroke
+SHORT_PREFIX = 3
+TOP_K = 10
+
+# committed listing_search changes are announced here, see migrations/011_listing_search_notify.sql
+CHANGES_CHANNEL = "listing_search"
+# wait before listening again once the connection was lost
+RECONNECT_SECONDS = 5
+
+
+def normalize(text: str) -> str:
+    """
+    Case and diacritic insensitive key, "Göteborg " -> "goteborg".
+    """
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    stripped = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(stripped.split())
+
+
+class PrefixIndex:
+    """
+    In-process prefix index over listing titles, cities, municipalities and
+    postal codes. Keys are kept in a sorted list and searched with bisect,
+    suggestions are ranked by how many listings carry the term. The ranking of
+    short prefixes is precomputed and updated as listings change.
+
+    Every worker process holds its own copy, it is built at startup and follows
+    the listing_search changes committed by any process (other workers, manage.py
+    imports and rebuilds). The write endpoints also refresh it directly so a
+    worker's own changes show up without waiting for the notification.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys: List[str] = []
+        self._counts: dict[str, int] = {}
+        self._labels: dict[str, str] = {}
+        self._listing_terms: dict[int, tuple[str, ...]] = {}
+        # short prefix -> its best TOP_K keys, best first
+        self._top: dict[str, List[str]] = {}
+
+    def build(self, rows: Iterable[dict]):
+        with self._lock:
+            self._keys = []
+            self._counts = {}
+            self._labels = {}
+            self._listing_terms = {}
+            for row in rows:
+                self._add(row)
+            self._keys.sort()
+
+            by_prefix = defaultdict(list)
+            for key in self._keys:
+                for prefix in _short_prefixes(key):
+                    by_prefix[prefix].append(key)
+            self._top = {prefix: self._rank(keys) for prefix, keys in by_prefix.items()}
+
+    def refresh_listings(self, connection, listing_ids: List[int]):
+        """
+        Re-reads the terms of the given listings, dropping the ones that no longer exist.
+        """
+        if not listing_ids:
+            return
+        rows = fetch_all(
+            connection,
+            _TERMS_QUERY.format(where="WHERE id = ANY(%s)"),
+            (listing_ids,),
+        )
+        with self._lock:
+            changes: dict[str, int] = {}
+            for listing_id in listing_ids:
+                self._remove(listing_id, changes)
+            for row in rows:
+                self._add(row, keep_sorted=True, changes=changes)
+            self._update_top(changes)
+
+    def remove_listing(self, listing_id: int):
+        with self._lock:
+            changes: dict[str, int] = {}
+            self._remove(listing_id, changes)
+            self._update_top(changes)
+
+    def search(self, prefix: str, limit: int = TOP_K) -> List[str]:
+        key = normalize(prefix)
+        if not key:
+            return []
+        with self._lock:
+            if len(key) <= SHORT_PREFIX and limit <= TOP_K:
+                return [self._labels[candidate] for candidate in self._top.get(key, [])[:limit]]
+            best = heapq.nsmallest(limit, self._matching(key), key=self._rank_key)
+            return [self._labels[candidate] for candidate in best]
+
+    def _rank_key(self, key: str) -> tuple[int, str]:
+        return -self._counts[key], key
+
+    def _rank(self, keys: Iterable[str]) -> List[str]:
+        return heapq.nsmallest(TOP_K, keys, key=self._rank_key)
+
+    def _matching(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self._keys, prefix)
+        matches = []
+        for index in range(start, len(self._keys)):
+            candidate = self._keys[index]
+            if not candidate.startswith(prefix):
+                break
+            matches.append(candidate)
+        return matches
+
+    def _update_top(self, changes: dict[str, int]):
+        """
+        Re-ranks the short prefixes of the changed keys, changes holds each key's
+        count before the change. Keys outside a prefix's top that didn't change
+        can only move in when a key of the top lost listings, only then is the
+        prefix scanned again.
+        """
+        prefixes = {prefix for key in changes for prefix in _short_prefixes(key)}
+        for prefix in prefixes:
+            top = self._top.get(prefix, [])
+            shrunk = any(
+                key in changes and self._counts.get(key, 0) < changes[key] for key in top
+            )
+            if shrunk and len(top) >= TOP_K:
+                candidates = self._matching(prefix)
+            else:
+                candidates = {key for key in top if key in self._counts}
+                candidates.update(
+                    key for key in changes if key.startswith(prefix) and key in self._counts
+                )
+            ranked = self._rank(candidates)
+            if ranked:
+                self._top[prefix] = ranked
+            else:
+                self._top.pop(prefix, None)
+
+    def _add(self, row: dict, keep_sorted: bool = False, changes: dict[str, int] | None = None):
+        labels = {}
+        for field in ("title", "city", "municipality", "postal_code"):
+            value = row.get(field)
+            if value:
+                key = normalize(value)
+                if key:
+                    labels.setdefault(key, value.strip())
+
+        for key, label in labels.items():
+            if changes is not None:
+                changes.setdefault(key, self._counts.get(key, 0))
+            if key not in self._counts:
+                self._counts[key] = 0
+                if keep_sorted:
+                    bisect.insort(self._keys, key)
+                else:
+                    self._keys.append(key)
+            self._counts[key] += 1
+            self._labels[key] = label
+
+        self._listing_terms[row["id"]] = tuple(labels)
+
+    def _remove(self, listing_id: int, changes: dict[str, int]):
+        for key in self._listing_terms.pop(listing_id, ()):
+            changes.setdefault(key, self._counts[key])
+            self._counts[key] -= 1
+            if self._counts[key] <= 0:
+                del self._counts[key]
+                del self._labels[key]
+                index = bisect.bisect_left(self._keys, key)
+                if index < len(self._keys) and self._keys[index] == key:
+                    self._keys.pop(index)
+
+
+def _short_prefixes(key: str) -> List[str]:
+    return [key[:length] for length in range(1, min(SHORT_PREFIX, len(key)) + 1)]
+
+
+autocomplete_index = PrefixIndex()
+
+
+def build_autocomplete_index():
+    with pooled_connection() as connection:
+        autocomplete_index.build(fetch_all(connection, _TERMS_QUERY.format(where="")))
+
+
+def apply_change(payload: str):
+    """
+    Applies one listing_search notification, the changed ids or "*" for everything.
+    """
+    if payload == "*":
+        build_autocomplete_index()
+        return
+    listing_ids = [int(listing_id) for listing_id in payload.split(",")]
+    with pooled_connection() as connection:
+        autocomplete_index.refresh_listings(connection, listing_ids)
+
+
+async def _listen() -> psycopg.AsyncConnection:
+    connection = await psycopg.AsyncConnection.connect(
+        make_conninfo(**CONNECTION_SETTINGS), autocommit=True
+    )
+    try:
+        await connection.execute(f"LISTEN {CHANGES_CHANNEL}")
+        # built after LISTEN, so nothing committed in between is missed
+        await asyncio.to_thread(build_autocomplete_index)
+    except BaseException:
+        await connection.close()
+        raise
+    return connection
+
+
+async def _follow_changes(connection: psycopg.AsyncConnection):
+    while True:
+        try:
+            async for notify in connection.notifies():
+                await asyncio.to_thread(apply_change, notify.payload)
+        except (psycopg.Error, psycopg2.Error, PoolTimeout):
+            # notifications may have been missed, listen again and rebuild
+            pass
+        finally:
+            await connection.close()
+
+        while True:
+            await asyncio.sleep(RECONNECT_SECONDS)
+            try:
+                connection = await _listen()
+                break
+            except (psycopg.Error, psycopg2.Error, PoolTimeout):
+                continue
+
+
+async def start_autocomplete_listener() -> asyncio.Task:
+    """
+    Builds the index and returns the task that keeps it current, cancel it on shutdown.
+    """
+    connection = await _listen()
+    return asyncio.create_task(_follow_changes(connection))
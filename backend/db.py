@@ -1,9 +1,17 @@
-from typing import Any, Mapping, Sequence, Optional, TypeAlias
+import weakref
+from contextlib import contextmanager
+from typing import Any, Iterator, List, Mapping, Sequence, Optional, Tuple, TypeAlias
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+from prepared import Statement
 
 _SQLParams: TypeAlias = Sequence[Any] | Mapping[str, Any]
 
+# names of the statements PREPAREd on each connection, they live as long as the session
+_prepared: "weakref.WeakKeyDictionary[psycopg2.extensions.connection, set[str]]" = (
+    weakref.WeakKeyDictionary()
+)
+
 
 def fetch_all(
     connection: psycopg2.extensions.connection,
@@ -37,6 +45,40 @@ def fetch_one(
         return cursor.fetchone()
 
 
+def _execute_prepared(cursor, statement: Statement, parameters: Optional[Sequence[Any]]):
+    prepared = _prepared.setdefault(cursor.connection, set())
+    if statement.name not in prepared:
+        cursor.execute(statement.prepare_sql)
+        prepared.add(statement.name)
+    cursor.execute(statement.execute_sql, parameters)
+
+
+def fetch_all_prepared(
+    connection: psycopg2.extensions.connection,
+    statement: Statement,
+    parameters: Optional[Sequence[Any]] = None,
+):
+    """
+    fetch_all for a registered statement, planned once per connection.
+    """
+    with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+        _execute_prepared(cursor, statement, parameters)
+        return cursor.fetchall()
+
+
+def fetch_one_prepared(
+    connection: psycopg2.extensions.connection,
+    statement: Statement,
+    parameters: Optional[Sequence[Any]] = None,
+):
+    """
+    fetch_one for a registered statement, planned once per connection.
+    """
+    with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+        _execute_prepared(cursor, statement, parameters)
+        return cursor.fetchone()
+
+
 def execute_returning(
     connection: psycopg2.extensions.connection,
     query: str,
@@ -54,6 +96,23 @@ def execute_returning(
             return cursor.fetchone()
 
 
+def execute_returning_all(
+    connection: psycopg2.extensions.connection,
+    query: str,
+    parameters: Optional[_SQLParams] = None,
+):
+    """
+    Like execute_returning but returns every row, for set-based writes.
+    """
+    with connection:
+        with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+            if parameters is None:
+                cursor.execute(query)
+            else:
+                cursor.execute(query, parameters)
+            return cursor.fetchall()
+
+
 def execute_with_row_count(
     connection: psycopg2.extensions.connection,
     query: str,
@@ -69,3 +128,124 @@ def execute_with_row_count(
             else:
                 cursor.execute(query, parameters)
             return cursor.rowcount
+
+
+def iter_rows(
+    connection: psycopg2.extensions.connection,
+    query: str,
+    parameters: Optional[_SQLParams] = None,
+    batch_size: int = 1000,
+    name: str = "rows",
+) -> Iterator[dict]:
+    """
+    Like fetch_all but yields the rows one at a time from a server-side (named)
+    cursor, fetching batch_size rows per round trip. Runs in its own transaction.
+    """
+    with connection:
+        with connection.cursor(name=name, cursor_factory=RealDictCursor) as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(query, parameters)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+
+
+def iter_batches(
+    connection: psycopg2.extensions.connection,
+    query: str,
+    parameters: Optional[_SQLParams] = None,
+    batch_size: int = 5000,
+    name: str = "batches",
+) -> Iterator[tuple[List[str], List[tuple]]]:
+    """
+    Streams a large result from a server-side (named) cursor as (column names,
+    rows) batches of at most batch_size tuples, so memory stays flat however
+    many rows the query returns. Runs in its own transaction.
+    """
+    with connection:
+        with connection.cursor(name=name) as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(query, parameters)
+            columns = None
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                if columns is None:
+                    columns = [column.name for column in cursor.description]
+                yield columns, rows
+
+
+class UnitOfWork:
+    """
+    The statements of one write, run on a single cursor inside one transaction.
+    Use through unit_of_work(), the transaction commits when the block exits and
+    rolls back if anything in it raises (including an HTTPException).
+    """
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def returning(self, query: str, parameters: Optional[_SQLParams] = None):
+        """
+        Like execute_returning, without its own transaction.
+        """
+        self.cursor.execute(query, parameters)
+        return self.cursor.fetchone()
+
+    def returning_all(self, query: str, parameters: Optional[_SQLParams] = None):
+        self.cursor.execute(query, parameters)
+        return self.cursor.fetchall()
+
+    def row_count(self, query: str, parameters: Optional[_SQLParams] = None) -> int:
+        self.cursor.execute(query, parameters)
+        return self.cursor.rowcount
+
+    def values(
+        self,
+        query: str,
+        rows: Sequence[Sequence[Any]],
+        template: Optional[str] = None,
+        page_size: int = 1000,
+        returning: bool = False,
+    ):
+        """
+        Runs query, which has a single "VALUES %s", with rows expanded into a
+        multi-row VALUES list, one round trip per page_size rows. Returns the
+        RETURNING rows when returning is set, otherwise the number of rows sent.
+        """
+        if not rows:
+            return [] if returning else 0
+        result = execute_values(
+            self.cursor, query, rows, template=template, page_size=page_size, fetch=returning
+        )
+        return result if returning else len(rows)
+
+    def pipeline(self, statements: Sequence[Tuple[str, Optional[_SQLParams]]]) -> List[dict]:
+        """
+        Sends independent statements together in one round trip (psycopg2 has no
+        pipeline mode, so they are bound client side and joined into one query
+        string). Returns the rows of the last statement, if it returns any.
+        """
+        if not statements:
+            return []
+        self.cursor.execute(
+            b";\n".join(self.cursor.mogrify(query, parameters) for query, parameters in statements)
+        )
+        return self.cursor.fetchall() if self.cursor.description else []
+
+
+@contextmanager
+def unit_of_work(connection: psycopg2.extensions.connection) -> Iterator[UnitOfWork]:
+    """
+    One transaction for all the statements of a write:
+
+        with unit_of_work(connection) as work:
+            row = work.returning(insert_query, parameters)
+            work.values(link_query, [(row["id"], other_id) for other_id in other_ids])
+    """
+    with connection:
+        with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+            yield UnitOfWork(cursor)
@@ -1,28 +1,358 @@
+import asyncio
 import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 
 import psycopg2
 from dotenv import load_dotenv
+from psycopg2 import InterfaceError, OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
 
 load_dotenv(override=True)
 
 DATABASE_NAME = os.getenv("DATABASE_NAME")
 PASSWORD = os.getenv("PASSWORD")
 
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "3600"))
+POOL_CHECK_AFTER = float(os.getenv("DB_POOL_CHECK_AFTER", "30"))
+# prepared statements psycopg keeps per async connection (least recently used go first),
+# enough for the registered statements and the common list_listings filter combinations
+PREPARED_MAX = int(os.getenv("DB_PREPARED_MAX", "256"))
+
+_RATE_WINDOW = 60.0
+
+MIGRATIONS_DIR = "migrations"
+
+CONNECTION_SETTINGS = {
+    "dbname": DATABASE_NAME,
+    "user": "postgres",  # change if needed
+    "password": PASSWORD,
+    "host": "localhost",  # change if needed
+    "port": "5432",  # change if needed
+}
+
 
 def get_connection():
     """
-    Function that returns a single connection
-    In reality, we might use a connection pool, since
-    this way we'll start a new connection each time
-    someone hits one of our endpoints, which isn't great for performance
+    Function that returns a single, unpooled connection.
+    Used by the setup scripts, request handlers borrow from the pool below
+    """
+    return psycopg2.connect(**CONNECTION_SETTINGS)
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection could be borrowed within the pool timeout.
+    """
+
+
+class _PooledConnection:
+    __slots__ = ("connection", "created_at", "returned_at")
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.returned_at = self.created_at
+
+
+class ConnectionPool:
+    """
+    A thread safe pool of psycopg2 connections.
+
+    Connections idle for longer than max_idle (above min_size) or older than
+    max_lifetime are closed, connections that have been idle for check_after
+    seconds are pinged before being handed out, and borrowers wait at most
+    timeout seconds before PoolTimeout is raised.
+    """
+
+    def __init__(
+        self,
+        min_size: int = POOL_MIN_SIZE,
+        max_size: int = POOL_MAX_SIZE,
+        timeout: float = POOL_TIMEOUT,
+        max_idle: float = POOL_MAX_IDLE,
+        max_lifetime: float = POOL_MAX_LIFETIME,
+        check_after: float = POOL_CHECK_AFTER,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Invalid pool size, expected 0 <= min_size <= max_size")
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.max_lifetime = max_lifetime
+        self.check_after = check_after
+
+        self._condition = threading.Condition()
+        self._idle: deque[_PooledConnection] = deque()
+        self._in_use: dict[int, _PooledConnection] = {}
+        self._size = 0
+        self._waiting = 0
+        self._closed = False
+        self._checkouts: deque[float] = deque()
+        self._total_checkouts = 0
+        self._timeouts = 0
+        self._failed_checks = 0
+
+    def open(self):
+        for _ in range(self.min_size):
+            with self._condition:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                pooled = _PooledConnection(get_connection())
+            except Exception:
+                with self._condition:
+                    self._size -= 1
+                raise
+            with self._condition:
+                self._idle.append(pooled)
+                self._condition.notify()
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            pooled = None
+            with self._condition:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Connection pool is closed")
+                    self._prune_idle()
+                    if self._idle:
+                        # LIFO keeps the warm connections busy and lets the rest age out
+                        pooled = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"No database connection available within {self.timeout}s"
+                        )
+                    self._waiting += 1
+                    try:
+                        self._condition.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            if pooled is None:
+                try:
+                    pooled = _PooledConnection(get_connection())
+                except Exception:
+                    self._release_slot()
+                    raise
+            elif not self._is_healthy(pooled):
+                self._close(pooled.connection)
+                self._release_slot()
+                continue
+
+            with self._condition:
+                now = time.monotonic()
+                self._in_use[id(pooled.connection)] = pooled
+                self._checkouts.append(now)
+                self._total_checkouts += 1
+                self._trim_checkouts(now)
+            return pooled.connection
+
+    def putconn(self, connection, discard: bool = False):
+        with self._condition:
+            pooled = self._in_use.pop(id(connection), None)
+        if pooled is None:
+            self._close(connection)
+            return
+
+        expired = time.monotonic() - pooled.created_at > self.max_lifetime
+        if not (discard or expired or connection.closed):
+            try:
+                if connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+            except (OperationalError, InterfaceError):
+                discard = True
+
+        if discard or expired or connection.closed or self._closed:
+            self._close(connection)
+            self._release_slot()
+            return
+
+        with self._condition:
+            pooled.returned_at = time.monotonic()
+            self._idle.append(pooled)
+            self._condition.notify()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for pooled in idle:
+            self._close(pooled.connection)
+
+    def stats(self) -> dict:
+        with self._condition:
+            now = time.monotonic()
+            self._trim_checkouts(now)
+            return {
+                "size": self._size,
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "waiting": self._waiting,
+                "checkouts_total": self._total_checkouts,
+                "checkouts_per_second": round(len(self._checkouts) / _RATE_WINDOW, 2),
+                "timeouts_total": self._timeouts,
+                "failed_health_checks": self._failed_checks,
+            }
+
+    def _is_healthy(self, pooled: _PooledConnection) -> bool:
+        connection = pooled.connection
+        if connection.closed:
+            return False
+        if time.monotonic() - pooled.created_at > self.max_lifetime:
+            return False
+        if time.monotonic() - pooled.returned_at < self.check_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            connection.rollback()
+            return True
+        except (OperationalError, InterfaceError):
+            with self._condition:
+                self._failed_checks += 1
+            return False
+
+    def _prune_idle(self):
+        """
+        Closes the oldest idle connections while the pool is above min_size.
+        Must be called with the condition held.
+        """
+        now = time.monotonic()
+        while (
+            self._idle
+            and self._size > self.min_size
+            and now - self._idle[0].returned_at > self.max_idle
+        ):
+            pooled = self._idle.popleft()
+            self._size -= 1
+            self._close(pooled.connection)
+
+    def _trim_checkouts(self, now: float):
+        while self._checkouts and now - self._checkouts[0] > _RATE_WINDOW:
+            self._checkouts.popleft()
+
+    def _release_slot(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except (OperationalError, InterfaceError):
+            pass
+
+
+_pool: ConnectionPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Returns the process wide connection pool, creating it on first use.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool()
+                pool.open()
+                _pool = pool
+    return _pool
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+@contextmanager
+def pooled_connection():
+    """
+    Borrows a connection from the pool and always hands it back,
+    dropping it instead if the connection broke while it was borrowed.
+    """
+    pool = get_pool()
+    connection = pool.getconn()
+    discard = False
+    try:
+        yield connection
+    except (OperationalError, InterfaceError):
+        discard = True
+        raise
+    finally:
+        pool.putconn(connection, discard=discard)
+
+
+_async_pool: AsyncConnectionPool | None = None
+_async_pool_lock = asyncio.Lock()
+
+
+async def _configure_async_connection(connection):
+    connection.prepared_max = PREPARED_MAX
+
+
+async def get_async_pool() -> AsyncConnectionPool:
+    """
+    Returns the process wide psycopg 3 pool used by the async endpoints,
+    opening it on first use. Connections run in autocommit mode, writes
+    wrap themselves in connection.transaction()
     """
-    return psycopg2.connect(
-        dbname=DATABASE_NAME,
-        user="postgres",  # change if needed
-        password=PASSWORD,
-        host="localhost",  # change if needed
-        port="5432",  # change if needed
-    )
+    global _async_pool
+    if _async_pool is None:
+        async with _async_pool_lock:
+            if _async_pool is None:
+                pool = AsyncConnectionPool(
+                    make_conninfo(**CONNECTION_SETTINGS),
+                    min_size=POOL_MIN_SIZE,
+                    max_size=POOL_MAX_SIZE,
+                    timeout=POOL_TIMEOUT,
+                    max_idle=POOL_MAX_IDLE,
+                    max_lifetime=POOL_MAX_LIFETIME,
+                    kwargs={"autocommit": True},
+                    configure=_configure_async_connection,
+                    check=AsyncConnectionPool.check_connection,
+                    open=False,
+                )
+                await pool.open()
+                _async_pool = pool
+    return _async_pool
+
+
+async def close_async_pool():
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
 
 
 def _create_tables() -> bool:
@@ -74,6 +404,35 @@ def _seed_tables():
             cursor.execute(statement)
 
 
+def _run_migrations():
+    """
+    Applies the numbered files in migrations/ that are newer than the
+    recorded schema version, each one in its own transaction.
+    Files are executed whole so they can contain function bodies.
+    """
+    connection = get_connection()
+    with connection, connection.cursor() as cursor:
+        cursor.execute("SELECT version FROM schema_version")
+        current = cursor.fetchone()[0]
+
+    for file_name in sorted(os.listdir(MIGRATIONS_DIR)):
+        if not file_name.endswith(".sql"):
+            continue
+        version = int(file_name.split("_", 1)[0])
+        if version <= current:
+            continue
+
+        with open(os.path.join(MIGRATIONS_DIR, file_name), "r", encoding="utf-8") as file:
+            sql = file.read()
+
+        with connection, connection.cursor() as cursor:
+            cursor.execute(sql)
+            cursor.execute("UPDATE schema_version SET version = %s", (version,))
+
+    connection.close()
+
+
 def run_setup():
     if _create_tables():
         _seed_tables()
+    _run_migrations()
@@ -0,0 +1,208 @@
+import asyncio
+import multiprocessing
+import os
+import smtplib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, time, timedelta, timezone
+from email.message import EmailMessage
+from itertools import groupby
+from typing import List, Optional
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+from db_setup import CONNECTION_SETTINGS
+from saved_search_matching import MATCHING_STATUSES
+
+# local SMTP stand-in by default, e.g. python -m aiosmtpd -n -l localhost:1025
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "1025"))
+DIGEST_SENDER = os.getenv("DIGEST_SENDER", "bevakningar@hemnet-clone.local")
+DIGEST_WORKERS = int(os.getenv("DIGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+# HH:MM (UTC) to send the digests from the API process, unset = only through manage.py
+DIGEST_AT = os.getenv("DIGEST_AT")
+
+# matches older than this are never mailed, so a search that had send_email turned
+# back on isn't sent everything it matched in the meantime
+DIGEST_LOOKBACK = timedelta(days=7)
+
+# a digest is the pending notifications recorded by saved_search_matching, so what is
+# "new" follows commit order rather than published_at. Users are split into partitions
+# by id, every partition is queried, mailed and marked by one worker. Notifications
+# that can't be mailed any more (search muted, listing off the market, too old) come
+# back with deliver = false and are marked without being sent
+_DIGEST_QUERY = """
+    SELECT n.id AS notification_id,
+           n.user_id,
+           u.email,
+           u.first_name,
+           ss.id AS saved_search_id,
+           ss.query AS saved_search,
+           n.listing_id,
+           s.title,
+           s.list_price,
+           s.rooms,
+           s.city,
+           COALESCE(
+               ss.send_email AND s.status = ANY(%(statuses)s) AND n.matched_at > %(since)s,
+               FALSE
+           ) AS deliver
+    FROM saved_search_notifications n
+    JOIN saved_searches ss ON n.saved_search_id = ss.id
+    JOIN users u ON n.user_id = u.id
+    LEFT JOIN listing_search s ON n.listing_id = s.id
+    WHERE n.digested_at IS NULL
+      AND n.user_id %% %(partitions)s = %(partition)s
+    ORDER BY n.user_id, ss.id, s.published_at DESC NULLS LAST, n.listing_id
+"""
+
+# notifications of users whose mail could not be sent stay pending for the next run,
+# as do the ones recorded after the digest query ran
+_MARK_QUERY = """
+    UPDATE saved_search_notifications
+    SET digested_at = NOW()
+    WHERE id = ANY(%(notification_ids)s)
+"""
+
+_LOCK_KEY = "saved_search_digests"
+
+
+def _format_price(price) -> str:
+    return "Pris saknas" if price is None else f"{price:,.0f} kr".replace(",", " ")
+
+
+def _digest_message(user_rows: List[dict]) -> EmailMessage:
+    first = user_rows[0]
+    lines = [f"Hej {first['first_name']}!", "", "Nya bostäder som matchar dina bevakningar:"]
+    for saved_search, rows in groupby(user_rows, key=lambda row: row["saved_search"]):
+        lines += ["", saved_search]
+        for row in rows:
+            rooms = f", {row['rooms']:g} rum" if row["rooms"] is not None else ""
+            lines.append(f"  - {row['title']}, {row['city']}{rooms}, {_format_price(row['list_price'])}")
+
+    message = EmailMessage()
+    message["From"] = DIGEST_SENDER
+    message["To"] = first["email"]
+    message["Subject"] = f"{len(user_rows)} nya bostäder i dina bevakningar"
+    message.set_content("\n".join(lines))
+    return message
+
+
+def _send_partition(settings: dict, partition: int, partitions: int, since: datetime) -> dict:
+    """
+    Runs in a worker process: queries the pending matches for one partition of users,
+    mails one digest per user and marks the notifications the users got.
+    """
+    parameters = {
+        "partition": partition,
+        "partitions": partitions,
+        "since": since,
+        "statuses": MATCHING_STATUSES,
+    }
+    connection = psycopg2.connect(**settings)
+    try:
+        with connection, connection.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(_DIGEST_QUERY, parameters)
+            rows = cursor.fetchall()
+
+        deliver = [row for row in rows if row["deliver"]]
+        by_user = [list(user_rows) for _, user_rows in groupby(deliver, key=lambda row: row["user_id"])]
+        sent = set()
+        if by_user:
+            try:
+                with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as smtp:
+                    for user_rows in by_user:
+                        try:
+                            smtp.send_message(_digest_message(user_rows))
+                        except smtplib.SMTPRecipientsRefused:
+                            continue
+                        sent.add(user_rows[0]["user_id"])
+            except (OSError, smtplib.SMTPException):
+                # the connection is gone, users not mailed yet are retried next run
+                pass
+        failed = [user_rows[0]["user_id"] for user_rows in by_user if user_rows[0]["user_id"] not in sent]
+        done = [
+            row["notification_id"]
+            for row in rows
+            if not row["deliver"] or row["user_id"] in sent
+        ]
+
+        if done:
+            with connection, connection.cursor() as cursor:
+                cursor.execute(_MARK_QUERY, {"notification_ids": done})
+    finally:
+        connection.close()
+
+    return {
+        "users": len(sent),
+        "listings": sum(len(user_rows) for user_rows in by_user if user_rows[0]["user_id"] in sent),
+        "failed_users": len(failed),
+    }
+
+
+def send_digests(workers: int = DIGEST_WORKERS) -> Optional[dict]:
+    """
+    Mails every user with send_email searches the listings matched since their last
+    digest, with one set-based query per partition of users run across a process
+    pool. Returns None if another process is already sending.
+    """
+    since = datetime.now(timezone.utc) - DIGEST_LOOKBACK
+    partitions = max(workers, 1)
+    settings = dict(CONNECTION_SETTINGS)
+
+    # held for the whole run so API workers and cron don't send the same digest twice
+    connection = psycopg2.connect(**settings)
+    connection.autocommit = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (_LOCK_KEY,))
+            if not cursor.fetchone()[0]:
+                return None
+        try:
+            if partitions == 1:
+                results = [_send_partition(settings, 0, 1, since)]
+            else:
+                with ProcessPoolExecutor(
+                    max_workers=partitions, mp_context=multiprocessing.get_context("spawn")
+                ) as executor:
+                    futures = [
+                        executor.submit(_send_partition, settings, partition, partitions, since)
+                        for partition in range(partitions)
+                    ]
+                    results = [future.result() for future in futures]
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", (_LOCK_KEY,))
+    finally:
+        connection.close()
+
+    return {key: sum(result[key] for result in results) for key in results[0]}
+
+
+def _seconds_until(at: time) -> float:
+    now = datetime.now(timezone.utc)
+    next_run = datetime.combine(now.date(), at, tzinfo=timezone.utc)
+    if next_run <= now:
+        next_run += timedelta(days=1)
+    return (next_run - now).total_seconds()
+
+
+async def run_digest_scheduler(at: time):
+    """
+    Sends the digests every day at the given UTC time, for deployments without cron.
+    """
+    while True:
+        await asyncio.sleep(_seconds_until(at))
+        try:
+            await asyncio.to_thread(send_digests)
+        except (psycopg2.Error, OSError, BrokenProcessPool):
+            # nothing was lost, notifications are only marked once mailed
+            continue
+
+
+def start_digest_scheduler() -> Optional[asyncio.Task]:
+    if not DIGEST_AT:
+        return None
+    hour, minute = (int(part) for part in DIGEST_AT.split(":"))
+    return asyncio.create_task(run_digest_scheduler(time(hour, minute)))
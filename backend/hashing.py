@@ -0,0 +1,125 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+from passlib.context import CryptContext
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_MAX_PENDING = int(os.getenv("HASH_MAX_PENDING", "64"))
+
+# min and max pinned to the default, so hashes with any other cost factor need an update
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+class HashingBusy(Exception):
+    """
+    Raised when the hashing pool already has max_pending jobs queued or running.
+    """
+
+
+# run in the worker processes
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt in a small process pool so logins and sign ups don't burn CPU
+    in the request threads. At most max_pending jobs are queued or running,
+    beyond that callers get HashingBusy instead of waiting in an ever growing queue.
+    """
+
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._max_pending_seen = 0
+        self._completed_total = 0
+        self._rejected_total = 0
+        self._rehashed_total = 0
+
+    async def hash(self, password: str) -> str:
+        return await asyncio.wrap_future(self._submit(_hash, password))
+
+    async def verify_and_update(
+        self, password: str, hashed_password: str
+    ) -> tuple[bool, Optional[str]]:
+        """
+        Returns (valid, new_hash), new_hash is set when the stored hash uses
+        an outdated scheme or cost factor and should be replaced.
+        """
+        valid, new_hash = await asyncio.wrap_future(
+            self._submit(_verify_and_update, password, hashed_password)
+        )
+        if new_hash is not None:
+            with self._lock:
+                self._rehashed_total += 1
+        return valid, new_hash
+
+    def hash_blocking(self, password: str) -> str:
+        """
+        For sync endpoints, the calling thread waits but the work runs in the pool.
+        """
+        return self._submit(_hash, password).result()
+
+    def verify_blocking(self, password: str, hashed_password: str) -> bool:
+        return self._submit(_verify_and_update, password, hashed_password).result()[0]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "max_pending_seen": self._max_pending_seen,
+                "completed_total": self._completed_total,
+                "rejected_total": self._rejected_total,
+                "rehashed_total": self._rehashed_total,
+            }
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _submit(self, function, *args) -> Future:
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected_total += 1
+                raise HashingBusy()
+            if self._executor is None:
+                # spawn, forking a process that runs an event loop and pool threads is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            self._pending += 1
+            self._max_pending_seen = max(self._max_pending_seen, self._pending)
+            future = self._executor.submit(function, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, _future: Future):
+        with self._lock:
+            self._pending -= 1
+            self._completed_total += 1
+
+
+password_hasher = PasswordHasher()
@@ -1,37 +1,83 @@
-from typing import Optional
+import hashlib
+import re
+import time
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import List, Optional
 from psycopg2 import OperationalError, IntegrityError
-from fastapi import HTTPException, status, Depends
+from fastapi import HTTPException, status, Depends, Request, Response
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
-from db import fetch_one
+from psycopg import OperationalError as AsyncOperationalError
+from psycopg_pool import PoolTimeout as AsyncPoolTimeout
+from async_db import fetch_one_prepared, execute_with_row_count
+from cache import TTLCache
 from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
-from db_setup import get_connection
+from db_setup import get_pool, get_async_pool, PoolTimeout
+from hashing import HashingBusy, password_hasher
+from prepared import statement
+from revocations import revocations, ACCESS_TOKEN_LIFETIME
 from schemas import (
     User,
     UserInDB,
-    TokenData,
 )
 
+# most ids a batch read (GET .../batch?ids=1,2,3) resolves in one request
+MAX_BATCH_IDS = 200
+
 SECRET_KEY = "secret-to-change-when-you-go-live-with-this-script"
 ALGORITHM = "HS256"
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+# token -> (user, issued at, expires at), saves decoding and verifying the signature
+token_cache = TTLCache(maxsize=10_000, ttl=300)
+
 
 def get_db():
-    conection = get_connection()
+    pool = get_pool()
+    try:
+        conection = pool.getconn()
+    except PoolTimeout:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database is busy, please try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
+    discard = False
     try:
         yield conection
     except OperationalError:
+        discard = True
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Could not connect to Database",
+        )
+    finally:
+        pool.putconn(conection, discard=discard)
+
+
+async def get_async_db():
+    pool = await get_async_pool()
+    try:
+        connection = await pool.getconn()
+    except AsyncPoolTimeout:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Database is busy, please try again shortly",
+            headers={"Retry-After": "1"},
+        )
+
+    try:
+        yield connection
+    except AsyncOperationalError:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Could not connect to Database",
         )
     finally:
-        conection.close()
+        await pool.putconn(connection)
 
 
 def raise_if_not_found(row, label: str):
@@ -42,26 +88,112 @@ def raise_if_not_found(row, label: str):
     return row
 
 
+def parse_ids(ids: str) -> List[int]:
+    """
+    Parses a comma separated ids query parameter, keeping the request order
+    and dropping repeated ids.
+    """
+    try:
+        values = [int(part) for part in ids.split(",") if part.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="ids must be a comma separated list of integers",
+        )
+    return unique_ids(values)
+
+
+def unique_ids(values: List[int]) -> List[int]:
+    """
+    Drops repeated ids keeping the request order, 400 when there are none or
+    more than MAX_BATCH_IDS.
+    """
+    values = list(dict.fromkeys(values))
+    if not values:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="ids must not be empty"
+        )
+    if len(values) > MAX_BATCH_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_IDS} ids per request",
+        )
+    return values
+
+
+def in_request_order(ids: List[int], rows) -> dict:
+    """
+    Batch read response, rows in the order their ids were asked for and the
+    ids that matched nothing.
+    """
+    by_id = {row["id"]: row for row in rows}
+    return {
+        "items": [by_id[id] for id in ids if id in by_id],
+        "missing": [id for id in ids if id not in by_id],
+    }
+
+
 def handle_error(exc: IntegrityError, fallback: str = "Invalid data"):
     raise HTTPException(
         status_code=status.HTTP_400_BAD_REQUEST, detail=fallback
     ) from exc
 
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+def to_prefix_tsquery(text: str) -> Optional[str]:
+    """
+    Turns free text into a tsquery where every word is a prefix match,
+    e.g. "villa gö" -> "villa:* & gö:*". Returns None when there are no words.
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    return " & ".join(f"{word}:*" for word in words)
+
+
+def not_modified(request: Request, response: Response, version) -> Optional[Response]:
+    """
+    Conditional GET support. version is a row with "version" (changes whenever the
+    underlying rows do) and "last_modified". Sets ETag and Last-Modified on the response
+    and returns a 304 when the client's copy is current, otherwise None and the endpoint
+    builds the body as usual. A missing row sets nothing so the endpoint can 404.
+    """
+    if not version or version["version"] is None:
+        return None
 
+    digest = hashlib.sha1(f"{version['version']}|{request.url.query}".encode())
+    headers = {"ETag": f'"{digest.hexdigest()}"', "Cache-Control": "no-cache"}
+    last_modified = version["last_modified"]
+    if last_modified is not None:
+        last_modified = last_modified.astimezone(timezone.utc).replace(microsecond=0)
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+    response.headers.update(headers)
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match wins over If-Modified-Since when both are sent
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if "*" in tags or headers["ETag"] in tags:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return None
 
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return None
+        if since.tzinfo is not None and last_modified <= since:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return None
 
-def get_user(username: str, connection) -> Optional[UserInDB]:
-    user = fetch_one(
-        connection,
-        "SELECT id, email, password FROM users WHERE email = %s",
-        (username,),
-    )
+
+USER_BY_EMAIL = statement(
+    "user_by_email", "SELECT id, email, password FROM users WHERE email = %s"
+)
+
+
+async def get_user(username: str, connection) -> Optional[UserInDB]:
+    user = await fetch_one_prepared(connection, USER_BY_EMAIL, (username,))
     if not user:
         return None
     return UserInDB(
@@ -71,52 +203,91 @@ def get_user(username: str, connection) -> Optional[UserInDB]:
     )
 
 
-def authenticate_user(username: str, password: str, connection) -> Optional[UserInDB]:
-    user = get_user(username, connection)
+async def authenticate_user(
+    username: str, password: str, connection
+) -> Optional[UserInDB]:
+    user = await get_user(username, connection)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    try:
+        valid, new_hash = await password_hasher.verify_and_update(
+            password, user.hashed_password
+        )
+    except HashingBusy:
+        raise _hashing_busy()
+    if not valid:
         return None
+    if new_hash is not None:
+        # cost factor changed since this hash was made, swap it while we have the password
+        await execute_with_row_count(
+            connection,
+            "UPDATE users SET password = %s WHERE id = %s AND password = %s",
+            (new_hash, user.id, user.hashed_password),
+        )
     return user
 
 
+def hash_password(password: str) -> str:
+    """
+    Hashes in the password pool for sync endpoints, a full pool is a 503.
+    """
+    try:
+        return password_hasher.hash_blocking(password)
+    except HashingBusy:
+        raise _hashing_busy()
+
+
+def _hashing_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server is busy, please try again shortly",
+        headers={"Retry-After": "1"},
+    )
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + (expires_delta or timedelta(minutes=15))
-    to_encode.update({"exp": expire})
+    expire = datetime.now(timezone.utc) + (expires_delta or ACCESS_TOKEN_LIFETIME)
+    # sub-second iat, so a token issued right after a logout isn't caught by its cutoff
+    to_encode.update({"exp": expire, "iat": time.time()})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
 
 # ==== Dependency for protection endpoints ====
-async def get_current_user(
-    token: str = Depends(oauth2_scheme), connection=Depends(get_db)
-) -> User:
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+    """
+    Verifies the token in-process, the user id and email travel as claims
+    ("uid", "sub") so no database round trip is needed.
+    """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-
-        if payload is None:
+    claims = token_cache.get(token)
+    if claims is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
             raise credentials_exception
 
+        user_id = payload.get("uid")
         username: str | None = payload.get("sub")
-        if username is None:
+        issued_at = payload.get("iat")
+        if not isinstance(user_id, int) or username is None or issued_at is None:
             raise credentials_exception
-        token_data = TokenData(username=username)
 
-        if token_data.username is None:
-            raise credentials_exception
+        claims = (User(id=user_id, username=username), float(issued_at), float(payload["exp"]))
+        token_cache.set(token, claims)
 
-        user = get_user(username=token_data.username, connection=connection)
-    except JWTError:
+    user, issued_at, expires_at = claims
+    if expires_at <= time.time():
         raise credentials_exception
 
-    if user is None:
+    await revocations.refresh_if_stale()
+    if revocations.is_revoked(user.id, issued_at):
         raise credentials_exception
 
     return user
@@ -0,0 +1,178 @@
+import csv
+import io
+import json
+from typing import Iterator
+
+from db import iter_batches
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+BATCH_SIZE = 5000
+
+# column -> parquet type, numerics are cast to float8 so every format gets plain numbers
+EXPORT_COLUMNS = {
+    "id": "int64",
+    "external_ref": "string",
+    "title": "string",
+    "description": "string",
+    "status": "string",
+    "list_price": "float64",
+    "published_at": "timestamp",
+    "expires_at": "timestamp",
+    "property_type": "string",
+    "tenure": "string",
+    "rooms": "float64",
+    "living_area_sqm": "float64",
+    "plot_area_sqm": "float64",
+    "year_built": "int64",
+    "monthly_fee": "float64",
+    "energy_class": "string",
+    "street_address": "string",
+    "postal_code": "string",
+    "city": "string",
+    "municipality": "string",
+    "county": "string",
+    "country": "string",
+    "latitude": "float64",
+    "longitude": "float64",
+    "created_at": "timestamp",
+    "updated_at": "timestamp",
+}
+
+EXPORT_QUERY = """
+    SELECT l.id,
+           l.external_ref,
+           l.title,
+           l.description,
+           s.status,
+           l.list_price::float8,
+           l.published_at,
+           l.expires_at,
+           s.property_type,
+           s.tenure,
+           p.rooms::float8,
+           p.living_area_sqm::float8,
+           p.plot_area_sqm::float8,
+           p.year_built,
+           p.monthly_fee::float8,
+           p.energy_class,
+           loc.street_address,
+           loc.postal_code,
+           loc.city,
+           loc.municipality,
+           loc.county,
+           loc.country,
+           loc.latitude::float8,
+           loc.longitude::float8,
+           l.created_at,
+           l.updated_at
+    FROM listings l
+    JOIN listing_search s ON l.id = s.id
+    JOIN properties p ON s.property_id = p.id
+    JOIN locations loc ON p.location_id = loc.id
+    ORDER BY l.id
+"""
+
+
+class _ChunkSink(io.RawIOBase):
+    """
+    Write-only file that hands out what was written since the last drain(),
+    while tell() keeps counting from the start as the parquet footer needs.
+    """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _csv_chunks(batches) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue().encode()
+    for _, rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue().encode()
+
+
+def _ndjson_chunks(batches) -> Iterator[bytes]:
+    columns = list(EXPORT_COLUMNS)
+    for _, rows in batches:
+        yield "".join(
+            json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + "\n"
+            for row in rows
+        ).encode()
+
+
+def _parquet_chunks(batches) -> Iterator[bytes]:
+    # optional dependency, only needed for this format
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+        "string": pa.string(),
+        "timestamp": pa.timestamp("us", tz="UTC"),
+    }
+    schema = pa.schema([(name, types[kind]) for name, kind in EXPORT_COLUMNS.items()])
+    sink = _ChunkSink()
+    # one row group per batch, written out as soon as it is full
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for _, rows in batches:
+            columns = list(zip(*rows))
+            writer.write_batch(
+                pa.record_batch(
+                    [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                    schema=schema,
+                )
+            )
+            yield sink.drain()
+    yield sink.drain()
+
+
+def export_listings(
+    connection, format: str, batch_size: int = BATCH_SIZE, stats: dict | None = None
+) -> Iterator[bytes]:
+    """
+    Streams every listing with its property and location as CSV, NDJSON or
+    Parquet, reading batch_size rows at a time from a server-side cursor.
+    stats, when given, is kept up to date with the number of rows written.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+
+    def batches():
+        for columns, rows in iter_batches(
+            connection, EXPORT_QUERY, batch_size=batch_size, name="listing_export"
+        ):
+            yield columns, rows
+            if stats is not None:
+                stats["rows"] = stats.get("rows", 0) + len(rows)
+
+    writers = {"csv": _csv_chunks, "ndjson": _ndjson_chunks, "parquet": _parquet_chunks}
+    for chunk in writers[format](batches()):
+        if chunk:
+            yield chunk
@@ -0,0 +1,451 @@
+import csv
+import io
+import json
+import tempfile
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import BinaryIO, Iterator, List, Optional
+
+from psycopg2.extras import RealDictCursor
+from saved_search_matching import match_saved_searches
+
+FORMATS = ("csv", "ndjson")
+
+# staged in memory up to this size, then spilled to a temporary file
+SPOOL_BYTES = 8 * 1024 * 1024
+
+# feed column -> (type, required, max length). Lookups are given by name
+IMPORT_COLUMNS = {
+    "external_ref": (str, True, None),
+    "agent_id": (int, True, None),
+    "title": (str, True, 255),
+    "description": (str, False, None),
+    "status": (str, True, 100),
+    "list_price": (Decimal, False, None),
+    "price_type_id": (int, False, None),
+    "published_at": (datetime, False, None),
+    "expires_at": (datetime, False, None),
+    "property_type": (str, True, 100),
+    "tenure": (str, True, 100),
+    "year_built": (int, False, None),
+    "living_area_sqm": (Decimal, False, None),
+    "additional_area_sqm": (Decimal, False, None),
+    "plot_area_sqm": (Decimal, False, None),
+    "rooms": (Decimal, False, None),
+    "floor": (int, False, None),
+    "monthly_fee": (Decimal, False, None),
+    "energy_class": (str, False, 50),
+    "street_address": (str, True, 255),
+    "postal_code": (str, True, 32),
+    "city": (str, True, 100),
+    "municipality": (str, False, 100),
+    "county": (str, False, 100),
+    "country": (str, True, 100),
+    "latitude": (Decimal, False, None),
+    "longitude": (Decimal, False, None),
+}
+
+_STAGING_TABLE = """
+    CREATE TEMP TABLE listing_import (
+        line                INTEGER NOT NULL,
+        external_ref        TEXT NOT NULL,
+        agent_id            INTEGER NOT NULL,
+        title               TEXT NOT NULL,
+        description         TEXT,
+        status              TEXT NOT NULL,
+        list_price          NUMERIC,
+        price_type_id       INTEGER,
+        published_at        TIMESTAMPTZ,
+        expires_at          TIMESTAMPTZ,
+        property_type       TEXT NOT NULL,
+        tenure              TEXT NOT NULL,
+        year_built          INTEGER,
+        living_area_sqm     NUMERIC,
+        additional_area_sqm NUMERIC,
+        plot_area_sqm       NUMERIC,
+        rooms               NUMERIC,
+        floor               INTEGER,
+        monthly_fee         NUMERIC,
+        energy_class        TEXT,
+        street_address      TEXT NOT NULL,
+        postal_code         TEXT NOT NULL,
+        city                TEXT NOT NULL,
+        municipality        TEXT,
+        county              TEXT,
+        country             TEXT NOT NULL,
+        latitude            NUMERIC,
+        longitude           NUMERIC,
+        status_id           INTEGER,
+        property_type_id    INTEGER,
+        tenure_id           INTEGER,
+        listing_id          INTEGER,
+        property_id         INTEGER,
+        location_id         INTEGER,
+        new_listing         BOOLEAN NOT NULL DEFAULT FALSE,
+        new_property        BOOLEAN NOT NULL DEFAULT FALSE,
+        error               TEXT
+    ) ON COMMIT DROP
+"""
+
+# flags rows that can't be written, first error wins
+_VALIDATE_QUERIES = (
+    """
+        UPDATE listing_import i
+        SET error = 'external_ref repeated on line ' || later.line
+        FROM (SELECT external_ref, MAX(line) AS line FROM listing_import GROUP BY 1) later
+        WHERE later.external_ref = i.external_ref AND later.line > i.line
+    """,
+    """
+        UPDATE listing_import i SET status_id = ls.id
+        FROM listing_status ls WHERE lower(ls.name) = lower(i.status)
+    """,
+    """
+        UPDATE listing_import i SET property_type_id = pt.id
+        FROM property_types pt WHERE lower(pt.name) = lower(i.property_type)
+    """,
+    """
+        UPDATE listing_import i SET tenure_id = t.id
+        FROM tenures t WHERE lower(t.name) = lower(i.tenure)
+    """,
+    """
+        UPDATE listing_import
+        SET error = CASE
+            WHEN status_id IS NULL THEN 'unknown status ' || status
+            WHEN property_type_id IS NULL THEN 'unknown property_type ' || property_type
+            ELSE 'unknown tenure ' || tenure
+        END
+        WHERE error IS NULL
+          AND (status_id IS NULL OR property_type_id IS NULL OR tenure_id IS NULL)
+    """,
+    """
+        UPDATE listing_import i SET error = 'unknown agent_id ' || i.agent_id
+        WHERE i.error IS NULL AND NOT EXISTS (SELECT 1 FROM agents a WHERE a.id = i.agent_id)
+    """,
+    """
+        UPDATE listing_import i SET error = 'unknown price_type_id ' || i.price_type_id
+        WHERE i.error IS NULL
+          AND i.price_type_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM price_types pt WHERE pt.id = i.price_type_id)
+    """,
+)
+
+# existing listings by external_ref, with the property and location behind them.
+# Everything new gets its id up front so the inserts below can link rows by id
+_RESOLVE_QUERIES = (
+    """
+        UPDATE listing_import i
+        SET listing_id = l.id, property_id = p.id, location_id = p.location_id
+        FROM listings l
+        LEFT JOIN LATERAL (
+            SELECT p.id, p.location_id
+            FROM listing_properties lp
+            JOIN properties p ON lp.property_id = p.id
+            WHERE lp.listing_id = l.id
+            ORDER BY p.id
+            LIMIT 1
+        ) p ON TRUE
+        WHERE l.external_ref = i.external_ref AND i.error IS NULL
+    """,
+    """
+        UPDATE listing_import
+        SET new_listing = listing_id IS NULL,
+            new_property = property_id IS NULL,
+            listing_id = COALESCE(listing_id, nextval(pg_get_serial_sequence('listings', 'id'))),
+            property_id = COALESCE(property_id, nextval(pg_get_serial_sequence('properties', 'id'))),
+            location_id = COALESCE(location_id, nextval(pg_get_serial_sequence('locations', 'id')))
+        WHERE error IS NULL
+    """,
+)
+
+_INSERT_QUERIES = (
+    """
+        INSERT INTO locations (
+            id, street_address, postal_code, city, municipality, county, country,
+            latitude, longitude
+        ) OVERRIDING SYSTEM VALUE
+        SELECT location_id, street_address, postal_code, city, municipality, county,
+               country, latitude, longitude
+        FROM listing_import
+        WHERE error IS NULL AND new_property
+    """,
+    """
+        INSERT INTO properties (
+            id, location_id, property_type_id, tenure_id, year_built, living_area_sqm,
+            additional_area_sqm, plot_area_sqm, rooms, floor, monthly_fee, energy_class
+        ) OVERRIDING SYSTEM VALUE
+        SELECT property_id, location_id, property_type_id, tenure_id, year_built,
+               living_area_sqm, additional_area_sqm, plot_area_sqm, rooms, floor,
+               monthly_fee, energy_class
+        FROM listing_import
+        WHERE error IS NULL AND new_property
+    """,
+    """
+        INSERT INTO listings (
+            id, agent_id, title, description, status_id, list_price, price_type_id,
+            published_at, expires_at, external_ref
+        ) OVERRIDING SYSTEM VALUE
+        SELECT listing_id, agent_id, title, description, status_id, list_price,
+               price_type_id, published_at, expires_at, external_ref
+        FROM listing_import
+        WHERE error IS NULL AND new_listing
+    """,
+    """
+        INSERT INTO listing_properties (property_id, listing_id)
+        SELECT property_id, listing_id
+        FROM listing_import
+        WHERE error IS NULL AND new_property
+        ON CONFLICT DO NOTHING
+    """,
+    """
+        INSERT INTO listing_agents (agent_id, listing_id)
+        SELECT agent_id, listing_id
+        FROM listing_import
+        WHERE error IS NULL AND new_listing
+        ON CONFLICT DO NOTHING
+    """,
+)
+
+# existing rows are only written when a value differs, so unchanged listings keep
+# their updated_at (and ETag). Each returns the listing ids it touched
+_UPDATE_QUERIES = (
+    """
+        UPDATE locations loc
+        SET street_address = i.street_address,
+            postal_code = i.postal_code,
+            city = i.city,
+            municipality = i.municipality,
+            county = i.county,
+            country = i.country,
+            latitude = i.latitude,
+            longitude = i.longitude,
+            updated_at = NOW()
+        FROM listing_import i
+        WHERE loc.id = i.location_id
+          AND i.error IS NULL
+          AND NOT i.new_property
+          AND (loc.street_address, loc.postal_code, loc.city, loc.municipality,
+               loc.county, loc.country, loc.latitude, loc.longitude)
+              IS DISTINCT FROM
+              (i.street_address, i.postal_code, i.city, i.municipality,
+               i.county, i.country, i.latitude, i.longitude)
+        RETURNING i.listing_id
+    """,
+    """
+        UPDATE properties p
+        SET property_type_id = i.property_type_id,
+            tenure_id = i.tenure_id,
+            year_built = i.year_built,
+            living_area_sqm = i.living_area_sqm,
+            additional_area_sqm = i.additional_area_sqm,
+            plot_area_sqm = i.plot_area_sqm,
+            rooms = i.rooms,
+            floor = i.floor,
+            monthly_fee = i.monthly_fee,
+            energy_class = i.energy_class,
+            updated_at = NOW()
+        FROM listing_import i
+        WHERE p.id = i.property_id
+          AND i.error IS NULL
+          AND NOT i.new_property
+          AND (p.property_type_id, p.tenure_id, p.year_built, p.living_area_sqm,
+               p.additional_area_sqm, p.plot_area_sqm, p.rooms, p.floor,
+               p.monthly_fee, p.energy_class)
+              IS DISTINCT FROM
+              (i.property_type_id, i.tenure_id, i.year_built, i.living_area_sqm,
+               i.additional_area_sqm, i.plot_area_sqm, i.rooms, i.floor,
+               i.monthly_fee, i.energy_class)
+        RETURNING i.listing_id
+    """,
+    """
+        UPDATE listings l
+        SET agent_id = i.agent_id,
+            title = i.title,
+            description = i.description,
+            status_id = i.status_id,
+            list_price = i.list_price,
+            price_type_id = i.price_type_id,
+            published_at = i.published_at,
+            expires_at = i.expires_at,
+            updated_at = NOW()
+        FROM listing_import i
+        WHERE l.id = i.listing_id
+          AND i.error IS NULL
+          AND NOT i.new_listing
+          AND (l.agent_id, l.title, l.description, l.status_id, l.list_price,
+               l.price_type_id, l.published_at, l.expires_at)
+              IS DISTINCT FROM
+              (i.agent_id, i.title, i.description, i.status_id, i.list_price,
+               i.price_type_id, i.published_at, i.expires_at)
+        RETURNING l.id AS listing_id
+    """,
+)
+
+_ANALYZE_QUERY = """
+    ANALYZE locations, properties, listings, listing_properties, listing_agents, listing_search
+"""
+
+
+_TYPE_NAMES = {int: "integer", Decimal: "number", datetime: "ISO 8601 timestamp"}
+
+# the staging and target columns are INTEGER, and NUMERIC allows at most 131072
+# digits before the decimal point. Anything outside would fail the whole COPY
+_INTEGER_RANGE = (-(2**31), 2**31 - 1)
+_NUMERIC_MAX_DIGITS = 131072
+
+
+class RowError(ValueError):
+    pass
+
+
+def _convert(name: str, value) -> object:
+    kind, required, max_length = IMPORT_COLUMNS[name]
+    if isinstance(value, str):
+        value = value.strip()
+    if value is None or value == "":
+        if required:
+            raise RowError(f"{name} is required")
+        return None
+    try:
+        if kind is str:
+            value = str(value)
+            if max_length is not None and len(value) > max_length:
+                raise RowError(f"{name} is longer than {max_length} characters")
+            return value
+        if kind is int:
+            if isinstance(value, float) or (isinstance(value, str) and not value.lstrip("-").isdigit()):
+                raise ValueError
+            number = int(value)
+            if not _INTEGER_RANGE[0] <= number <= _INTEGER_RANGE[1]:
+                raise RowError(f"{name} is out of range")
+            return number
+        if kind is Decimal:
+            number = Decimal(str(value))
+            if not number.is_finite():
+                raise ValueError
+            if number and number.adjusted() >= _NUMERIC_MAX_DIGITS:
+                raise RowError(f"{name} is out of range")
+            return number
+        if kind is datetime:
+            return datetime.fromisoformat(str(value))
+    except RowError:
+        raise
+    except (ValueError, InvalidOperation, TypeError):
+        raise RowError(f"{name} is not a valid {_TYPE_NAMES[kind]}")
+    return value
+
+
+def read_rows(stream: BinaryIO, format: str) -> Iterator[tuple[int, Optional[dict], Optional[str]]]:
+    """
+    Yields (line, raw row, parse error) from a CSV (with header) or NDJSON feed.
+    """
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    if format == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line_number, line in enumerate(text, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield line_number, None, "not valid JSON"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, "expected a JSON object"
+            continue
+        yield line_number, row, None
+
+
+def import_listings(connection, stream: BinaryIO, format: str) -> dict:
+    """
+    Upserts a feed of listings keyed on external_ref. Rows are validated and
+    COPYed into a temporary staging table, then written with one set-based
+    statement per table inside a single transaction. Rows that fail are reported
+    with their line and skipped, the rest of the batch is still written.
+    """
+    if format not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+
+    errors: List[dict] = []
+    received = 0
+    columns = ["line", *IMPORT_COLUMNS]
+
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES, mode="w+", newline="") as staged:
+        writer = csv.writer(staged)
+        for line, row, error in read_rows(stream, format):
+            received += 1
+            external_ref = row.get("external_ref") if row else None
+            if error is None:
+                try:
+                    values = [_convert(name, row.get(name)) for name in IMPORT_COLUMNS]
+                except RowError as exc:
+                    error = str(exc)
+            if error is not None:
+                errors.append({"line": line, "external_ref": external_ref, "error": error})
+                continue
+            writer.writerow([line, *values])
+        staged.seek(0)
+
+        with connection:
+            with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                # one import at a time, new ids are handed out before the rows exist
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext('listing_import'))")
+                cursor.execute("SET LOCAL hemnet.defer_listing_search = 'on'")
+                cursor.execute(_STAGING_TABLE)
+                cursor.copy_expert(
+                    f"COPY listing_import ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+                    staged,
+                )
+
+                for query in (*_VALIDATE_QUERIES, *_RESOLVE_QUERIES, *_INSERT_QUERIES):
+                    cursor.execute(query)
+
+                updated_ids = set()
+                for query in _UPDATE_QUERIES:
+                    cursor.execute(query)
+                    updated_ids.update(row["listing_id"] for row in cursor.fetchall())
+
+                cursor.execute(
+                    """
+                        SELECT line, external_ref, error, listing_id, new_listing
+                        FROM listing_import
+                        ORDER BY line
+                    """
+                )
+                staged_rows = cursor.fetchall()
+                created_ids = [
+                    row["listing_id"]
+                    for row in staged_rows
+                    if row["error"] is None and row["new_listing"]
+                ]
+                matched = sum(
+                    1 for row in staged_rows if row["error"] is None and not row["new_listing"]
+                )
+                errors.extend(
+                    {"line": row["line"], "external_ref": row["external_ref"], "error": row["error"]}
+                    for row in staged_rows
+                    if row["error"] is not None
+                )
+
+                listing_ids = sorted({*created_ids, *updated_ids})
+                cursor.execute("SELECT refresh_listing_search(%s)", (listing_ids,))
+                match_saved_searches(cursor, created_ids, "created")
+                match_saved_searches(cursor, sorted(updated_ids), "updated")
+
+    with connection:
+        with connection.cursor() as cursor:
+            cursor.execute(_ANALYZE_QUERY)
+
+    errors.sort(key=lambda error: error["line"])
+    return {
+        "received": received,
+        "created": len(created_ids),
+        "updated": len(updated_ids),
+        "unchanged": matched - len(updated_ids),
+        "failed": len(errors),
+        "errors": errors,
+        "listing_ids": listing_ids,
+    }
@@ -0,0 +1,69 @@
+from typing import Iterable, List, Optional
+
+from db import fetch_all
+from db_setup import pooled_connection
+
+LOOKUP_TABLES = (
+    "property_types",
+    "listing_status",
+    "tenures",
+    "price_types",
+    "media_types",
+    "open_house_types",
+)
+
+
+class LookupRegistry:
+    """
+    In-process copy of the small id/name lookup tables. They only change through
+    migrations, so they are loaded at startup and again on an explicit reload().
+    Name lookups are case insensitive.
+
+    Every worker process holds its own copy, like the autocomplete index.
+    """
+
+    def __init__(self):
+        # table -> (id -> name, casefolded name -> id), replaced as a whole on load
+        self._tables: dict[str, tuple[dict[int, str], dict[str, int]]] = {}
+
+    def load(self, connection):
+        tables = {}
+        for table in LOOKUP_TABLES:
+            rows = fetch_all(connection, f"SELECT id, name FROM {table} ORDER BY id")
+            by_id = {row["id"]: row["name"] for row in rows}
+            by_name = {name.casefold(): id for id, name in by_id.items()}
+            tables[table] = (by_id, by_name)
+        self._tables = tables
+
+    def name(self, table: str, id: Optional[int]) -> Optional[str]:
+        return self._tables[table][0].get(id)
+
+    def id(self, table: str, name: str) -> Optional[int]:
+        return self._tables[table][1].get(name.casefold())
+
+    def ids(self, table: str, names: Iterable[str]) -> List[int]:
+        """
+        Ids of the given names, unknown names are left out.
+        """
+        by_name = self._tables[table][1]
+        return [by_name[key] for key in (n.casefold() for n in names) if key in by_name]
+
+    def names(self, table: str) -> List[str]:
+        return list(self._tables[table][0].values())
+
+    def name_rows(self, rows: Iterable[dict], table: str, id_key: str, name_key: str):
+        """
+        Replaces row[id_key] with row[name_key] = its name, in place.
+        """
+        by_id = self._tables[table][0]
+        for row in rows:
+            row[name_key] = by_id.get(row.pop(id_key))
+        return rows
+
+
+lookups = LookupRegistry()
+
+
+def load_lookups():
+    with pooled_connection() as connection:
+        lookups.load(connection)
@@ -0,0 +1,116 @@
+import argparse
+import time
+
+from db_setup import get_connection
+from digests import send_digests, DIGEST_WORKERS
+from listing_export import export_listings, FORMATS as EXPORT_FORMATS
+from listing_import import import_listings
+
+
+def rebuild_listing_search(_args):
+    """
+    Rebuilds the listing_search read model from the source tables,
+    e.g. after a restore or if a trigger was disabled.
+    """
+    connection = get_connection()
+    with connection, connection.cursor() as cursor:
+        cursor.execute("SELECT rebuild_listing_search()")
+        (count,) = cursor.fetchone()
+        cursor.execute("ANALYZE listing_search")
+    connection.close()
+    print(f"Rebuilt listing_search with {count} listings")
+
+
+def import_listing_feed(args):
+    """
+    Upserts a CSV or NDJSON feed of listings keyed on external_ref.
+    """
+    format = args.format or ("csv" if args.path.endswith(".csv") else "ndjson")
+    started = time.perf_counter()
+    connection = get_connection()
+    with open(args.path, "rb") as feed:
+        result = import_listings(connection, feed, format)
+    connection.close()
+    elapsed = time.perf_counter() - started
+
+    for error in result["errors"]:
+        print(f"line {error['line']} ({error['external_ref'] or '-'}): {error['error']}")
+    print(
+        f"Imported {result['received']} rows in {elapsed:.1f}s: {result['created']} created, "
+        f"{result['updated']} updated, {result['unchanged']} unchanged, {result['failed']} failed"
+    )
+
+
+def export_listing_catalogue(args):
+    """
+    Writes every listing to a CSV, NDJSON or Parquet file in constant memory.
+    """
+    format = args.format or args.path.rsplit(".", 1)[-1]
+    if format not in EXPORT_FORMATS:
+        raise SystemExit(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+
+    stats = {"rows": 0}
+    started = time.perf_counter()
+    connection = get_connection()
+    with open(args.path, "wb") as output:
+        for chunk in export_listings(connection, format, args.batch_size, stats):
+            output.write(chunk)
+    connection.close()
+    elapsed = time.perf_counter() - started
+    print(
+        f"Exported {stats['rows']} listings to {args.path} in {elapsed:.1f}s "
+        f"({stats['rows'] / max(elapsed, 1e-9):.0f} rows/s)"
+    )
+
+
+def send_saved_search_digests(args):
+    """
+    Mails the new matches of every saved search with send_email since its last digest.
+    """
+    started = time.perf_counter()
+    result = send_digests(args.workers)
+    elapsed = time.perf_counter() - started
+    if result is None:
+        raise SystemExit("Digests are already being sent by another process")
+    print(
+        f"Sent {result['users']} digests with {result['listings']} listings in {elapsed:.1f}s, "
+        f"{result['failed_users']} users failed and will be retried next run"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hemnet Clone maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = commands.add_parser(
+        "rebuild-listing-search", help="Rebuild the listing_search read model"
+    )
+    rebuild.set_defaults(handler=rebuild_listing_search)
+
+    feed = commands.add_parser(
+        "import-listings", help="Upsert listings from a CSV or NDJSON feed"
+    )
+    feed.add_argument("path")
+    feed.add_argument("--format", choices=["csv", "ndjson"])
+    feed.set_defaults(handler=import_listing_feed)
+
+    export = commands.add_parser(
+        "export-listings", help="Export every listing to CSV, NDJSON or Parquet"
+    )
+    export.add_argument("path")
+    export.add_argument("--format", choices=list(EXPORT_FORMATS))
+    export.add_argument("--batch-size", type=int, default=5000)
+    export.set_defaults(handler=export_listing_catalogue)
+
+    digests = commands.add_parser(
+        "send-digests", help="Mail saved search digests of newly matched listings"
+    )
+    digests.add_argument("--workers", type=int, default=DIGEST_WORKERS)
+    digests.set_defaults(handler=send_saved_search_digests)
+
+    args = parser.parse_args()
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import re
+from typing import NamedTuple
+
+
+class Statement(NamedTuple):
+    """
+    A hot query declared once at import time. db.fetch_*_prepared PREPAREs it under
+    its name the first time a pooled connection runs it and EXECUTEs it after that,
+    async_db.fetch_*_prepared leaves the same to psycopg's per connection cache.
+    """
+
+    name: str
+    sql: str
+
+    @property
+    def prepare_sql(self) -> str:
+        position = 0
+
+        def placeholder(match):
+            nonlocal position
+            if match.group() == "%%":
+                return "%"
+            position += 1
+            return f"${position}"
+
+        return f"PREPARE {self.name} AS {re.sub(r'%%|%s', placeholder, self.sql)}"
+
+    @property
+    def execute_sql(self) -> str:
+        count = len(re.findall(r"(?<!%)%s", self.sql.replace("%%", "")))
+        arguments = ", ".join(["%s"] * count)
+        return f"EXECUTE {self.name}({arguments})" if count else f"EXECUTE {self.name}"
+
+
+_statements: dict[str, Statement] = {}
+
+
+def statement(name: str, sql: str) -> Statement:
+    """
+    Registers a hot statement, sql uses positional %s placeholders only.
+    """
+    if not re.fullmatch(r"[a-z_][a-z0-9_]*", name):
+        raise ValueError(f"Invalid statement name {name!r}")
+    if "%(" in sql:
+        raise ValueError("Prepared statements take positional %s parameters")
+    registered = _statements.setdefault(name, Statement(name, sql))
+    if registered.sql != sql:
+        raise ValueError(f"Statement {name!r} is already registered with other SQL")
+    return registered
+
+
+def statements() -> list[Statement]:
+    return list(_statements.values())
@@ -0,0 +1,92 @@
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Iterable
+
+from psycopg import Error as AsyncDatabaseError
+from psycopg_pool import PoolTimeout as AsyncPoolTimeout
+from async_db import fetch_all as async_fetch_all
+from db import fetch_all
+from db_setup import pooled_connection, get_async_pool
+
+ACCESS_TOKEN_LIFETIME = timedelta(minutes=30)
+
+# how stale a worker's copy may get before it re-reads token_revocations
+REFRESH_SECONDS = 15
+
+_CUTOFFS_QUERY = """
+    SELECT user_id, revoked_before
+    FROM token_revocations
+    WHERE revoked_before > %s
+"""
+
+# run in the same transaction as the change that invalidates the tokens
+REVOKE_QUERY = """
+    INSERT INTO token_revocations (user_id, revoked_before)
+    VALUES (%s, %s)
+    ON CONFLICT (user_id) DO UPDATE
+    SET revoked_before = GREATEST(token_revocations.revoked_before, EXCLUDED.revoked_before)
+"""
+
+
+class RevocationList:
+    """
+    Per user cutoff, tokens issued before it are rejected (logout, password change).
+    Cutoffs older than the token lifetime are dropped since those tokens have
+    expired anyway, which keeps the list small enough to check on every request.
+
+    Every worker process holds its own copy and re-reads token_revocations at most
+    every REFRESH_SECONDS, so a revocation made by another worker applies within that.
+    """
+
+    def __init__(self):
+        self._cutoffs: dict[int, float] = {}
+        self._refreshed_at = 0.0
+
+    def load(self, connection):
+        self._replace(fetch_all(connection, _CUTOFFS_QUERY, (self._oldest(),)))
+
+    async def refresh_if_stale(self):
+        if time.monotonic() - self._refreshed_at < REFRESH_SECONDS:
+            return
+        # claimed up front so concurrent requests don't all refresh
+        self._refreshed_at = time.monotonic()
+        pool = await get_async_pool()
+        try:
+            async with pool.connection() as connection:
+                rows = await async_fetch_all(connection, _CUTOFFS_QUERY, (self._oldest(),))
+        except (AsyncDatabaseError, AsyncPoolTimeout):
+            # keep verifying against the copy we have, retry after REFRESH_SECONDS
+            return
+        self._replace(rows)
+
+    def record(self, user_id: int, revoked_before: datetime):
+        """
+        Applies a revocation locally once REVOKE_QUERY has been committed.
+        """
+        cutoff = revoked_before.timestamp()
+        if cutoff > self._cutoffs.get(user_id, 0):
+            self._cutoffs[user_id] = cutoff
+
+    def is_revoked(self, user_id: int, issued_at: float) -> bool:
+        return issued_at < self._cutoffs.get(user_id, 0)
+
+    def _oldest(self) -> datetime:
+        return datetime.now(timezone.utc) - ACCESS_TOKEN_LIFETIME
+
+    def _replace(self, rows: Iterable[dict]):
+        oldest = self._oldest().timestamp()
+        cutoffs = {row["user_id"]: row["revoked_before"].timestamp() for row in rows}
+        # keep local revocations that committed after the rows were read
+        for user_id, cutoff in self._cutoffs.items():
+            if cutoff > oldest and cutoff > cutoffs.get(user_id, 0):
+                cutoffs[user_id] = cutoff
+        self._cutoffs = cutoffs
+        self._refreshed_at = time.monotonic()
+
+
+revocations = RevocationList()
+
+
+def load_revocations():
+    with pooled_connection() as connection:
+        revocations.load(connection)
@@ -4,6 +4,7 @@ from .agents import router as agents_router
 from .listings import router as listings_router
 from .properties import router as properties_router
 from .token import router as token_router
+from .health import router as health_router
 
 all_routers = [
     users_router,
@@ -12,4 +13,5 @@ all_routers = [
     listings_router,
     properties_router,
     token_router,
+    health_router,
 ]
@@ -1,20 +1,26 @@
 from typing import Optional, List
-from fastapi import APIRouter, Depends, status, Response
+from fastapi import APIRouter, Depends, status, Request, Response, Query
 from psycopg2 import IntegrityError
-from db import fetch_all, fetch_one, execute_returning
+from db import fetch_all, fetch_one, execute_returning, iter_rows
 from helpers import (
     get_db,
     raise_if_not_found,
     handle_error,
     get_current_user,
+    not_modified,
+    parse_ids,
+    in_request_order,
 )
+from streaming import wants_stream, stream_items
 from schemas import (
     AgencyCreate,
     AgencyUpdate,
     AgencyCreateOut,
     AgencyUpdateOut,
     AgencyDetailOut,
+    AgencyBatchOut,
     AgenciesOut,
+    AgencyItem,
     User,
 )
 
@@ -31,8 +37,8 @@ router = APIRouter(
 
 @router.get("/", response_model=AgenciesOut)
 def list_agencies(
-    limit: Optional[int] = None,
-    offset: Optional[int] = None,
+    limit: Optional[int] = Query(default=None, ge=1),
+    offset: Optional[int] = Query(default=None, ge=0),
     connection=Depends(get_db),
 ):
     query = """
@@ -54,12 +60,48 @@ def list_agencies(
         query += " OFFSET %s"
         parameters.append(offset)
 
+    if wants_stream(limit):
+        return stream_items(iter_rows(connection, query, parameters), AgencyItem)
+
     rows = fetch_all(connection, query, parameters)
     return {"count": len(rows), "items": rows}
 
 
+# declared before /{agency_id} so "batch" isn't parsed as an id
+@router.get("/batch", response_model=AgencyBatchOut)
+def agencies_by_id(
+    ids: str = Query(description="Comma separated ids, e.g. 1,2,3"),
+    connection=Depends(get_db),
+):
+    query = """
+        SELECT id,
+               name,
+               org_number,
+               phone,
+               website
+        FROM agencies
+        WHERE id = ANY(%s)
+    """
+    agency_ids = parse_ids(ids)
+    return in_request_order(agency_ids, fetch_all(connection, query, (agency_ids,)))
+
+
 @router.get("/{agency_id}", response_model=AgencyDetailOut)
-def agencies_datail(agency_id: int, connection=Depends(get_db)):
+def agencies_datail(
+    agency_id: int,
+    request: Request,
+    response: Response,
+    connection=Depends(get_db),
+):
+    version = fetch_one(
+        connection,
+        "SELECT xmin::text AS version, updated_at AS last_modified FROM agencies WHERE id = %s",
+        (agency_id,),
+    )
+    cached = not_modified(request, response, version)
+    if cached is not None:
+        return cached
+
     query = """
         SELECT id,
                name,
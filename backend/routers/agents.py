@@ -1,20 +1,26 @@
 from typing import Optional, List
-from fastapi import APIRouter, Depends, status, Response
+from fastapi import APIRouter, Depends, status, Request, Response, Query
 from psycopg2 import IntegrityError
-from db import fetch_all, fetch_one, execute_returning, execute_with_row_count
+from db import fetch_all, fetch_one, execute_returning, iter_rows, unit_of_work
 from helpers import (
     get_db,
     raise_if_not_found,
     handle_error,
     get_current_user,
+    not_modified,
+    parse_ids,
+    in_request_order,
 )
+from streaming import wants_stream, stream_items
 from schemas import (
     AgentCreate,
     AgentUpdate,
     AgentCreateOut,
     AgentUpdateOut,
     AgentDetailOut,
+    AgentBatchOut,
     AgentsOut,
+    AgentListItem,
     AgentNameOut,
     User,
 )
@@ -32,8 +38,8 @@ router = APIRouter(
 
 @router.get("/", response_model=AgentsOut)
 def list_agents(
-    limit: Optional[int] = None,
-    offset: Optional[int] = None,
+    limit: Optional[int] = Query(default=None, ge=1),
+    offset: Optional[int] = Query(default=None, ge=0),
     connection=Depends(get_db),
 ):
     query = """
@@ -61,12 +67,64 @@ def list_agents(
         query += " OFFSET %s"
         parameters.append(offset)
 
+    if wants_stream(limit):
+        return stream_items(iter_rows(connection, query, parameters), AgentListItem)
+
     rows = fetch_all(connection, query, parameters)
     return {"count": len(rows), "items": rows}
 
 
+# declared before /{agent_id} so "batch" isn't parsed as an id
+@router.get("/batch", response_model=AgentBatchOut)
+def agents_by_id(
+    ids: str = Query(description="Comma separated ids, e.g. 1,2,3"),
+    connection=Depends(get_db),
+):
+    query = """
+        SELECT DISTINCT ON (a.id)
+               a.id,
+               u.first_name,
+               u.last_name,
+               u.email,
+               u.phone,
+               a.title,
+               a.license_number,
+               a.bio,
+               ag.name AS agency
+        FROM agents a
+        JOIN users u ON a.user_id = u.id
+        LEFT JOIN agent_agencies aa ON a.id = aa.agent_id
+        LEFT JOIN agencies ag ON aa.agency_id = ag.id
+        WHERE a.id = ANY(%s)
+        ORDER BY a.id
+    """
+    agent_ids = parse_ids(ids)
+    return in_request_order(agent_ids, fetch_all(connection, query, (agent_ids,)))
+
+
 @router.get("/{agent_id}", response_model=AgentDetailOut)
-def agent_detail(agent_id: int, connection=Depends(get_db)):
+def agent_detail(
+    agent_id: int,
+    request: Request,
+    response: Response,
+    connection=Depends(get_db),
+):
+    # agency link changes touch agents.updated_at, see migrations/005_last_modified_sources.sql
+    version_query = """
+        SELECT md5(string_agg(concat_ws(':', a.xmin, u.xmin, aa.xmin, ag.xmin), ',' ORDER BY ag.id))
+                   AS version,
+               MAX(GREATEST(a.updated_at, u.updated_at, ag.updated_at)) AS last_modified
+        FROM agents a
+        JOIN users u ON a.user_id = u.id
+        LEFT JOIN agent_agencies aa ON a.id = aa.agent_id
+        LEFT JOIN agencies ag ON aa.agency_id = ag.id
+        WHERE a.id = %s
+    """
+    version = fetch_one(connection, version_query, (agent_id,))
+    cached = not_modified(request, response, version)
+    if cached is not None:
+        return cached
+
     query = """
         SELECT a.id,
                u.first_name,
@@ -106,25 +164,24 @@ def create_agent(
         RETURNING id, user_id, title, license_number, bio, created_at
     """
     try:
-        row = execute_returning(
-            connection,
-            query,
-            (payload.user_id, payload.title, payload.license_number, payload.bio),
-        )
-
-        if row is not None and payload.agency_id is not None:
-            execute_with_row_count(
-                connection,
-                """agent_id: int,
-                    INSERT INTO agent_agencies (agency_id, agent_id)
-                    VALUES (%s, %s)
-                """,
-                (
-                    payload.agency_id,
-                    row["id"],
-                ),
+        with unit_of_work(connection) as work:
+            row = work.returning(
+                query,
+                (payload.user_id, payload.title, payload.license_number, payload.bio),
             )
 
+            if row is not None and payload.agency_id is not None:
+                work.row_count(
+                    """
+                        INSERT INTO agent_agencies (agency_id, agent_id)
+                        VALUES (%s, %s)
+                    """,
+                    (
+                        payload.agency_id,
+                        row["id"],
+                    ),
+                )
+
         return row
     except IntegrityError as exc:
         handle_error(exc, "Could not create agent")
@@ -153,32 +210,31 @@ def update_agent(
         RETURNING id, user_id, title, license_number, bio, created_at, updated_at
     """
     try:
-        row = execute_returning(
-            connection,
-            query,
-            (
-                payload.user_id,
-                payload.title,
-                payload.license_number,
-                payload.bio,
-                agent_id,
-            ),
-        )
-
-        if row is not None and payload.agency_id is not None:
-            execute_with_row_count(
-                connection,
-                """
-                    UPDATE agent_agencies 
-                    SET agency_id = %s 
-                    WHERE agent_id = %s 
-                """,
+        with unit_of_work(connection) as work:
+            row = work.returning(
+                query,
                 (
-                    payload.agency_id,
+                    payload.user_id,
+                    payload.title,
+                    payload.license_number,
+                    payload.bio,
                     agent_id,
                 ),
             )
 
+            if row is not None and payload.agency_id is not None:
+                work.row_count(
+                    """
+                        UPDATE agent_agencies
+                        SET agency_id = %s
+                        WHERE agent_id = %s
+                    """,
+                    (
+                        payload.agency_id,
+                        agent_id,
+                    ),
+                )
+
         return raise_if_not_found(row, "Saved search")
     except IntegrityError as exc:
         handle_error(exc, "Could not update agent")
@@ -199,15 +255,13 @@ def delete_agent(
     connection=Depends(get_db),
     _: User = Depends(get_current_user),
 ):
-    execute_returning(
-        connection, "DELETE FROM agent_agencies WHERE agent_id = %s", (agent_id,)
-    )
-
-    deleted = execute_returning(
-        connection,
-        "DELETE FROM agents WHERE id = %s RETURNING id",
-        (agent_id,),
-    )
+    with unit_of_work(connection) as work:
+        deleted = work.pipeline(
+            [
+                ("DELETE FROM agent_agencies WHERE agent_id = %s", (agent_id,)),
+                ("DELETE FROM agents WHERE id = %s RETURNING id", (agent_id,)),
+            ]
+        )
     raise_if_not_found(deleted, "Agent")
 
     return Response(status_code=status.HTTP_204_NO_CONTENT)
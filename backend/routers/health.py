@@ -0,0 +1,31 @@
+from fastapi import APIRouter
+from typing import Dict
+from db_setup import get_pool, get_async_pool
+from hashing import password_hasher
+from schemas import PoolStatsOut, HashingStatsOut
+
+
+router = APIRouter(
+    prefix="/health",
+    tags=["health"],
+)
+
+#########################################
+#               GET                     #
+#########################################
+
+
+@router.get("/db-pool", response_model=PoolStatsOut)
+def db_pool_stats():
+    return get_pool().stats()
+
+
+@router.get("/async-db-pool", response_model=Dict[str, int])
+async def async_db_pool_stats():
+    pool = await get_async_pool()
+    return pool.get_stats()
+
+
+@router.get("/password-hashing", response_model=HashingStatsOut)
+def password_hashing_stats():
+    return password_hasher.stats()
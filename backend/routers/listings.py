@@ -1,26 +1,72 @@
+import base64
+import binascii
+import json
+import math
+from itertools import combinations
+from contextlib import aclosing
 from typing import Optional, List
-from fastapi import APIRouter, Depends, status, Response, HTTPException
-from psycopg2 import IntegrityError
+from fastapi import (
+    APIRouter,
+    Depends,
+    status,
+    Request,
+    Response,
+    HTTPException,
+    Query,
+    UploadFile,
+)
+from fastapi.responses import StreamingResponse
+from psycopg2 import DataError, IntegrityError
 from psycopg2.extras import RealDictCursor
-from db import fetch_all, fetch_one, execute_returning
+from db import execute_returning, unit_of_work
+from async_db import (
+    fetch_all,
+    fetch_one,
+    fetch_all_prepared,
+    fetch_one_prepared,
+    iter_rows,
+)
+from autocomplete import autocomplete_index
+from cache import TTLCache
+from db_setup import pooled_connection
+from listing_export import export_listings, FORMATS as EXPORT_FORMATS
+from listing_import import import_listings, FORMATS as IMPORT_FORMATS
+from lookups import lookups
+from prepared import statement
+from saved_search_matching import match_saved_searches
+from streaming import wants_stream, stream_items_async
 from helpers import (
     get_db,
+    get_async_db,
     raise_if_not_found,
     handle_error,
     get_current_user,
+    to_prefix_tsquery,
+    not_modified,
+    parse_ids,
+    in_request_order,
 )
 from schemas import (
     ListingCreate,
     ListingMediaCreate,
+    ListingMediaOrder,
     OpenHouseCreate,
     ListingUpdate,
     User,
     ListingMutateOut,
     AutocompleteOut,
     ListingOut,
+    ListingItem,
+    ListingFilters,
+    ListingFacetsOut,
+    ListingClustersOut,
+    ListingImportOut,
     ListingDetailOut,
+    ListingDetailExpandedOut,
+    ListingBatchOut,
     ListingMediaOut,
     OpenHousesOut,
+    OpenHousesItem,
     OpenHouseOut,
     ListingMediaCreateOut,
     OpenHouseCreateOut,
@@ -32,31 +78,361 @@ router = APIRouter(
     tags=["listings"],
 )
 
-#########################################
-#               GET                     #
-#########################################
+# sort name -> (key expression, direction, key type). NULL keys are pushed last with a
+# sentinel, each column expression has a matching (expression, id) index on listing_search
+SORT_OPTIONS = {
+    "id": ("s.id", "ASC", "integer"),
+    "price_asc": ("COALESCE(s.list_price, 'Infinity'::numeric)", "ASC", "numeric"),
+    "price_desc": ("COALESCE(s.list_price, '-Infinity'::numeric)", "DESC", "numeric"),
+    "newest": ("COALESCE(s.published_at, '-infinity'::timestamptz)", "DESC", "timestamptz"),
+    "living_area_desc": (
+        "COALESCE(s.living_area_sqm, '-Infinity'::numeric)",
+        "DESC",
+        "numeric",
+    ),
+    "price_per_sqm_asc": (
+        "COALESCE(s.price_per_sqm, 'Infinity'::numeric)",
+        "ASC",
+        "numeric",
+    ),
+    # only available together with free_text_search
+    "relevance": ("ts_rank_cd(s.search_document, search_query)", "DESC", "real"),
+    # only available together with latitude/longitude. The same great-circle distance
+    # is returned as distance_km, point <-> point would compare raw degrees, where a
+    # degree of longitude is about half a degree of latitude this far north
+    "distance": ("haversine_km(s.geo, o.origin)", "ASC", "float8"),
+}
 
+# same radius as haversine_km in migrations/004_listing_search_geo.sql
+EARTH_RADIUS_KM = 6371.0088
 
-@router.get("/autocomplete", response_model=AutocompleteOut)
-def autocomplete_headings(search_term: str, connection=Depends(get_db)):
-    query = """
-        SELECT DISTINCT l.title
-        FROM listings l
-        JOIN listing_properties lp ON l.id = lp.listing_id
-        JOIN properties p ON lp.property_id = p.id
-        JOIN locations loc ON p.location_id = loc.id
-        WHERE l.title ILIKE %s OR loc.city ILIKE %s
-        ORDER BY l.title
-        LIMIT 10
+
+def _encode_cursor(sort: str, row) -> str:
+    payload = json.dumps([sort, row["sort_key"], row["id"]])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(sort: str, cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, sort_key, last_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+    if cursor_sort != sort or not isinstance(last_id, int):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor does not belong to this sort order",
+        )
+    return sort_key, last_id
+
+
+def _stream_listings(
+    connection, query: str, parameters: List, limit, sort: str, total: dict
+):
+    """
+    list_listings for large pages, rows are written out as they are read and
+    the next cursor comes from the last row written.
     """
+    last = {}
 
-    like_term = f"{search_term}%"
-    rows = fetch_all(connection, query, (like_term, like_term))
-    return {"count": len(rows), "items": rows}
+    async def rows():
+        emitted = 0
+        # closed right away on break, so the cursor is gone before the connection is returned
+        async with aclosing(iter_rows(connection, query, parameters, name="listings")) as cursor:
+            async for row in cursor:
+                if limit is not None and emitted == limit:
+                    last["more"] = True
+                    break
+                last["row"] = row
+                emitted += 1
+                yield row
 
+    def trailer():
+        if last.get("more"):
+            return {"next_cursor": _encode_cursor(sort, last["row"]), **total}
+        return {"next_cursor": None, **total}
 
-@router.get("/", response_model=ListingOut)
-def list_listings(
+    return stream_items_async(rows(), ListingItem, trailer)
+
+
+async def _listing_total(
+    connection, cache_key, joins: List[str], conditions: List[str], parameters: List
+):
+    """
+    Number of listings matching the filters, regardless of paging. Counting
+    stops after TOTAL_EXACT_LIMIT + 1 rows, beyond that the planner estimate
+    (never less than what was counted) is returned. Either is cached.
+    """
+    cached = totals_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    source = f"SELECT 1 FROM listing_search s {' '.join(joins)}"
+    if conditions:
+        source += " WHERE " + " AND ".join(conditions)
+
+    row = await fetch_one(
+        connection,
+        f"SELECT count(*) AS total FROM ({source} LIMIT %s) AS capped",
+        [*parameters, TOTAL_EXACT_LIMIT + 1],
+    )
+    if row["total"] <= TOTAL_EXACT_LIMIT:
+        result = {"total": row["total"], "total_is_exact": True}
+        totals_cache.set(cache_key, result, ttl=EXACT_TOTAL_TTL)
+        return result
+
+    plan = await fetch_one(connection, f"EXPLAIN (FORMAT JSON) {source}", parameters)
+    estimate = int(plan["QUERY PLAN"][0]["Plan"]["Plan Rows"])
+    result = {"total": max(estimate, row["total"]), "total_is_exact": False}
+    totals_cache.set(cache_key, result)
+    return result
+
+
+# filters that /listings/facets counts per value, each facet ignores its own filter
+FACET_FILTERS = ("status", "property_type", "price", "rooms")
+
+facets_cache = TTLCache(maxsize=1024, ttl=60)
+
+# /listings/clusters rolls listings up on a grid of GRID_CELLS_PER_TILE cells per map
+# tile width, from POINTS_ZOOM and up the individual listings are returned instead
+GRID_CELLS_PER_TILE = 8
+POINTS_ZOOM = 14
+MAX_POINTS = 2000
+
+clusters_cache = TTLCache(maxsize=1024, ttl=60)
+
+# list_listings counts matches exactly up to TOTAL_EXACT_LIMIT rows, above that the
+# planner's row estimate is used. Both are kept per filter signature, exact counts
+# for a shorter while since they are presented as exact
+TOTAL_EXACT_LIMIT = 1000
+EXACT_TOTAL_TTL = 30
+
+totals_cache = TTLCache(maxsize=1024, ttl=300)
+
+# first image by position, served by idx_listing_media_cover. Run in the same
+# transaction as every listing_media write so the list view thumbnail stays in sync
+COVER_QUERY = """
+    UPDATE listings l
+    SET cover_media_id = cover.id
+    FROM (
+        SELECT (
+            SELECT lm.id
+            FROM listing_media lm
+            WHERE lm.listing_id = %(listing_id)s AND lm.media_type_id = 1
+            ORDER BY lm.position NULLS LAST, lm.id
+            LIMIT 1
+        ) AS id
+    ) cover
+    WHERE l.id = %(listing_id)s
+      AND l.cover_media_id IS DISTINCT FROM cover.id
+"""
+
+
+# hot single listing reads, prepared once per pooled connection. LIMIT NULL and
+# OFFSET NULL mean no limit / offset, so one statement covers every page request
+LISTING_DETAIL_VERSION = statement("listing_detail_version", """
+    SELECT md5(string_agg(
+               concat_ws(':', l.xmin, p.xmin, loc.xmin, la.xmin, a.xmin, u.xmin, aa.xmin, ag.xmin),
+               ',' ORDER BY p.id, a.id, ag.id
+           )) AS version,
+           MAX(GREATEST(l.updated_at, p.updated_at, loc.updated_at,
+                        a.updated_at, u.updated_at, ag.updated_at)) AS last_modified
+    FROM listings l
+    JOIN listing_properties lp ON l.id = lp.listing_id
+    JOIN properties p ON lp.property_id = p.id
+    JOIN locations loc ON p.location_id = loc.id
+    JOIN listing_agents la ON l.id = la.listing_id
+    JOIN agents a ON la.agent_id = a.id
+    JOIN users u ON a.user_id = u.id
+    LEFT JOIN agent_agencies aa ON a.id = aa.agent_id
+    LEFT JOIN agencies ag ON aa.agency_id = ag.id
+    WHERE l.id = %s
+""")
+
+# shared by the single and batch listing reads, listings with several agents or
+# agencies come back once
+_LISTING_DETAIL_FROM = """l.id,
+           l.title,
+           l.description,
+           l.status_id,
+           l.list_price,
+           l.price_type_id,
+           l.published_at,
+           l.expires_at,
+           l.external_ref,
+           p.property_type_id,
+           p.tenure_id,
+           p.rooms,
+           p.living_area_sqm,
+           p.plot_area_sqm,
+           p.energy_class,
+           p.year_built,
+           loc.street_address,
+           loc.postal_code,
+           loc.city,
+           loc.municipality,
+           u.first_name || ' ' || u.last_name AS agent_name,
+           u.phone AS agent_phone,
+           ag.name AS agency
+    FROM listings l
+    JOIN listing_properties lp ON l.id = lp.listing_id
+    JOIN properties p ON lp.property_id = p.id
+    JOIN locations loc ON p.location_id = loc.id
+    JOIN listing_agents la ON l.id = la.listing_id
+    JOIN agents a ON la.agent_id = a.id
+    JOIN users u ON a.user_id = u.id
+    LEFT JOIN agent_agencies aa ON a.id = aa.agent_id
+    LEFT JOIN agencies ag ON aa.agency_id = ag.id"""
+
+LISTING_DETAIL = statement("listing_detail", f"""
+    SELECT {_LISTING_DETAIL_FROM}
+    WHERE l.id = %s
+    LIMIT 1
+""")
+
+# the batch read carries the image urls (cover first) so a list of cards needs no
+# per listing media requests
+LISTINGS_BY_ID = statement("listings_by_id", f"""
+    SELECT d.*,
+           cover.url AS image,
+           COALESCE(media.images, '{{}}') AS images
+    FROM (
+        SELECT DISTINCT ON (l.id) l.cover_media_id, {_LISTING_DETAIL_FROM}
+        WHERE l.id = ANY(%s)
+        ORDER BY l.id
+    ) AS d
+    LEFT JOIN listing_media cover ON d.cover_media_id = cover.id
+    LEFT JOIN LATERAL (
+        SELECT array_agg(
+                   lm.url
+                   ORDER BY lm.id = d.cover_media_id DESC, lm.position NULLS LAST, lm.id
+               ) AS images
+        FROM listing_media lm
+        WHERE lm.listing_id = d.id
+    ) AS media ON TRUE
+""")
+
+# ?expand= on the listing detail, each part is a lateral subquery with the nested
+# items, a version string and (for media) the newest updated_at. Open house writes
+# touch listings.updated_at since open_houses has no timestamp of its own
+EXPAND_OPTIONS = ("media", "open_houses", "agent")
+
+_EXPAND_LATERALS = {
+    "media": """
+    LEFT JOIN LATERAL (
+        SELECT COALESCE(json_agg(json_build_object(
+                   'id', lm.id,
+                   'media_type_id', lm.media_type_id,
+                   'url', lm.url,
+                   'caption', lm.caption,
+                   'position', lm.position,
+                   'updated_at', lm.updated_at
+               ) ORDER BY lm.position NULLS LAST, lm.id), '[]') AS items,
+               string_agg(lm.id || '.' || lm.xmin, ',' ORDER BY lm.id) AS version,
+               MAX(lm.updated_at) AS last_modified
+        FROM listing_media lm
+        WHERE lm.listing_id = d.id
+    ) AS media ON TRUE""",
+    "open_houses": """
+    LEFT JOIN LATERAL (
+        SELECT COALESCE(json_agg(json_build_object(
+                   'id', oh.id,
+                   'starts_at', oh.starts_at,
+                   'ends_at', oh.ends_at,
+                   'type_id', oh.type_id,
+                   'note', oh.note
+               ) ORDER BY oh.starts_at), '[]') AS items,
+               string_agg(oh.id || '.' || oh.xmin, ',' ORDER BY oh.id) AS version,
+               NULL::timestamptz AS last_modified
+        FROM open_houses oh
+        WHERE oh.listing_id = d.id
+    ) AS open_houses ON TRUE""",
+    # same agent as agent_name / agent_phone, covered by the listing detail version
+    "agent": """
+    LEFT JOIN LATERAL (
+        SELECT json_build_object(
+                   'id', a.id,
+                   'first_name', u.first_name,
+                   'last_name', u.last_name,
+                   'email', u.email,
+                   'phone', u.phone,
+                   'title', a.title,
+                   'license_number', a.license_number,
+                   'bio', a.bio,
+                   'agency', d.agency
+               ) AS items,
+               NULL::text AS version,
+               NULL::timestamptz AS last_modified
+        FROM agents a
+        JOIN users u ON a.user_id = u.id
+        WHERE a.id = d.agent_id
+    ) AS agent ON TRUE""",
+}
+
+
+def _expanded_detail_statement(parts: tuple):
+    """
+    The listing detail with its version and the expanded parts in one statement,
+    so the conditional GET check and the body cost a single round trip.
+    """
+    columns = "".join(f",\n           {part}.items AS {part}" for part in parts)
+    versions = "".join(f", {part}.version" for part in parts)
+    last_modified = "".join(f", {part}.last_modified" for part in parts)
+    laterals = "".join(_EXPAND_LATERALS[part] for part in parts)
+    return statement(f"listing_detail_{'_'.join(parts)}", f"""
+    SELECT d.*{columns},
+           md5(concat_ws('|', v.version{versions})) AS version,
+           GREATEST(v.last_modified{last_modified}) AS last_modified
+    FROM (
+        SELECT a.id AS agent_id, {_LISTING_DETAIL_FROM}
+        WHERE l.id = %s
+        LIMIT 1
+    ) AS d
+    CROSS JOIN ({LISTING_DETAIL_VERSION.sql}) AS v{laterals}
+""")
+
+
+LISTING_DETAIL_EXPANDED = {
+    frozenset(parts): _expanded_detail_statement(parts)
+    for size in range(1, len(EXPAND_OPTIONS) + 1)
+    for parts in combinations(EXPAND_OPTIONS, size)
+}
+
+# deleting media touches listings.updated_at so Last-Modified never goes back
+LISTING_MEDIA_VERSION = statement("listing_media_version", """
+    SELECT md5(concat_ws('|', l.xmin, string_agg(lm.id || '.' || lm.xmin, ',' ORDER BY lm.id)))
+               AS version,
+           GREATEST(l.updated_at, MAX(lm.updated_at)) AS last_modified
+    FROM listings l
+    LEFT JOIN listing_media lm ON l.id = lm.listing_id
+    WHERE l.id = %s
+    GROUP BY l.id
+""")
+
+LISTING_MEDIA = statement("listing_media", """
+    SELECT id, media_type_id, url, caption, position, updated_at
+    FROM listing_media
+    WHERE listing_id = %s
+    ORDER BY position NULLS LAST, id
+    LIMIT %s OFFSET %s
+""")
+
+LISTING_OPEN_HOUSES = statement("listing_open_houses", """
+    SELECT oh.id,
+           oh.starts_at,
+           oh.ends_at,
+           oh.type_id,
+           oh.note
+    FROM open_houses oh
+    WHERE oh.listing_id = %s
+    ORDER BY oh.starts_at
+    LIMIT %s OFFSET %s
+""")
+
+
+def listing_filters(
     free_text_search: Optional[str] = None,
     city: Optional[str] = None,
     min_price: Optional[float] = None,
@@ -64,169 +440,604 @@ def list_listings(
     min_rooms: Optional[float] = None,
     max_rooms: Optional[float] = None,
     property_type: Optional[str] = None,
-    limit: Optional[int] = None,
-    offset: Optional[int] = None,
     status_name: Optional[str] = None,
-    connection=Depends(get_db),
+    bbox: Optional[str] = Query(
+        default=None, description="min_longitude,min_latitude,max_longitude,max_latitude"
+    ),
+    latitude: Optional[float] = Query(default=None, ge=-90, le=90),
+    longitude: Optional[float] = Query(default=None, ge=-180, le=180),
+    radius_km: Optional[float] = Query(default=None, gt=0),
+) -> ListingFilters:
+    property_types = None
+    if property_type is not None:
+        property_types = [t.strip() for t in property_type.split(",") if t.strip()]
+
+    bounds = None
+    if bbox is not None:
+        try:
+            bounds = [float(value) for value in bbox.split(",")]
+        except ValueError:
+            bounds = None
+        if bounds is None or len(bounds) != 4:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="bbox must be min_longitude,min_latitude,max_longitude,max_latitude",
+            )
+    if (latitude is None) != (longitude is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="latitude and longitude must be given together",
+        )
+    if radius_km is not None and latitude is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="radius_km requires latitude and longitude",
+        )
+
+    return ListingFilters(
+        free_text_search=free_text_search,
+        city=city,
+        min_price=min_price,
+        max_price=max_price,
+        min_rooms=min_rooms,
+        max_rooms=max_rooms,
+        property_types=property_types,
+        status_name=status_name,
+        bbox=bounds,
+        latitude=latitude,
+        longitude=longitude,
+        radius_km=radius_km,
+    )
+
+
+def _filter_clauses(filters: ListingFilters):
+    """
+    Translates the search filters into extra FROM clauses (with their parameters)
+    and WHERE fragments keyed by filter name, so callers can combine or drop them.
+    """
+    joins: List[str] = []
+    parameters: List = []
+    clauses: dict[str, tuple[str, List]] = {}
+
+    search_query = (
+        to_prefix_tsquery(filters.free_text_search)
+        if filters.free_text_search
+        else None
+    )
+    if search_query is not None:
+        joins.append("CROSS JOIN to_tsquery('swedish', %s) AS search_query")
+        parameters.append(search_query)
+        clauses["text"] = ("s.search_document @@ search_query", [])
+    if filters.status_name:
+        status_id = lookups.id("listing_status", filters.status_name)
+        clauses["status"] = (
+            ("s.status_id = %s", [status_id]) if status_id is not None else ("FALSE", [])
+        )
+    if filters.city:
+        clauses["city"] = ("s.city ILIKE %s", [f"%{filters.city}%"])
+
+    price: List[str] = []
+    price_parameters: List = []
+    if filters.min_price is not None:
+        price.append("s.list_price >= %s::numeric")
+        price_parameters.append(filters.min_price)
+    if filters.max_price is not None:
+        price.append("s.list_price <= %s::numeric")
+        price_parameters.append(filters.max_price)
+    if price:
+        clauses["price"] = (" AND ".join(price), price_parameters)
+
+    rooms: List[str] = []
+    rooms_parameters: List = []
+    if filters.min_rooms is not None:
+        rooms.append("s.rooms >= %s::numeric")
+        rooms_parameters.append(filters.min_rooms)
+    if filters.max_rooms is not None:
+        rooms.append("s.rooms <= %s::numeric")
+        rooms_parameters.append(filters.max_rooms)
+    if rooms:
+        clauses["rooms"] = (" AND ".join(rooms), rooms_parameters)
+
+    if filters.property_types:
+        property_type_ids = lookups.ids("property_types", filters.property_types)
+        clauses["property_type"] = (
+            ("s.property_type_id = ANY(%s)", [property_type_ids])
+            if property_type_ids
+            else ("FALSE", [])
+        )
+
+    if filters.bbox is not None:
+        min_longitude, min_latitude, max_longitude, max_latitude = filters.bbox
+        clauses["bbox"] = (
+            "s.geo <@ box(point(%s, %s), point(%s, %s))",
+            [min_longitude, min_latitude, max_longitude, max_latitude],
+        )
+
+    if filters.latitude is not None:
+        joins.append("CROSS JOIN (SELECT point(%s, %s) AS origin) AS o")
+        parameters.extend([filters.longitude, filters.latitude])
+
+        if filters.radius_km is not None:
+            # the box lets the GiST index do the work, haversine trims its corners. It
+            # bounds the circle exactly: the widest longitude is reached off the origin's
+            # parallel, at asin(sin(r/R) / cos(lat)), not at r / (km per degree * cos(lat))
+            angle = filters.radius_km / EARTH_RADIUS_KM
+            delta_latitude = math.degrees(angle)
+            spread = math.sin(min(angle, math.pi / 2)) / max(
+                math.cos(math.radians(filters.latitude)), 1e-9
+            )
+            delta_longitude = math.degrees(math.asin(spread)) if spread < 1 else 180.0
+            clauses["radius"] = (
+                "s.geo <@ box(point(%s, %s), point(%s, %s))"
+                " AND haversine_km(s.geo, o.origin) <= %s",
+                [
+                    filters.longitude - delta_longitude,
+                    filters.latitude - delta_latitude,
+                    filters.longitude + delta_longitude,
+                    filters.latitude + delta_latitude,
+                    filters.radius_km,
+                ],
+            )
+
+    return joins, parameters, clauses
+
+
+def _price_histogram(min_price, max_price, buckets: int, counts) -> dict:
+    if min_price is None:
+        return {"min_price": None, "max_price": None, "buckets": []}
+
+    width = (max_price - min_price) / buckets
+    by_bucket = {item["bucket"]: item["count"] for item in counts}
+    return {
+        "min_price": min_price,
+        "max_price": max_price,
+        "buckets": [
+            {
+                "from_price": min_price + width * index,
+                "to_price": min_price + width * (index + 1),
+                "count": by_bucket.get(index + 1, 0),
+            }
+            for index in range(buckets)
+        ],
+    }
+
+
+#########################################
+#               GET                     #
+#########################################
+
+
+@router.get("/autocomplete", response_model=AutocompleteOut)
+async def autocomplete_headings(search_term: str):
+    titles = autocomplete_index.search(search_term)
+    return {"count": len(titles), "items": [{"title": title} for title in titles]}
+
+
+@router.get("/facets", response_model=ListingFacetsOut)
+async def listing_facets(
+    filters: ListingFilters = Depends(listing_filters),
+    price_buckets: int = Query(default=20, ge=1, le=100),
+    connection=Depends(get_async_db),
 ):
-    query = """
-        SELECT l.id,
-               l.title,
-               ls.name AS status,
-               l.list_price,
-               pt.name AS property_type,
-               p.rooms,
-               p.living_area_sqm,
-               loc.city,
-               lm.url AS image
-        FROM listings l
-        JOIN listing_status ls ON l.status_id = ls.id
-        JOIN listing_properties lp ON l.id = lp.listing_id
-        LEFT JOIN listing_media lm ON l.id = lm.listing_id 
-            AND lm.media_type_id = 1
-            AND lm.id = (
-                SELECT MIN(id) 
-                FROM listing_media 
-                WHERE listing_id = l.id AND media_type_id = 1
+    cache_key = (filters.model_dump_json(), price_buckets)
+    cached = facets_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    joins, join_parameters, clauses = _filter_clauses(filters)
+    # text and city narrow every facet, the others are turned into match flags so
+    # each facet can ignore its own filter while sharing one scan
+    flags = {name: clauses.pop(name, ("TRUE", [])) for name in FACET_FILTERS}
+
+    flag_columns: List[str] = []
+    parameters: List = []
+    for name, (sql, flag_parameters) in flags.items():
+        flag_columns.append(f"({sql}) AS match_{name}")
+        parameters.extend(flag_parameters)
+    parameters.extend(join_parameters)
+
+    where = ""
+    if clauses:
+        where = "WHERE " + " AND ".join(sql for sql, _ in clauses.values())
+        for _, clause_parameters in clauses.values():
+            parameters.extend(clause_parameters)
+
+    def matches(*names: str) -> str:
+        return " AND ".join(f"match_{name}" for name in names)
+
+    query = f"""
+        WITH base AS MATERIALIZED (
+            SELECT s.status,
+                   s.property_type,
+                   s.tenure,
+                   s.list_price,
+                   CASE
+                       WHEN s.rooms IS NULL THEN NULL
+                       WHEN s.rooms >= 5 THEN '5+'
+                       ELSE GREATEST(FLOOR(s.rooms), 1)::int::text
+                   END AS rooms_bucket,
+                   {", ".join(flag_columns)}
+            FROM listing_search s
+            {" ".join(joins)}
+            {where}
+        ),
+        priced AS (
+            SELECT list_price
+            FROM base
+            WHERE {matches("status", "property_type", "rooms")}
+              AND list_price IS NOT NULL
+        ),
+        bounds AS (
+            SELECT MIN(list_price) AS min_price, MAX(list_price) AS max_price FROM priced
+        )
+        SELECT
+            (SELECT COUNT(*) FROM base WHERE {matches(*FACET_FILTERS)}) AS total,
+            (SELECT COALESCE(json_agg(json_build_object('value', value, 'count', count)
+                                      ORDER BY count DESC, value), '[]')
+             FROM (SELECT property_type AS value, COUNT(*) AS count FROM base
+                   WHERE {matches("status", "price", "rooms")} GROUP BY 1) f
+            ) AS property_type,
+            (SELECT COALESCE(json_agg(json_build_object('value', value, 'count', count)
+                                      ORDER BY count DESC, value), '[]')
+             FROM (SELECT status AS value, COUNT(*) AS count FROM base
+                   WHERE {matches("property_type", "price", "rooms")} GROUP BY 1) f
+            ) AS status,
+            (SELECT COALESCE(json_agg(json_build_object('value', value, 'count', count)
+                                      ORDER BY count DESC, value), '[]')
+             FROM (SELECT tenure AS value, COUNT(*) AS count FROM base
+                   WHERE {matches(*FACET_FILTERS)} GROUP BY 1) f
+            ) AS tenure,
+            (SELECT COALESCE(json_agg(json_build_object('value', value, 'count', count)
+                                      ORDER BY value), '[]')
+             FROM (SELECT rooms_bucket AS value, COUNT(*) AS count FROM base
+                   WHERE {matches("status", "property_type", "price")}
+                     AND rooms_bucket IS NOT NULL
+                   GROUP BY 1) f
+            ) AS rooms,
+            (SELECT min_price FROM bounds) AS min_price,
+            (SELECT max_price FROM bounds) AS max_price,
+            (SELECT COALESCE(json_agg(json_build_object('bucket', bucket, 'count', count)), '[]')
+             FROM (SELECT CASE
+                              WHEN b.max_price = b.min_price THEN 1
+                              ELSE LEAST(width_bucket(pr.list_price, b.min_price, b.max_price, %s), %s)
+                          END AS bucket,
+                          COUNT(*) AS count
+                   FROM priced pr CROSS JOIN bounds b
+                   GROUP BY 1) f
+            ) AS price_histogram
+    """
+    parameters.extend([price_buckets, price_buckets])
+
+    row = await fetch_one(connection, query, parameters)
+    result = {
+        "total": row["total"],
+        "property_type": row["property_type"],
+        "status": row["status"],
+        "tenure": row["tenure"],
+        "rooms": row["rooms"],
+        "price": _price_histogram(
+            row["min_price"], row["max_price"], price_buckets, row["price_histogram"]
+        ),
+    }
+    facets_cache.set(cache_key, result)
+    return result
+
+
+@router.get("/clusters", response_model=ListingClustersOut)
+async def listing_clusters(
+    zoom: int = Query(ge=0, le=22),
+    filters: ListingFilters = Depends(listing_filters),
+    connection=Depends(get_async_db),
+):
+    if filters.bbox is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="bbox is required",
+        )
+
+    cell_size = None
+    if zoom < POINTS_ZOOM:
+        # snap the viewport outwards to whole cells, so clusters don't change shape
+        # while panning and nearby viewports share a cache entry
+        cell_size = 360 / (2**zoom * GRID_CELLS_PER_TILE)
+        min_longitude, min_latitude, max_longitude, max_latitude = filters.bbox
+        filters = filters.model_copy(
+            update={
+                "bbox": [
+                    math.floor(min_longitude / cell_size) * cell_size,
+                    math.floor(min_latitude / cell_size) * cell_size,
+                    math.ceil(max_longitude / cell_size) * cell_size,
+                    math.ceil(max_latitude / cell_size) * cell_size,
+                ]
+            }
+        )
+
+    cache_key = (filters.model_dump_json(), zoom)
+    cached = clusters_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    joins, parameters, clauses = _filter_clauses(filters)
+    conditions = [sql for sql, _ in clauses.values()]
+    for _, clause_parameters in clauses.values():
+        parameters.extend(clause_parameters)
+    where = " AND ".join(conditions)
+
+    if cell_size is None:
+        query = f"""
+            SELECT s.id, s.latitude, s.longitude, s.list_price, s.property_type
+            FROM listing_search s
+            {" ".join(joins)}
+            WHERE {where}
+            ORDER BY s.id
+            LIMIT %s
+        """
+        # one extra row tells us whether the viewport has more than MAX_POINTS
+        points = await fetch_all(connection, query, [*parameters, MAX_POINTS + 1])
+        truncated = len(points) > MAX_POINTS
+        total = {"total": len(points), "total_is_exact": True}
+        if truncated:
+            points = points[:MAX_POINTS]
+            total = await _listing_total(
+                connection, (filters.model_dump_json(), False), joins, conditions, parameters
             )
-        JOIN properties p ON lp.property_id = p.id
-        JOIN property_types pt ON p.property_type_id = pt.id
-        JOIN locations loc ON p.location_id = loc.id
+        result = {
+            "zoom": zoom,
+            "cell_size": None,
+            **total,
+            "truncated": truncated,
+            "clusters": [],
+            "points": points,
+        }
+    else:
+        query = f"""
+            SELECT COUNT(*) AS count,
+                   AVG(s.geo[1]) AS latitude,
+                   AVG(s.geo[0]) AS longitude,
+                   MIN(s.list_price) AS min_price,
+                   MAX(s.list_price) AS max_price
+            FROM listing_search s
+            {" ".join(joins)}
+            WHERE {where}
+            GROUP BY floor(s.geo[0] / %s), floor(s.geo[1] / %s)
+            ORDER BY count DESC
+        """
+        parameters.extend([cell_size, cell_size])
+        clusters = await fetch_all(connection, query, parameters)
+        result = {
+            "zoom": zoom,
+            "cell_size": cell_size,
+            "total": sum(cluster["count"] for cluster in clusters),
+            "total_is_exact": True,
+            "truncated": False,
+            "clusters": clusters,
+            "points": [],
+        }
+
+    clusters_cache.set(cache_key, result)
+    return result
+
+
+@router.get("/export", response_class=StreamingResponse)
+def export_listing_catalogue(
+    format: str = Query(default="csv", description="csv, ndjson or parquet"),
+    batch_size: int = Query(default=5000, ge=100, le=50000),
+    _: User = Depends(get_current_user),
+):
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"format must be one of {', '.join(EXPORT_FORMATS)}",
+        )
+
+    # the connection is borrowed by the body itself, it outlives the endpoint
+    def body():
+        with pooled_connection() as connection:
+            yield from export_listings(connection, format, batch_size)
+
+    return StreamingResponse(
+        body(),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="listings.{format}"'},
+    )
+
+
+@router.get("/batch", response_model=ListingBatchOut)
+async def listings_by_id(
+    ids: str = Query(description="Comma separated ids, e.g. 1,2,3"),
+    connection=Depends(get_async_db),
+):
+    listing_ids = parse_ids(ids)
+    rows = await fetch_all_prepared(connection, LISTINGS_BY_ID, (listing_ids,))
+    lookups.name_rows(rows, "listing_status", "status_id", "status")
+    lookups.name_rows(rows, "property_types", "property_type_id", "property_type")
+    lookups.name_rows(rows, "tenures", "tenure_id", "tenure")
+    return in_request_order(listing_ids, rows)
+
+
+@router.get("/", response_model=ListingOut)
+async def list_listings(
+    filters: ListingFilters = Depends(listing_filters),
+    limit: Optional[int] = Query(default=None, ge=1),
+    offset: Optional[int] = Query(default=None, ge=0),
+    sort: str = "id",
+    cursor: Optional[str] = None,
+    connection=Depends(get_async_db),
+):
+    if sort not in SORT_OPTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown sort, expected one of {', '.join(SORT_OPTIONS)}",
+        )
+    if cursor is not None and offset is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either cursor or offset, not both",
+        )
+    joins, parameters, clauses = _filter_clauses(filters)
+    if sort == "relevance" and "text" not in clauses:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Sorting by relevance requires free_text_search",
+        )
+    if sort == "distance":
+        if filters.latitude is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Sorting by distance requires latitude and longitude",
+            )
+        clauses["has_geo"] = ("s.geo IS NOT NULL", [])
+    sort_expression, direction, key_type = SORT_OPTIONS[sort]
+    # the distance sort key and distance_km are the same expression
+    distance = SORT_OPTIONS["distance"][0] if filters.latitude is not None else "NULL"
+
+    query = f"""
+        SELECT s.id,
+               s.title,
+               s.status,
+               s.list_price,
+               s.property_type,
+               s.rooms,
+               s.living_area_sqm,
+               s.city,
+               s.image,
+               s.latitude,
+               s.longitude,
+               {distance} AS distance_km,
+               ({sort_expression})::text AS sort_key
+        FROM listing_search s
+        {" ".join(joins)}
     """
     conditions: List[str] = []
-    parameters: List = []
+    for sql, clause_parameters in clauses.values():
+        conditions.append(sql)
+        parameters.extend(clause_parameters)
 
-    if free_text_search:
-        conditions.append("(l.title ILIKE %s OR loc.city ILIKE %s)")
-        search_term = f"{free_text_search}%"
-        parameters.append(search_term)
-        parameters.append(search_term)
-    if status_name:
-        conditions.append("ls.name = %s")
-        parameters.append(status_name)
-    if city:
-        conditions.append("loc.city ILIKE %s")
-        parameters.append(f"%{city}%")
-    if min_price is not None:
-        conditions.append("l.list_price >= %s")
-        parameters.append(min_price)
-    if max_price is not None:
-        conditions.append("l.list_price <= %s")
-        parameters.append(max_price)
-    if min_rooms is not None:
-        conditions.append("p.rooms >= %s")
-        parameters.append(min_rooms)
-    if max_rooms is not None:
-        conditions.append("p.rooms <= %s")
-        parameters.append(max_rooms)
-    if property_type is not None:
-        types = [t.strip() for t in property_type.split(",")]
-        placeholders = ", ".join(["%s"] * len(types))
-        conditions.append(f"pt.name IN ({placeholders})")
-        parameters.extend(types)
+    # the first page carries the total, cursor pages of the same search don't count again
+    total = {"total": None, "total_is_exact": None}
+    if cursor is None:
+        total = await _listing_total(
+            connection,
+            (filters.model_dump_json(), "has_geo" in clauses),
+            joins,
+            conditions,
+            parameters,
+        )
+
+    if cursor is not None:
+        sort_key, last_id = _decode_cursor(sort, cursor)
+        operator = ">" if direction == "ASC" else "<"
+        conditions.append(
+            f"({sort_expression}, s.id) {operator} (%s::{key_type}, %s)"
+        )
+        parameters.extend([sort_key, last_id])
 
     if conditions:
         query += " WHERE " + " AND ".join(conditions)
-    query += " ORDER BY l.id"
+    query += f" ORDER BY {sort_expression} {direction}, s.id {direction}"
 
     if limit is not None:
+        # one extra row tells us whether there is a next page
         query += " LIMIT %s"
-        parameters.append(limit)
+        parameters.append(limit + 1)
     if offset is not None:
         query += " OFFSET %s"
         parameters.append(offset)
 
-    rows = fetch_all(connection, query, parameters)
-    return {"count": len(rows), "items": rows}
+    if wants_stream(limit):
+        return _stream_listings(connection, query, parameters, limit, sort, total)
 
+    # every filter / sort combination is its own statement, psycopg keeps the most
+    # recently used ones prepared per connection (DB_PREPARED_MAX)
+    rows = await fetch_all(connection, query, parameters, prepare=True)
 
-@router.get("/{listing_id}", response_model=ListingDetailOut)
-def listing_detail(listing_id: int, connection=Depends(get_db)):
-    query = """
-        SELECT l.id,
-               l.title,
-               l.description,
-               ls.name AS status,
-               l.list_price,
-               l.price_type_id,
-               l.published_at,
-               l.expires_at,
-               l.external_ref,
-               pt.name AS property_type,
-               t.name AS tenure,
-               p.rooms,
-               p.living_area_sqm,
-               p.plot_area_sqm,
-               p.energy_class,
-               p.year_built,
-               loc.street_address,
-               loc.postal_code,
-               loc.city,
-               loc.municipality,
-               u.first_name || ' ' || u.last_name AS agent_name,
-               u.phone AS agent_phone,
-               ag.name AS agency
-        FROM listings l
-        JOIN listing_status ls ON l.status_id = ls.id
-        JOIN listing_properties lp ON l.id = lp.listing_id
-        JOIN properties p ON lp.property_id = p.id
-        JOIN property_types pt ON p.property_type_id = pt.id
-        JOIN tenures t ON p.tenure_id = t.id
-        JOIN locations loc ON p.location_id = loc.id
-        JOIN listing_agents la ON l.id = la.listing_id
-        JOIN agents a ON la.agent_id = a.id
-        JOIN users u ON a.user_id = u.id
-        LEFT JOIN agent_agencies aa ON a.id = aa.agent_id
-        LEFT JOIN agencies ag ON aa.agency_id = ag.id
-        WHERE l.id = %s
-        LIMIT 1
-    """
-    row = fetch_one(connection, query, (listing_id,))
-    return raise_if_not_found(row, "Listing")
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(sort, rows[-1])
 
+    return {"count": len(rows), "items": rows, "next_cursor": next_cursor, **total}
 
-@router.get("/{listing_id}/media", response_model=ListingMediaOut)
-def listing_media(
+
+@router.get(
+    "/{listing_id}",
+    response_model=ListingDetailExpandedOut,
+    response_model_exclude_unset=True,
+)
+async def listing_detail(
     listing_id: int,
-    limit: Optional[int] = None,
-    offset: Optional[int] = None,
-    connection=Depends(get_db),
+    request: Request,
+    response: Response,
+    expand: Optional[str] = Query(
+        default=None, description="Comma separated parts to embed: media, open_houses, agent"
+    ),
+    connection=Depends(get_async_db),
 ):
-    query = """
-        SELECT id, media_type_id, url, caption, position, updated_at
-        FROM listing_media
-        WHERE listing_id = %s
-        ORDER BY position NULLS LAST, id
-    """
+    parts = frozenset(part.strip() for part in (expand or "").split(",") if part.strip())
+    unknown = parts.difference(EXPAND_OPTIONS)
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown expand {', '.join(sorted(unknown))}, expected any of {', '.join(EXPAND_OPTIONS)}",
+        )
 
-    parameters: List = [listing_id]
+    if parts:
+        row = await fetch_one_prepared(
+            connection, LISTING_DETAIL_EXPANDED[parts], (listing_id, listing_id)
+        )
+        cached = not_modified(request, response, row)
+        if cached is not None:
+            return cached
+        raise_if_not_found(row, "Listing")
+        if "open_houses" in parts:
+            lookups.name_rows(row["open_houses"], "open_house_types", "type_id", "type")
+    else:
+        version = await fetch_one_prepared(connection, LISTING_DETAIL_VERSION, (listing_id,))
+        cached = not_modified(request, response, version)
+        if cached is not None:
+            return cached
+        row = raise_if_not_found(
+            await fetch_one_prepared(connection, LISTING_DETAIL, (listing_id,)), "Listing"
+        )
 
-    if limit is not None:
-        query += " LIMIT %s"
-        parameters.append(limit)
-    if offset is not None:
-        query += " OFFSET %s"
-        parameters.append(offset)
+    lookups.name_rows([row], "listing_status", "status_id", "status")
+    lookups.name_rows([row], "property_types", "property_type_id", "property_type")
+    lookups.name_rows([row], "tenures", "tenure_id", "tenure")
+    return row
+
+
+@router.get("/{listing_id}/media", response_model=ListingMediaOut)
+async def listing_media(
+    listing_id: int,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(default=None, ge=1),
+    offset: Optional[int] = Query(default=None, ge=0),
+    connection=Depends(get_async_db),
+):
+    version = await fetch_one_prepared(connection, LISTING_MEDIA_VERSION, (listing_id,))
+    cached = not_modified(request, response, version)
+    if cached is not None:
+        return cached
 
-    rows = fetch_all(connection, query, parameters)
+    rows = await fetch_all_prepared(connection, LISTING_MEDIA, (listing_id, limit, offset))
     return {"count": len(rows), "items": rows}
 
 
 @router.get("/open/houses", response_model=OpenHousesOut)
-def listing_open_houses(
-    limit: Optional[int] = None,
-    offset: Optional[int] = None,
-    connection=Depends(get_db),
+async def listing_open_houses(
+    limit: Optional[int] = Query(default=None, ge=1),
+    offset: Optional[int] = Query(default=None, ge=0),
+    connection=Depends(get_async_db),
 ):
     query = """
         SELECT oh.id,
                oh.listing_id,
                oh.starts_at,
                oh.ends_at,
-               oht.name AS type,
+               oh.type_id,
                oh.note
         FROM open_houses oh
-        JOIN open_house_types oht ON oh.type_id = oht.id
         ORDER BY oh.starts_at DESC
     """
 
@@ -239,39 +1050,31 @@ def listing_open_houses(
         query += " OFFSET %s"
         parameters.append(offset)
 
-    rows = fetch_all(connection, query, parameters)
+    if wants_stream(limit):
+
+        async def named_rows():
+            async with aclosing(iter_rows(connection, query, parameters)) as cursor:
+                async for row in cursor:
+                    yield lookups.name_rows([row], "open_house_types", "type_id", "type")[0]
+
+        return stream_items_async(named_rows(), OpenHousesItem)
+
+    rows = await fetch_all(connection, query, parameters)
+    lookups.name_rows(rows, "open_house_types", "type_id", "type")
     return {"count": len(rows), "items": rows}
 
 
 @router.get("/{listing_id}/open/houses", response_model=OpenHouseOut)
-def open_houses_for_listing(
+async def open_houses_for_listing(
     listing_id: int,
-    limit: Optional[int] = None,
-    offset: Optional[int] = None,
-    connection=Depends(get_db),
+    limit: Optional[int] = Query(default=None, ge=1),
+    offset: Optional[int] = Query(default=None, ge=0),
+    connection=Depends(get_async_db),
 ):
-    query = """
-        SELECT oh.id,
-               oh.starts_at,
-               oh.ends_at,
-               oht.name AS type,
-               oh.note
-        FROM open_houses oh
-        JOIN open_house_types oht ON oh.type_id = oht.id
-        WHERE oh.listing_id = %s
-        ORDER BY oh.starts_at
-    """
-
-    parameters: List = [listing_id]
-
-    if limit is not None:
-        query += " LIMIT %s"
-        parameters.append(limit)
-    if offset is not None:
-        query += " OFFSET %s"
-        parameters.append(offset)
-
-    rows = fetch_all(connection, query, parameters)
+    rows = await fetch_all_prepared(
+        connection, LISTING_OPEN_HOUSES, (listing_id, limit, offset)
+    )
+    lookups.name_rows(rows, "open_house_types", "type_id", "type")
     return {"count": len(rows), "items": rows}
 
 
@@ -319,8 +1122,10 @@ def create_listing(
                 listing = cursor.fetchone()
                 cursor.execute(link_query, (payload.property_id, listing["id"]))
                 cursor.fetchone()
+                match_saved_searches(cursor, [listing["id"]], "created")
 
-                return listing
+        autocomplete_index.refresh_listings(connection, [listing["id"]])
+        return listing
     except IntegrityError as exc:
         handle_error(
             exc,
@@ -328,6 +1133,34 @@ def create_listing(
         )
 
 
+@router.post(
+    "/import",
+    response_model=ListingImportOut,
+    description="Upsert a CSV or NDJSON feed of listings keyed on external_ref",
+)
+def import_listing_feed(
+    feed: UploadFile,
+    format: Optional[str] = Query(default=None, description="csv or ndjson, default from the file name"),
+    connection=Depends(get_db),
+    _: User = Depends(get_current_user),
+):
+    if format is None and feed.filename:
+        extension = feed.filename.rsplit(".", 1)[-1].lower()
+        format = "ndjson" if extension in ("ndjson", "jsonl") else extension
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"format must be one of {', '.join(IMPORT_FORMATS)}",
+        )
+
+    try:
+        result = import_listings(connection, feed.file, format)
+    except (DataError, IntegrityError) as exc:
+        handle_error(exc, "Could not import the feed")
+    autocomplete_index.refresh_listings(connection, result["listing_ids"])
+    return result
+
+
 @router.post(
     "/{listing_id}/media",
     status_code=status.HTTP_201_CREATED,
@@ -345,17 +1178,20 @@ def add_listing_media(
         RETURNING *
     """
     try:
-        row = execute_returning(
-            connection,
-            query,
-            (
-                listing_id,
-                payload.media_type_id,
-                payload.url,
-                payload.caption,
-                payload.position,
-            ),
-        )
+        with connection:
+            with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(
+                    query,
+                    (
+                        listing_id,
+                        payload.media_type_id,
+                        payload.url,
+                        payload.caption,
+                        payload.position,
+                    ),
+                )
+                row = cursor.fetchone()
+                cursor.execute(COVER_QUERY, {"listing_id": listing_id})
 
         return row
     except IntegrityError as exc:
@@ -373,10 +1209,17 @@ def add_open_house(
     connection=Depends(get_db),
     _: User = Depends(get_current_user),
 ):
+    # touching the listing moves its Last-Modified, open_houses has no timestamp
     query = """
-        INSERT INTO open_houses (listing_id, starts_at, ends_at, type_id, note)
-        VALUES (%s, %s, %s, %s, %s)
-        RETURNING *
+        WITH open_house AS (
+            INSERT INTO open_houses (listing_id, starts_at, ends_at, type_id, note)
+            VALUES (%s, %s, %s, %s, %s)
+            RETURNING *
+        ), touched AS (
+            UPDATE listings SET updated_at = NOW()
+            WHERE id = (SELECT listing_id FROM open_house)
+        )
+        SELECT * FROM open_house
     """
     try:
         row = execute_returning(
@@ -447,7 +1290,11 @@ def update_listing(
                 )
                 listing = cursor.fetchone()
                 cursor.execute(link_query, (payload.property_id, listing_id))
-        return raise_if_not_found(listing, "Listing")
+                if listing:
+                    match_saved_searches(cursor, [listing_id], "updated")
+        raise_if_not_found(listing, "Listing")
+        autocomplete_index.refresh_listings(connection, [listing_id])
+        return listing
     except IntegrityError as exc:
         handle_error(exc, "Could not update listing")
     except HTTPException as exception:
@@ -472,15 +1319,13 @@ def delete_listing(
         "DELETE FROM listing_agents WHERE listing_id = %s",
         "DELETE FROM listing_properties WHERE listing_id = %s",
     ]
-    with connection:
-        with connection.cursor() as cursor:
-            for sql in cleanup_queries:
-                cursor.execute(sql, (listing_id,))
-            cursor.execute(
-                "DELETE FROM listings WHERE id = %s RETURNING id", (listing_id,)
-            )
-            deleted = cursor.fetchone()
+    with unit_of_work(connection) as work:
+        deleted = work.pipeline(
+            [(sql, (listing_id,)) for sql in cleanup_queries]
+            + [("DELETE FROM listings WHERE id = %s RETURNING id", (listing_id,))]
+        )
     raise_if_not_found(deleted, "Listing")
+    autocomplete_index.remove_listing(listing_id)
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 
@@ -493,9 +1338,19 @@ def delete_media(
     connection=Depends(get_db),
     _: User = Depends(get_current_user),
 ):
-    deleted = execute_returning(
-        connection, "DELETE FROM listing_media WHERE id = %s RETURNING id", (media_id,)
-    )
+    with connection:
+        with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(
+                "DELETE FROM listing_media WHERE id = %s RETURNING id, listing_id",
+                (media_id,),
+            )
+            deleted = cursor.fetchone()
+            if deleted:
+                cursor.execute(COVER_QUERY, {"listing_id": deleted["listing_id"]})
+                cursor.execute(
+                    "UPDATE listings SET updated_at = NOW() WHERE id = %s",
+                    (deleted["listing_id"],),
+                )
     raise_if_not_found(deleted, "Listing media")
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
@@ -509,11 +1364,16 @@ def delete_open_house(
     connection=Depends(get_db),
     _: User = Depends(get_current_user),
 ):
-    deleted = execute_returning(
-        connection,
-        "DELETE FROM open_houses WHERE id = %s RETURNING id",
-        (open_house_id,),
-    )
+    query = """
+        WITH deleted AS (
+            DELETE FROM open_houses WHERE id = %s RETURNING id, listing_id
+        ), touched AS (
+            UPDATE listings SET updated_at = NOW()
+            WHERE id = (SELECT listing_id FROM deleted)
+        )
+        SELECT id FROM deleted
+    """
+    deleted = execute_returning(connection, query, (open_house_id,))
     raise_if_not_found(deleted, "Open house")
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
@@ -523,6 +1383,41 @@ def delete_open_house(
 #########################################
 
 
+@router.patch("/{listing_id}/media/order", response_model=ListingMediaOut)
+def reorder_listing_media(
+    listing_id: int,
+    payload: ListingMediaOrder,
+    _: User = Depends(get_current_user),
+    connection=Depends(get_db),
+):
+    reorder_query = """
+        UPDATE listing_media lm
+        SET position = o.position,
+            updated_at = NOW()
+        FROM unnest(%s::int[]) WITH ORDINALITY AS o(id, position)
+        WHERE lm.id = o.id AND lm.listing_id = %s
+    """
+    media_query = """
+        SELECT id, media_type_id, url, caption, position, updated_at
+        FROM listing_media
+        WHERE listing_id = %s
+        ORDER BY position NULLS LAST, id
+    """
+    with connection:
+        with connection.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(reorder_query, (payload.media_ids, listing_id))
+            if cursor.rowcount != len(set(payload.media_ids)):
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Listing media not found for this listing",
+                )
+            cursor.execute(COVER_QUERY, {"listing_id": listing_id})
+            cursor.execute(media_query, (listing_id,))
+            rows = cursor.fetchall()
+
+    return {"count": len(rows), "items": rows}
+
+
 @router.patch("/{listing_id}/change/title", response_model=ListingMutateOut)
 def update_listing_title(
     listing_id: int,
@@ -546,4 +1441,6 @@ def update_listing_title(
         ),
     )
 
-    return raise_if_not_found(patched, "Listings title")
+    raise_if_not_found(patched, "Listings title")
+    autocomplete_index.refresh_listings(connection, [listing_id])
+    return patched
@@ -1,12 +1,18 @@
 from typing import List
-from fastapi import APIRouter, Depends, status, Response, HTTPException
+from fastapi import APIRouter, Depends, status, Request, Response, Query, HTTPException
 from psycopg2 import IntegrityError
-from db import fetch_one, fetch_all, execute_returning
+from db import fetch_one, fetch_all, execute_returning, fetch_one_prepared, fetch_all_prepared
+from autocomplete import autocomplete_index
+from lookups import lookups
+from prepared import statement
 from helpers import (
     get_db,
     raise_if_not_found,
     handle_error,
     get_current_user,
+    not_modified,
+    parse_ids,
+    in_request_order,
 )
 from schemas import (
     PropertyCreate,
@@ -15,6 +21,7 @@ from schemas import (
     LocationCreate,
     User,
     PropertyOut,
+    PropertyBatchOut,
     LocationOut,
     PropertyTypeItem,
 )
@@ -25,43 +32,85 @@ router = APIRouter(
     tags=["properties"],
 )
 
+PROPERTY_VERSION = statement(
+    "property_version",
+    "SELECT xmin::text AS version, updated_at AS last_modified FROM properties WHERE id = %s",
+)
+
+PROPERTIES_BY_ID = statement("properties_by_id", """
+    SELECT p.id,
+           p.location_id,
+           p.property_type_id,
+           p.tenure_id,
+           p.year_built,
+           p.living_area_sqm,
+           p.additional_area_sqm,
+           p.plot_area_sqm,
+           p.rooms,
+           p.floor,
+           p.monthly_fee,
+           p.energy_class,
+           p.created_at,
+           p.updated_at
+    FROM properties p
+    WHERE p.id = ANY(%s)
+""")
+
+PROPERTY_DETAIL = statement("property_detail", """
+    SELECT p.id,
+           p.location_id,
+           p.property_type_id,
+           p.tenure_id,
+           p.year_built,
+           p.living_area_sqm,
+           p.additional_area_sqm,
+           p.plot_area_sqm,
+           p.rooms,
+           p.floor,
+           p.monthly_fee,
+           p.energy_class,
+           p.created_at,
+           p.updated_at
+    FROM properties p
+    WHERE p.id = %s
+""")
+
 #########################################
 #               GET                     #
 #########################################
 
 
-@router.get("/{property_id}", response_model=PropertyOut)
-def property_detail(property_id: int, connection=Depends(get_db)):
-    query = """
-        SELECT p.id,
-               p.location_id,
-               p.property_type_id,
-               p.tenure_id,
-               p.year_built,
-               p.living_area_sqm,
-               p.additional_area_sqm,
-               p.plot_area_sqm,
-               p.rooms,
-               p.floor,
-               p.monthly_fee,
-               p.energy_class,
-               p.created_at,
-               p.updated_at
-        FROM properties p
-        WHERE p.id = %s
-    """
+# declared before /{property_id} so "types" and "batch" aren't parsed as ids
+@router.get("/types", response_model=List[PropertyTypeItem])
+def property_types():
+    names = lookups.names("property_types")
+    return raise_if_not_found([{"type": name} for name in names], "Property types")
 
-    row = fetch_one(connection, query, (property_id,))
-    return raise_if_not_found(row, "Property")
 
+@router.get("/batch", response_model=PropertyBatchOut)
+def properties_by_id(
+    ids: str = Query(description="Comma separated ids, e.g. 1,2,3"),
+    connection=Depends(get_db),
+):
+    property_ids = parse_ids(ids)
+    rows = fetch_all_prepared(connection, PROPERTIES_BY_ID, (property_ids,))
+    return in_request_order(property_ids, rows)
 
-@router.get("/types", response_model=List[PropertyTypeItem])
-def property_types(connection=Depends(get_db)):
-    query = """
-        SELECT name AS type FROM property_types
-    """
-    rows = fetch_all(connection, query)
-    return raise_if_not_found(rows, "Property types")
+
+@router.get("/{property_id}", response_model=PropertyOut)
+def property_detail(
+    property_id: int,
+    request: Request,
+    response: Response,
+    connection=Depends(get_db),
+):
+    version = fetch_one_prepared(connection, PROPERTY_VERSION, (property_id,))
+    cached = not_modified(request, response, version)
+    if cached is not None:
+        return cached
+
+    row = fetch_one_prepared(connection, PROPERTY_DETAIL, (property_id,))
+    return raise_if_not_found(row, "Property")
 
 
 #########################################
@@ -69,6 +118,19 @@ def property_types(connection=Depends(get_db)):
 #########################################
 
 
+@router.post("/types/reload", response_model=List[PropertyTypeItem])
+def reload_lookups(
+    connection=Depends(get_db),
+    _: User = Depends(get_current_user),
+):
+    """
+    Reloads every lookup table (property types, statuses, tenures, ...) in this
+    worker process, e.g. after a migration added a new type.
+    """
+    lookups.load(connection)
+    return [{"type": name} for name in lookups.names("property_types")]
+
+
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=PropertyOut)
 def create_property(
     payload: PropertyCreate,
@@ -157,7 +219,16 @@ def update_property(
             ),
         )
 
-        return raise_if_not_found(row, "Property")
+        raise_if_not_found(row, "Property")
+        linked = fetch_all(
+            connection,
+            "SELECT listing_id FROM listing_properties WHERE property_id = %s",
+            (property_id,),
+        )
+        autocomplete_index.refresh_listings(
+            connection, [link["listing_id"] for link in linked]
+        )
+        return row
     except IntegrityError as exc:
         handle_error(exc, "Could not update property")
     except HTTPException as exception:
@@ -180,7 +251,8 @@ def update_location(
             county = COALESCE(%s, county),
             country = %s,
             latitude = COALESCE(%s, latitude),
-            longitude = COALESCE(%s, longitude)
+            longitude = COALESCE(%s, longitude),
+            updated_at = NOW()
         WHERE id = %s
         RETURNING *
     """
@@ -201,7 +273,21 @@ def update_location(
             ),
         )
 
-        return raise_if_not_found(row, "Location")
+        raise_if_not_found(row, "Location")
+        linked = fetch_all(
+            connection,
+            """
+                SELECT lp.listing_id
+                FROM listing_properties lp
+                JOIN properties p ON lp.property_id = p.id
+                WHERE p.location_id = %s
+            """,
+            (location_id,),
+        )
+        autocomplete_index.refresh_listings(
+            connection, [link["listing_id"] for link in linked]
+        )
+        return row
     except IntegrityError as exc:
         handle_error(exc, "Could not update location")
     except HTTPException as exception:
@@ -1,9 +1,12 @@
-from fastapi import HTTPException, Depends, status, APIRouter
-from schemas import Token
-from datetime import timedelta
+from datetime import datetime, timezone
+from fastapi import HTTPException, Depends, status, APIRouter, Response
+from schemas import Token, User
 from fastapi.security import OAuth2PasswordRequestForm
+from async_db import execute_with_row_count
+from revocations import revocations, REVOKE_QUERY, ACCESS_TOKEN_LIFETIME
 from helpers import (
-    get_db,
+    get_async_db,
+    get_current_user,
     authenticate_user,
     create_access_token,
 )
@@ -13,9 +16,9 @@ router = APIRouter()
 
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
-    form_data: OAuth2PasswordRequestForm = Depends(), connection=Depends(get_db)
+    form_data: OAuth2PasswordRequestForm = Depends(), connection=Depends(get_async_db)
 ):
-    user = authenticate_user(form_data.username, form_data.password, connection)
+    user = await authenticate_user(form_data.username, form_data.password, connection)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -23,10 +26,22 @@ async def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token_expires = timedelta(minutes=30)
     access_token = create_access_token(
-        data={"sub": user.username},
-        expires_delta=access_token_expires,
+        data={"sub": user.username, "uid": user.id},
+        expires_delta=ACCESS_TOKEN_LIFETIME,
     )
 
     return {"access_token": access_token}
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(
+    current_user: User = Depends(get_current_user), connection=Depends(get_async_db)
+):
+    """
+    Revokes every token issued to the current user so far.
+    """
+    revoked_before = datetime.now(timezone.utc)
+    await execute_with_row_count(connection, REVOKE_QUERY, (current_user.id, revoked_before))
+    revocations.record(current_user.id, revoked_before)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
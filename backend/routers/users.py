@@ -1,16 +1,22 @@
+from datetime import datetime, timezone
 from typing import List, Optional
-from fastapi import APIRouter, Depends, status, Response, HTTPException
+from fastapi import APIRouter, Depends, status, Response, HTTPException, Query
 from psycopg2 import IntegrityError
 from psycopg2.errors import UniqueViolation
-from psycopg2.extras import RealDictCursor
-from db import fetch_all, execute_returning
+from db import execute_returning, execute_returning_all, unit_of_work
+from async_db import fetch_all, iter_rows
+from lookups import lookups
+from revocations import revocations, REVOKE_QUERY
 from helpers import (
     get_db,
+    get_async_db,
     handle_error,
     raise_if_not_found,
     get_current_user,
-    get_password_hash,
+    hash_password,
+    unique_ids,
 )
+from streaming import wants_stream, stream_items_async
 from schemas import (
     UserCreate,
     SavedSearchCreate,
@@ -21,12 +27,15 @@ from schemas import (
     User,
     UserMeOut,
     UserOut,
+    ListUser,
     UserCreateOut,
     UserUpdateOut,
     AddressOut,
     AddressIdOut,
     SavedListingsOut,
     SavedListingCreateOut,
+    SavedListingsBulk,
+    SavedListingsBulkOut,
     SavedSearchItem,
     SavedSearchesOut,
 )
@@ -36,6 +45,27 @@ router = APIRouter(
     tags=["users"],
 )
 
+
+def _property_type_ids(names: List[str]) -> List[int]:
+    ids = []
+    for name in names:
+        property_type_id = lookups.id("property_types", name)
+        if property_type_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown property type {name}",
+            )
+        ids.append(property_type_id)
+    return ids
+
+
+def _bulk_result(rows, changed_result: str) -> dict:
+    return {
+        "changed": sum(1 for row in rows if row["result"] == changed_result),
+        "items": rows,
+    }
+
+
 #########################################
 #               GET                     #
 #########################################
@@ -47,15 +77,15 @@ async def read_users_me(current_user: User = Depends(get_current_user)):
 
 
 @router.get("/", response_model=UserOut)
-def list_users(
-    limit: Optional[int] = None,
-    offset: Optional[int] = None,
-    connection=Depends(get_db),
+async def list_users(
+    limit: Optional[int] = Query(default=None, ge=1),
+    offset: Optional[int] = Query(default=None, ge=0),
+    connection=Depends(get_async_db),
 ):
     query = """
         SELECT u.first_name, u.last_name, u.email, ur.name AS role
         FROM users u
-        LEFT JOIN user_roles ur ON u.id = ur.user_id;
+        LEFT JOIN user_roles ur ON u.id = ur.user_id
     """
 
     parameters: List = []
@@ -67,16 +97,19 @@ def list_users(
         query += " OFFSET %s"
         parameters.append(offset)
 
-    rows = fetch_all(connection, query, parameters)
+    if wants_stream(limit):
+        return stream_items_async(iter_rows(connection, query, parameters), ListUser)
+
+    rows = await fetch_all(connection, query, parameters)
     return {"count": len(rows), "items": rows}
 
 
 @router.get("/{user_id}/saved-listings", response_model=SavedListingsOut)
-def user_saved_listings(
+async def user_saved_listings(
     user_id: int,
-    limit: Optional[int] = None,
-    offset: Optional[int] = None,
-    connection=Depends(get_db),
+    limit: Optional[int] = Query(default=None, ge=1),
+    offset: Optional[int] = Query(default=None, ge=0),
+    connection=Depends(get_async_db),
     _: User = Depends(get_current_user),
 ):
     query = """
@@ -85,15 +118,13 @@ def user_saved_listings(
                l.id AS listing_id,
                l.title,
                l.list_price,
-               ls.name AS status,
+               l.status_id,
                loc.city,
-               pt.name AS property_type
+               p.property_type_id
         FROM saved_listings sl
         JOIN listings l ON sl.listing_id = l.id
-        JOIN listing_status ls ON l.status_id = ls.id
         JOIN listing_properties lp ON l.id = lp.listing_id
         JOIN properties p ON lp.property_id = p.id
-        JOIN property_types pt ON p.property_type_id = pt.id
         JOIN locations loc ON p.location_id = loc.id
         WHERE sl.user_id = %s
         ORDER BY sl.created_at DESC
@@ -108,16 +139,18 @@ def user_saved_listings(
         query += " OFFSET %s"
         parameters.append(offset)
 
-    rows = fetch_all(connection, query, parameters)
+    rows = await fetch_all(connection, query, parameters)
+    lookups.name_rows(rows, "listing_status", "status_id", "status")
+    lookups.name_rows(rows, "property_types", "property_type_id", "property_type")
     return {"count": len(rows), "items": rows}
 
 
 @router.get("/{user_id}/searches", response_model=SavedSearchesOut)
-def user_saved_searches(
+async def user_saved_searches(
     user_id: int,
-    limit: Optional[int] = None,
-    offset: Optional[int] = None,
-    connection=Depends(get_db),
+    limit: Optional[int] = Query(default=None, ge=1),
+    offset: Optional[int] = Query(default=None, ge=0),
+    connection=Depends(get_async_db),
     _: User = Depends(get_current_user),
 ):
     query = """
@@ -131,12 +164,10 @@ def user_saved_searches(
             ss.send_email,
             ss.created_at,
             ss.updated_at,
-            array_agg(pt.name) AS property_types -- array_agg() för att eggregera pt.name till en array istället för en rad per property_type
+            array_agg(sspt.property_type_id) AS property_types -- array_agg() för att eggregera typerna till en array istället för en rad per property_type
         FROM saved_searches ss
         JOIN saved_search_property_type sspt
         ON sspt.saved_search_id = ss.id
-        JOIN property_types pt
-        ON pt.id = sspt.property_type_id
         WHERE user_id = %s
         GROUP BY ss.id
         ORDER BY created_at DESC
@@ -151,7 +182,12 @@ def user_saved_searches(
         query += " OFFSET %s"
         parameters.append(offset)
 
-    rows = fetch_all(connection, query, parameters)
+    rows = await fetch_all(connection, query, parameters)
+    for row in rows:
+        row["property_types"] = [
+            lookups.name("property_types", property_type_id)
+            for property_type_id in row["property_types"]
+        ]
     return {"count": len(rows), "items": rows}
 
 
@@ -176,33 +212,27 @@ def create_user(payload: UserCreate, connection=Depends(get_db)):
         VALUES (%s, %s)
         RETURNING *
     """
+    password_hash = hash_password(payload.password)
     try:
-        row = execute_returning(
-            connection,
-            query,
-            (
-                payload.email,
-                get_password_hash(payload.password),
-                payload.first_name,
-                payload.last_name,
-                payload.phone,
-                payload.address_id,
-            ),
-        )
-
-        if row:
-            raise_if_not_found(
-                execute_returning(
-                    connection,
-                    query_user_roles,
-                    (
-                        payload.role_name,
-                        row["id"],
-                    ),
+        with unit_of_work(connection) as work:
+            row = work.returning(
+                query,
+                (
+                    payload.email,
+                    password_hash,
+                    payload.first_name,
+                    payload.last_name,
+                    payload.phone,
+                    payload.address_id,
                 ),
-                "User role",
             )
 
+            if row:
+                raise_if_not_found(
+                    work.returning(query_user_roles, (payload.role_name, row["id"])),
+                    "User role",
+                )
+
         return row
     except UniqueViolation:
         raise HTTPException(
@@ -241,6 +271,52 @@ def save_listing(
         raise exception
 
 
+@router.post(
+    "/{user_id}/saved-listings/bulk",
+    response_model=SavedListingsBulkOut,
+)
+def save_listings(
+    user_id: int,
+    payload: SavedListingsBulk,
+    connection=Depends(get_db),
+    _: User = Depends(get_current_user),
+):
+    # one statement for the whole list, ids that are already saved or don't exist
+    # are reported instead of failing the request
+    query = """
+        WITH requested AS (
+            SELECT listing_id, ordinality
+            FROM unnest(%(listing_ids)s::int[]) WITH ORDINALITY AS r(listing_id, ordinality)
+        ), inserted AS (
+            INSERT INTO saved_listings (user_id, listing_id)
+            SELECT %(user_id)s, r.listing_id
+            FROM requested r
+            JOIN listings l ON r.listing_id = l.id
+            ORDER BY r.listing_id
+            ON CONFLICT (user_id, listing_id) DO NOTHING
+            RETURNING listing_id
+        )
+        SELECT r.listing_id,
+               CASE
+                   WHEN i.listing_id IS NOT NULL THEN 'saved'
+                   WHEN l.id IS NULL THEN 'not_found'
+                   ELSE 'already_saved'
+               END AS result
+        FROM requested r
+        LEFT JOIN inserted i ON r.listing_id = i.listing_id
+        LEFT JOIN listings l ON r.listing_id = l.id
+        ORDER BY r.ordinality
+    """
+    listing_ids = unique_ids(payload.listing_ids)
+    try:
+        rows = execute_returning_all(
+            connection, query, {"user_id": user_id, "listing_ids": listing_ids}
+        )
+        return _bulk_result(rows, "saved")
+    except IntegrityError as exc:
+        handle_error(exc, "Listings could not be saved (user might not exist)")
+
+
 @router.post(
     "/{user_id}/searches",
     status_code=status.HTTP_201_CREATED,
@@ -257,36 +333,31 @@ def create_saved_search(
         VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
         RETURNING id, user_id, query, location, price_min, price_max, rooms_min, rooms_max, send_email, created_at, updated_at
     """
+    property_type_ids = _property_type_ids(payload.property_types)
+    property_type_query = """
+        INSERT INTO saved_search_property_type (saved_search_id, property_type_id)
+        VALUES %s
+    """
     try:
-        row = execute_returning(
-            connection,
-            query,
-            (
-                user_id,
-                payload.query,
-                payload.location,
-                payload.price_min,
-                payload.price_max,
-                payload.rooms_min,
-                payload.rooms_max,
-                payload.send_email,
-            ),
-        )
-
-        if row:
-            for property_type in payload.property_types:
-                type_row = execute_returning(
-                    connection,
-                    """
-                        INSERT INTO saved_search_property_type(saved_search_id, property_type_id)
-                        VALUES(%s, (SELECT id FROM property_types WHERE name = %s))
-                        RETURNING *
-                    """,
-                    (row["id"], property_type.lower()),
-                )
+        with unit_of_work(connection) as work:
+            row = work.returning(
+                query,
+                (
+                    user_id,
+                    payload.query,
+                    payload.location,
+                    payload.price_min,
+                    payload.price_max,
+                    payload.rooms_min,
+                    payload.rooms_max,
+                    payload.send_email,
+                ),
+            )
 
-                raise_if_not_found(
-                    type_row, f"Could not save property type {property_type}"
+            if row:
+                work.values(
+                    property_type_query,
+                    [(row["id"], property_type_id) for property_type_id in property_type_ids],
                 )
 
         return row
@@ -351,35 +422,50 @@ def update_user(
         WHERE id = %s
         RETURNING id, email, first_name, last_name, phone, address_id, created_at, updated_at
     """
+    # one bcrypt round, a given password is stored as new without comparing it first
+    password_hash = None
+    if payload.password is not None:
+        password_hash = hash_password(payload.password)
+    # a new password or email invalidates the tokens issued so far
+    revoked_before = None
+    if password_hash is not None or payload.email is not None:
+        revoked_before = datetime.now(timezone.utc)
+    put_role_name_query = """
+        UPDATE user_roles
+        SET name = %s
+        WHERE user_id = %s
+        RETURNING *
+    """
     try:
-        row = execute_returning(
-            connection,
-            query,
-            (
-                payload.email,
-                get_password_hash(payload.password),
-                payload.first_name,
-                payload.last_name,
-                payload.phone,
-                payload.address_id,
-                user_id,
-            ),
-        )
-
-        if payload.role_name:
-            put_role_name_query = """
-                UPDATE user_roles
-                SET name = %s
-                WHERE user_id = %s
-                RETURNING *
-            """
-
-            user_roles_row = execute_returning(
-                connection, put_role_name_query, (payload.role_name, user_id)
+        with unit_of_work(connection) as work:
+            row = raise_if_not_found(
+                work.returning(
+                    query,
+                    (
+                        payload.email,
+                        password_hash,
+                        payload.first_name,
+                        payload.last_name,
+                        payload.phone,
+                        payload.address_id,
+                        user_id,
+                    ),
+                ),
+                "User",
             )
-            raise_if_not_found(user_roles_row, "User role")
+            # the revocation and the role change don't depend on each other
+            statements = []
+            if revoked_before is not None:
+                statements.append((REVOKE_QUERY, (user_id, revoked_before)))
+            if payload.role_name:
+                statements.append((put_role_name_query, (payload.role_name, user_id)))
+            rows = work.pipeline(statements)
+            if payload.role_name:
+                raise_if_not_found(rows[0] if rows else None, "User role")
+        if revoked_before is not None:
+            revocations.record(user_id, revoked_before)
 
-        return raise_if_not_found(row, "User")
+        return row
     except UniqueViolation:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -415,15 +501,20 @@ def update_saved_search(
         WHERE id = %s AND user_id = %s
         RETURNING id, user_id, query, location, price_min, price_max, rooms_min, rooms_max, send_email, created_at, updated_at
     """
+    property_type_delete = "DELETE FROM saved_search_property_type WHERE saved_search_id = %s"
     property_type_insert = """
         INSERT INTO saved_search_property_type (saved_search_id, property_type_id)
-        VALUES (%s, (SELECT id FROM property_types WHERE name = %s))
-        RETURNING saved_search_id, property_type_id
+        SELECT %s, unnest(%s::int[])
     """
+    property_type_ids = None
+    if payload.property_types is not None:
+        property_type_ids = _property_type_ids(
+            [name for name in payload.property_types if name is not None]
+        )
     try:
-        with connection:
-            with connection.cursor(cursor_factory=RealDictCursor) as cursor:
-                cursor.execute(
+        with unit_of_work(connection) as work:
+            saved_search = raise_if_not_found(
+                work.returning(
                     update_query,
                     (
                         payload.query,
@@ -436,25 +527,17 @@ def update_saved_search(
                         search_id,
                         user_id,
                     ),
+                ),
+                "Saved search",
+            )
+
+            if property_type_ids is not None:
+                work.pipeline(
+                    [
+                        (property_type_delete, (search_id,)),
+                        (property_type_insert, (search_id, property_type_ids)),
+                    ]
                 )
-                saved_search = raise_if_not_found(cursor.fetchone(), "Saved search")
-
-                if payload.property_types is not None:
-                    cursor.execute(
-                        "DELETE FROM saved_search_property_type WHERE saved_search_id = %s",
-                        (search_id,),
-                    )
-                    for property_type in payload.property_types:
-                        if property_type is None:
-                            continue
-
-                        cursor.execute(
-                            property_type_insert, (search_id, property_type.lower())
-                        )
-                        raise_if_not_found(
-                            cursor.fetchone(),
-                            f"Could not save property type {property_type}",
-                        )
 
         return saved_search
     except IntegrityError as exception:
@@ -508,6 +591,38 @@ def update_address(
 #########################################
 
 
+@router.delete(
+    "/{user_id}/saved-listings/bulk",
+    response_model=SavedListingsBulkOut,
+)
+def delete_saved_listings(
+    user_id: int,
+    payload: SavedListingsBulk,
+    connection=Depends(get_db),
+    _: User = Depends(get_current_user),
+):
+    query = """
+        WITH requested AS (
+            SELECT listing_id, ordinality
+            FROM unnest(%(listing_ids)s::int[]) WITH ORDINALITY AS r(listing_id, ordinality)
+        ), deleted AS (
+            DELETE FROM saved_listings
+            WHERE user_id = %(user_id)s AND listing_id = ANY(%(listing_ids)s::int[])
+            RETURNING listing_id
+        )
+        SELECT r.listing_id,
+               CASE WHEN d.listing_id IS NOT NULL THEN 'removed' ELSE 'not_saved' END AS result
+        FROM requested r
+        LEFT JOIN deleted d ON r.listing_id = d.listing_id
+        ORDER BY r.ordinality
+    """
+    listing_ids = unique_ids(payload.listing_ids)
+    rows = execute_returning_all(
+        connection, query, {"user_id": user_id, "listing_ids": listing_ids}
+    )
+    return _bulk_result(rows, "removed")
+
+
 @router.delete(
     "/{user_id}/saved-listings/{listing_id}",
     status_code=status.HTTP_204_NO_CONTENT,
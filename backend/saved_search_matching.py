@@ -0,0 +1,53 @@
+from typing import List
+
+# listings in other statuses are not announced to saved searches
+MATCHING_STATUSES = ["coming_soon", "for_sale"]
+
+# joins listing_search s to the saved searches ss it satisfies, each listing row only
+# meets the saved searches found through the range (gist) and property type (hash)
+# indexes. Query and location are checked the way GET /listings applies free_text_search
+# and city, so a saved search announces what the user saw when saving it
+SAVED_SEARCH_JOIN = """
+    JOIN saved_searches ss
+      ON ss.price_range @> numrange(s.list_price, s.list_price, '[]')
+     AND ss.rooms_range @> numrange(s.rooms, s.rooms, '[]')
+     AND (ss.query_tsquery IS NULL OR s.search_document @@ ss.query_tsquery)
+     AND s.city ILIKE '%%' || COALESCE(ss.location, '') || '%%'
+     AND (
+         EXISTS (
+             SELECT 1
+             FROM saved_search_property_type sspt
+             WHERE sspt.property_type_id = s.property_type_id
+               AND sspt.saved_search_id = ss.id
+         )
+         OR NOT EXISTS (
+             SELECT 1 FROM saved_search_property_type sspt WHERE sspt.saved_search_id = ss.id
+         )
+     )
+"""
+
+_MATCH_QUERY = f"""
+    INSERT INTO saved_search_notifications (saved_search_id, listing_id, user_id, event)
+    SELECT ss.id, s.id, ss.user_id, %(event)s
+    FROM listing_search s
+    {SAVED_SEARCH_JOIN}
+    WHERE s.id = ANY(%(listing_ids)s)
+      AND s.status = ANY(%(statuses)s)
+    ON CONFLICT (saved_search_id, listing_id) DO NOTHING
+"""
+
+
+def match_saved_searches(cursor, listing_ids: List[int], event: str) -> int:
+    """
+    Records a notification for every saved search the listings now satisfy and
+    returns how many were added. Runs on the caller's cursor, so the matches
+    commit or roll back together with the listing change. listing_search has
+    to be up to date for the listings.
+    """
+    if not listing_ids:
+        return 0
+    cursor.execute(
+        _MATCH_QUERY,
+        {"event": event, "listing_ids": list(listing_ids), "statuses": MATCHING_STATUSES},
+    )
+    return cursor.rowcount
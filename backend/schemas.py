@@ -128,6 +128,11 @@ class PropertyOut(BaseModel):
     updated_at: datetime
 
 
+class PropertyBatchOut(BaseModel):
+    items: List[PropertyOut]
+    missing: List[int]
+
+
 class PropertyTypeItem(BaseModel):
     type: str
 
@@ -168,11 +173,102 @@ class ListingItem(BaseModel):
     living_area_sqm: int
     city: str
     image: str | None = None
+    latitude: float | None = None
+    longitude: float | None = None
+    distance_km: float | None = None
 
 
 class ListingOut(BaseModel):
     count: int
     items: List[ListingItem]
+    next_cursor: str | None = None
+    # every listing matching the filters, an estimate when total_is_exact is false.
+    # Only on the first page, null on pages requested with a cursor
+    total: int | None = None
+    total_is_exact: bool | None = None
+
+
+class ListingFilters(BaseModel):
+    free_text_search: str | None = None
+    city: str | None = None
+    min_price: float | None = None
+    max_price: float | None = None
+    min_rooms: float | None = None
+    max_rooms: float | None = None
+    property_types: List[str] | None = None
+    status_name: str | None = None
+    bbox: List[float] | None = None
+    latitude: float | None = None
+    longitude: float | None = None
+    radius_km: float | None = None
+
+
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+
+class PriceBucket(BaseModel):
+    from_price: float
+    to_price: float
+    count: int
+
+
+class PriceHistogram(BaseModel):
+    min_price: float | None = None
+    max_price: float | None = None
+    buckets: List[PriceBucket]
+
+
+class ListingFacetsOut(BaseModel):
+    total: int
+    property_type: List[FacetCount]
+    status: List[FacetCount]
+    tenure: List[FacetCount]
+    rooms: List[FacetCount]
+    price: PriceHistogram
+
+
+class ListingImportError(BaseModel):
+    line: int
+    external_ref: str | None = None
+    error: str
+
+
+class ListingImportOut(BaseModel):
+    received: int
+    created: int
+    updated: int
+    unchanged: int
+    failed: int
+    errors: List[ListingImportError]
+
+
+class ListingCluster(BaseModel):
+    count: int
+    latitude: float
+    longitude: float
+    min_price: float | None = None
+    max_price: float | None = None
+
+
+class ListingPoint(BaseModel):
+    id: int
+    latitude: float
+    longitude: float
+    list_price: float | None = None
+    property_type: str
+
+
+class ListingClustersOut(BaseModel):
+    zoom: int
+    cell_size: float | None = None
+    total: int
+    total_is_exact: bool
+    # points mode: more than MAX_POINTS listings matched, only the first are returned
+    truncated: bool
+    clusters: List[ListingCluster]
+    points: List[ListingPoint]
 
 
 class ListingMediaCreate(BaseModel):
@@ -182,6 +278,10 @@ class ListingMediaCreate(BaseModel):
     position: int | None = None
 
 
+class ListingMediaOrder(BaseModel):
+    media_ids: List[int] = Field(min_length=1)
+
+
 class ListingMutateOut(BaseModel):
     id: int
     agent_id: int
@@ -223,6 +323,16 @@ class ListingDetailOut(BaseModel):
     agency: str
 
 
+class ListingBatchItem(ListingDetailOut):
+    image: str | None = None
+    images: List[str]
+
+
+class ListingBatchOut(BaseModel):
+    items: List[ListingBatchItem]
+    missing: List[int]
+
+
 class OpenHouseCreate(BaseModel):
     starts_at: datetime
     ends_at: datetime | None = None
@@ -292,6 +402,11 @@ class AgencyDetailOut(AgencyItem):
     pass
 
 
+class AgencyBatchOut(BaseModel):
+    items: List[AgencyDetailOut]
+    missing: List[int]
+
+
 class AgencyCreateOut(AgencyItem):
     created_at: datetime
 
@@ -337,6 +452,11 @@ class AgentDetailOut(AgentListItem):
     bio: str | None = None
 
 
+class AgentBatchOut(BaseModel):
+    items: List[AgentDetailOut]
+    missing: List[int]
+
+
 class AgentCreateOut(BaseModel):
     id: int
     user_id: int
@@ -403,6 +523,21 @@ class SavedListingCreateOut(BaseModel):
     created_at: datetime
 
 
+class SavedListingsBulk(BaseModel):
+    listing_ids: List[int]
+
+
+class SavedListingBulkItem(BaseModel):
+    listing_id: int
+    # saved, already_saved or not_found when saving, removed or not_saved when removing
+    result: str
+
+
+class SavedListingsBulkOut(BaseModel):
+    changed: int
+    items: List[SavedListingBulkItem]
+
+
 class SavedSearchItem(BaseModel):
     id: int
     user_id: int
@@ -462,6 +597,13 @@ class OpenHouseItem(BaseModel):
     note: str
 
 
+class ListingDetailExpandedOut(ListingDetailOut):
+    # only present when asked for with ?expand=
+    media: List[ListingMediaItem] | None = None
+    open_houses: List[OpenHouseItem] | None = None
+    agent: AgentDetailOut | None = None
+
+
 class OpenHousesItem(OpenHouseItem):
     listing_id: int
 
@@ -491,3 +633,26 @@ class ListUser(BaseModel):
 class UserOut(BaseModel):
     count: int
     items: List[ListUser]
+
+
+class PoolStatsOut(BaseModel):
+    size: int
+    min_size: int
+    max_size: int
+    idle: int
+    in_use: int
+    waiting: int
+    checkouts_total: int
+    checkouts_per_second: float
+    timeouts_total: int
+    failed_health_checks: int
+
+
+class HashingStatsOut(BaseModel):
+    workers: int
+    max_pending: int
+    pending: int
+    max_pending_seen: int
+    completed_total: int
+    rejected_total: int
+    rehashed_total: int
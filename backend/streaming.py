@@ -0,0 +1,92 @@
+import json
+from contextlib import aclosing, closing
+from typing import AsyncGenerator, Callable, Generator, Optional, Type
+
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+# list endpoints stream their items when no limit, or a limit above this, is asked for
+STREAM_THRESHOLD = 1000
+
+# rows per chunk handed to the server
+_FLUSH_ROWS = 500
+
+
+def wants_stream(limit: Optional[int]) -> bool:
+    return limit is None or limit > STREAM_THRESHOLD
+
+
+class _ItemsWriter:
+    """
+    Renders {"items": [...], "count": n, ...} piece by piece. count goes last
+    since it is only known once every row has been written.
+    """
+
+    def __init__(self, model: Type[BaseModel]):
+        self.model = model
+        self.count = 0
+        self._pending = [b'{"items":[']
+
+    def add(self, row) -> Optional[bytes]:
+        if self.count:
+            self._pending.append(b",")
+        self._pending.append(self.model.model_validate(row).model_dump_json().encode())
+        self.count += 1
+        if self.count % _FLUSH_ROWS == 0:
+            return self.flush()
+        return None
+
+    def flush(self) -> bytes:
+        chunk = b"".join(self._pending)
+        self._pending = []
+        return chunk
+
+    def close(self, extra: Optional[dict]) -> bytes:
+        trailer = {"count": self.count, **(extra or {})}
+        self._pending.append(b"]," + json.dumps(trailer).encode()[1:])
+        return self.flush()
+
+
+def stream_items(
+    rows: Generator,
+    model: Type[BaseModel],
+    extra: Optional[Callable[[], dict]] = None,
+) -> StreamingResponse:
+    """
+    Streams rows as the usual {"count", "items"} list response, each row is
+    serialized with model. extra() is called after the last row for fields
+    that depend on the whole result, e.g. a next cursor.
+    """
+
+    def body():
+        writer = _ItemsWriter(model)
+        # closed even if a row fails to serialize, ending the cursor's transaction
+        with closing(rows):
+            for row in rows:
+                chunk = writer.add(row)
+                if chunk:
+                    yield chunk
+        yield writer.close(extra() if extra else None)
+
+    return StreamingResponse(body(), media_type="application/json")
+
+
+def stream_items_async(
+    rows: AsyncGenerator,
+    model: Type[BaseModel],
+    extra: Optional[Callable[[], dict]] = None,
+) -> StreamingResponse:
+    """
+    stream_items for rows from an async iterator.
+    """
+
+    async def body():
+        writer = _ItemsWriter(model)
+        async with aclosing(rows):
+            async for row in rows:
+                chunk = writer.add(row)
+                if chunk:
+                    yield chunk
+        yield writer.close(extra() if extra else None)
+
+    return StreamingResponse(body(), media_type="application/json")
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import psycopg2
+import pytest
+
+# the backend modules import each other as top level modules (import db, ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db_cursor():
+    """
+    A cursor on the database configured for the app (.env), rolled back afterwards.
+    Tests that need the SQL itself are skipped when it isn't reachable or set up.
+    """
+    import db_setup
+
+    try:
+        connection = db_setup.get_connection()
+    except psycopg2.OperationalError:
+        pytest.skip("database not reachable")
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('listing_search')")
+            if cursor.fetchone()[0] is None:
+                pytest.skip("database not migrated")
+            yield cursor
+    finally:
+        connection.rollback()
+        connection.close()
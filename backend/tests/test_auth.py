@@ -0,0 +1,102 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi import HTTPException
+
+import helpers
+import revocations as revocations_module
+from cache import TTLCache
+from helpers import create_access_token, get_current_user
+from revocations import RevocationList
+
+
+@pytest.fixture
+def revocations(monkeypatch):
+    revocations = RevocationList()
+    # fresh, so no request goes to token_revocations
+    revocations._refreshed_at = time.monotonic()
+    monkeypatch.setattr(helpers, "revocations", revocations)
+    monkeypatch.setattr(helpers, "token_cache", TTLCache(maxsize=10, ttl=300))
+    return revocations
+
+
+def token(**claims):
+    return create_access_token({"sub": "anna@example.com", "uid": 7, **claims})
+
+
+def current_user(access_token):
+    return asyncio.run(get_current_user(access_token))
+
+
+def rejected(access_token) -> bool:
+    with pytest.raises(HTTPException) as error:
+        current_user(access_token)
+    return error.value.status_code == 401
+
+
+def test_valid_token_is_decoded_once(revocations, monkeypatch):
+    access_token = token()
+    user = current_user(access_token)
+    assert (user.id, user.username) == (7, "anna@example.com")
+
+    monkeypatch.setattr(helpers.jwt, "decode", lambda *args, **kwargs: pytest.fail("decoded again"))
+    assert current_user(access_token) == user
+
+
+def test_expired_token_is_rejected_even_when_cached(revocations, monkeypatch):
+    access_token = token()
+    current_user(access_token)
+
+    later = time.time() + 31 * 60
+    monkeypatch.setattr(helpers.time, "time", lambda: later)
+    assert rejected(access_token)
+
+
+@pytest.mark.parametrize(
+    "access_token",
+    [
+        "not a token",
+        token()[:-2],
+        # signed, but without the user id and issue time
+        helpers.jwt.encode({"sub": "anna@example.com"}, helpers.SECRET_KEY),
+    ],
+)
+def test_invalid_tokens_are_rejected(revocations, access_token):
+    assert rejected(access_token)
+
+
+def test_revocation_rejects_tokens_issued_before_it(revocations):
+    before = token()
+    current_user(before)
+
+    revocations.record(7, datetime.now(timezone.utc))
+    after = token()
+
+    assert rejected(before)
+    assert current_user(after).id == 7
+    # other users are not affected
+    assert current_user(token(uid=8)).id == 8
+
+
+def test_reload_keeps_newer_local_revocations():
+    revocations = RevocationList()
+    now = datetime.now(timezone.utc)
+    revocations.record(7, now)
+    long_ago = now - revocations_module.ACCESS_TOKEN_LIFETIME * 2
+    revocations.record(9, long_ago)
+
+    # rows read before the local revocation committed
+    revocations._replace(
+        [
+            {"user_id": 7, "revoked_before": now - timedelta(minutes=1)},
+            {"user_id": 8, "revoked_before": now},
+        ]
+    )
+
+    assert revocations.is_revoked(7, now.timestamp() - 1)
+    assert revocations.is_revoked(8, now.timestamp() - 1)
+    assert not revocations.is_revoked(8, now.timestamp() + 1)
+    # tokens from before an expired cutoff have expired too, the cutoff is dropped
+    assert not revocations.is_revoked(9, long_ago.timestamp() - 1)
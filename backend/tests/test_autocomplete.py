@@ -0,0 +1,84 @@
+import contextlib
+
+import pytest
+
+import autocomplete
+from autocomplete import PrefixIndex, normalize
+
+
+def listing(listing_id, title, city, municipality=None, postal_code=None):
+    return {
+        "id": listing_id,
+        "title": title,
+        "city": city,
+        "municipality": municipality,
+        "postal_code": postal_code,
+    }
+
+
+@pytest.fixture
+def index():
+    index = PrefixIndex()
+    index.build(
+        [
+            listing(1, "Villa vid sjön", "Stockholm", "Stockholm", "11122"),
+            listing(2, "Etta i city", "Stockholm", "Stockholm", "11123"),
+            listing(3, "Radhus", "Solna", "Solna", "16950"),
+            listing(4, "Sekelskiftesvåning", "Göteborg", "Göteborg", "41101"),
+        ]
+    )
+    return index
+
+
+def test_normalize_ignores_case_diacritics_and_spacing():
+    assert normalize("  Göteborg   Centrum ") == "goteborg centrum"
+
+
+def test_suggestions_are_ranked_by_listing_count(index):
+    assert index.search("s") == ["Stockholm", "Sekelskiftesvåning", "Solna"]
+    assert index.search("sto") == ["Stockholm"]
+    assert index.search("goteb") == ["Göteborg"]
+    assert index.search("1112") == ["11122", "11123"]
+    assert index.search("s", limit=1) == ["Stockholm"]
+    assert index.search("") == []
+
+
+def test_refresh_updates_terms_and_short_prefix_rankings(index, monkeypatch):
+    rows = {5: listing(5, "Sommarstuga", "Solna"), 6: listing(6, "Torp", "Solna")}
+    monkeypatch.setattr(
+        autocomplete,
+        "fetch_all",
+        lambda connection, query, parameters: [rows[i] for i in parameters[0] if i in rows],
+    )
+
+    index.refresh_listings(None, [5, 6])
+    assert index.search("s") == ["Solna", "Stockholm", "Sekelskiftesvåning", "Sommarstuga"]
+
+    # listing 3 is gone from the read model, 1 moved to Uppsala
+    rows[1] = listing(1, "Villa vid sjön", "Uppsala", "Uppsala", "75310")
+    index.refresh_listings(None, [1, 3])
+    assert index.search("sto") == ["Stockholm"]
+    assert index.search("up") == ["Uppsala"]
+    assert index.search("111") == ["11123"]
+    assert index.search("rad") == []
+
+    index.remove_listing(2)
+    assert index.search("st") == []
+    assert index.search("s") == ["Solna", "Sekelskiftesvåning", "Sommarstuga"]
+
+
+def test_notifications_refresh_the_changed_listings(index, monkeypatch):
+    refreshed = []
+    rebuilt = []
+    monkeypatch.setattr(autocomplete, "autocomplete_index", index)
+    monkeypatch.setattr(autocomplete, "pooled_connection", contextlib.nullcontext)
+    monkeypatch.setattr(index, "refresh_listings", lambda connection, ids: refreshed.append(ids))
+    monkeypatch.setattr(autocomplete, "build_autocomplete_index", lambda: rebuilt.append(True))
+
+    autocomplete.apply_change("3,17")
+    assert refreshed == [[3, 17]]
+    assert rebuilt == []
+
+    # too many ids for one notification
+    autocomplete.apply_change("*")
+    assert rebuilt == [True]
@@ -0,0 +1,51 @@
+import pytest
+
+import cache
+from cache import TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_ttl(clock):
+    entries = TTLCache(ttl=10)
+    entries.set("a", 1)
+    clock[0] += 10
+    assert entries.get("a") == 1
+    clock[0] += 0.1
+    assert entries.get("a") is None
+
+
+def test_ttl_can_be_given_per_entry(clock):
+    entries = TTLCache(ttl=10)
+    entries.set("short", 1, ttl=1)
+    entries.set("long", 2)
+    clock[0] += 2
+    assert entries.get("short") is None
+    assert entries.get("long") == 2
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    entries = TTLCache(maxsize=2, ttl=10)
+    entries.set("a", 1)
+    entries.set("b", 2)
+    entries.get("a")
+    entries.set("c", 3)
+    assert entries.get("b") is None
+    assert entries.get("a") == 1
+    assert entries.get("c") == 3
+
+
+def test_delete_and_clear(clock):
+    entries = TTLCache()
+    entries.set("a", 1)
+    entries.set("b", 2)
+    entries.delete("a")
+    entries.delete("missing")
+    assert entries.get("a") is None
+    entries.clear()
+    assert entries.get("b") is None
@@ -0,0 +1,116 @@
+import pytest
+from psycopg2.extensions import adapt
+
+from db import unit_of_work
+
+
+class FakeCursor:
+    """
+    Records what is sent, binds parameters the way psycopg2 quotes them.
+    """
+
+    def __init__(self, results):
+        self.connection = type("Connection", (), {"encoding": "UTF8"})()
+        self.sent = []
+        self.results = results
+        self.description = None
+        self.rowcount = -1
+
+    def mogrify(self, query, parameters=None):
+        if isinstance(query, bytes):
+            query = query.decode()
+        if parameters is None:
+            return query.encode()
+        return (query % tuple(adapt(value).getquoted().decode() for value in parameters)).encode()
+
+    def execute(self, query, parameters=None):
+        self.sent.append(self.mogrify(query, parameters).decode())
+        rows = self.results.pop(0) if self.results else None
+        self.description = None if rows is None else [("column",)]
+        self._rows = rows or []
+        self.rowcount = len(self._rows)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    def __init__(self, results=None):
+        self.cursor_ = FakeCursor(results or [])
+        self.outcome = None
+
+    def cursor(self, cursor_factory=None):
+        return self.cursor_
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.outcome = "rollback" if exc_type else "commit"
+        return False
+
+
+def test_values_sends_one_multi_row_insert_per_page():
+    connection = FakeConnection()
+    with unit_of_work(connection) as work:
+        sent = work.values(
+            "INSERT INTO saved_search_property_type (saved_search_id, property_type_id) VALUES %s",
+            [(7, 1), (7, 2), (7, 3)],
+            page_size=2,
+        )
+    assert sent == 3
+    assert connection.cursor_.sent == [
+        "INSERT INTO saved_search_property_type (saved_search_id, property_type_id) VALUES (7,1),(7,2)",
+        "INSERT INTO saved_search_property_type (saved_search_id, property_type_id) VALUES (7,3)",
+    ]
+    assert connection.outcome == "commit"
+
+
+def test_values_without_rows_sends_nothing():
+    connection = FakeConnection()
+    with unit_of_work(connection) as work:
+        assert work.values("INSERT INTO t (a) VALUES %s", []) == 0
+        assert work.values("INSERT INTO t (a) VALUES %s RETURNING a", [], returning=True) == []
+    assert connection.cursor_.sent == []
+
+
+def test_pipeline_sends_statements_in_one_round_trip():
+    connection = FakeConnection(results=[[{"id": 5}]])
+    with unit_of_work(connection) as work:
+        rows = work.pipeline(
+            [
+                ("DELETE FROM agent_agencies WHERE agent_id = %s", (5,)),
+                ("DELETE FROM agents WHERE id = %s AND title = %s RETURNING id", (5, "it's")),
+            ]
+        )
+    assert rows == [{"id": 5}]
+    assert connection.cursor_.sent == [
+        "DELETE FROM agent_agencies WHERE agent_id = 5;\n"
+        "DELETE FROM agents WHERE id = 5 AND title = 'it''s' RETURNING id"
+    ]
+
+
+def test_pipeline_without_result_rows():
+    connection = FakeConnection()
+    with unit_of_work(connection) as work:
+        assert work.pipeline([("DELETE FROM t WHERE id = %s", (1,))]) == []
+        assert work.pipeline([]) == []
+    assert len(connection.cursor_.sent) == 1
+
+
+def test_error_rolls_back_the_whole_unit():
+    connection = FakeConnection(results=[[{"id": 1}]])
+    with pytest.raises(RuntimeError):
+        with unit_of_work(connection) as work:
+            assert work.returning("INSERT INTO users (email) VALUES (%s) RETURNING id", ("a@b.se",)) == {"id": 1}
+            raise RuntimeError
+    assert connection.outcome == "rollback"
@@ -0,0 +1,108 @@
+import pytest
+
+import db_setup
+from db_setup import ConnectionPool, PoolTimeout
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.status = TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    created = []
+
+    def connect():
+        connection = FakeConnection()
+        created.append(connection)
+        return connection
+
+    monkeypatch.setattr(db_setup, "get_connection", connect)
+    return created
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(db_setup.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_open_creates_min_size_connections(connections):
+    pool = ConnectionPool(min_size=2, max_size=4)
+    pool.open()
+    assert len(connections) == 2
+    assert pool.stats()["idle"] == 2
+
+
+def test_checkout_is_lifo(connections):
+    pool = ConnectionPool(min_size=0, max_size=3)
+    first, second = pool.getconn(), pool.getconn()
+    pool.putconn(first)
+    pool.putconn(second)
+    assert pool.getconn() is second
+    assert pool.getconn() is first
+    assert len(connections) == 2
+
+
+def test_getconn_times_out_when_exhausted(connections):
+    pool = ConnectionPool(min_size=0, max_size=1, timeout=0.01)
+    pool.getconn()
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()["timeouts_total"] == 1
+
+
+def test_putconn_rolls_back_open_transactions(connections):
+    pool = ConnectionPool(min_size=0, max_size=1)
+    connection = pool.getconn()
+    connection.status = TRANSACTION_STATUS_INTRANS
+    pool.putconn(connection)
+    assert connection.rollbacks == 1
+    assert pool.getconn() is connection
+
+
+def test_discarded_connections_free_their_slot(connections):
+    pool = ConnectionPool(min_size=0, max_size=1)
+    connection = pool.getconn()
+    pool.putconn(connection, discard=True)
+    assert connection.closed
+    assert pool.getconn() is not connection
+    assert pool.stats()["size"] == 1
+
+
+def test_idle_connections_above_min_size_are_pruned(connections, clock):
+    pool = ConnectionPool(min_size=1, max_size=3, max_idle=10, check_after=1000)
+    first, second = pool.getconn(), pool.getconn()
+    pool.putconn(first)
+    clock[0] += 5
+    pool.putconn(second)
+    clock[0] += 6
+
+    # first has been idle for 11s and is closed, second is handed out
+    assert pool.getconn() is second
+    assert first.closed
+    assert pool.stats()["size"] == 1
+
+
+def test_expired_connections_are_closed_on_return(connections, clock):
+    pool = ConnectionPool(min_size=0, max_size=1, max_lifetime=60)
+    connection = pool.getconn()
+    clock[0] += 61
+    pool.putconn(connection)
+    assert connection.closed
+    assert pool.stats()["size"] == 0
@@ -0,0 +1,154 @@
+import smtplib
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import pytest
+
+import digests
+from digests import _digest_message, _send_partition
+
+SINCE = datetime(2025, 5, 1, tzinfo=timezone.utc)
+
+
+def notification(notification_id, user_id, saved_search="Villa i Nacka", deliver=True, **row):
+    return {
+        "notification_id": notification_id,
+        "user_id": user_id,
+        "email": f"user{user_id}@example.com",
+        "first_name": f"User {user_id}",
+        "saved_search_id": 1,
+        "saved_search": saved_search,
+        "listing_id": notification_id,
+        "title": f"Listing {notification_id}",
+        "list_price": Decimal("4950000"),
+        "rooms": Decimal("3"),
+        "city": "Nacka",
+        "deliver": deliver,
+        **row,
+    }
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, query, parameters=None):
+        self.connection.executed.append((query, parameters))
+
+    def fetchall(self):
+        return self.connection.rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+        self.closed = False
+
+    def cursor(self, cursor_factory=None):
+        return FakeCursor(self)
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def marked(self):
+        return [parameters["notification_ids"] for query, parameters in self.executed if "UPDATE" in query]
+
+
+class FakeSMTP:
+    def __init__(self, refused=(), fail_after=None):
+        self.refused = set(refused)
+        self.fail_after = fail_after
+        self.sent = []
+
+    def __call__(self, *args, **kwargs):
+        return self
+
+    def send_message(self, message):
+        if self.fail_after is not None and len(self.sent) == self.fail_after:
+            raise smtplib.SMTPServerDisconnected("gone")
+        if message["To"] in self.refused:
+            raise smtplib.SMTPRecipientsRefused({message["To"]: (550, b"no such user")})
+        self.sent.append(message)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+@pytest.fixture
+def partition(monkeypatch):
+    def run(rows, smtp=None):
+        connection = FakeConnection(rows)
+        smtp = smtp or FakeSMTP()
+        monkeypatch.setattr(digests.psycopg2, "connect", lambda **settings: connection)
+        monkeypatch.setattr(digests.smtplib, "SMTP", smtp)
+        result = _send_partition({}, 0, 1, SINCE)
+        return result, connection, smtp
+
+    return run
+
+
+def test_digest_message_groups_listings_per_saved_search():
+    message = _digest_message(
+        [
+            notification(1, 7, rooms=None, list_price=None),
+            notification(2, 7),
+            notification(3, 7, saved_search="Lägenhet i Solna"),
+        ]
+    )
+    body = message.get_content()
+    assert message["To"] == "user7@example.com"
+    assert message["Subject"] == "3 nya bostäder i dina bevakningar"
+    assert "  - Listing 1, Nacka, Pris saknas" in body
+    assert "  - Listing 2, Nacka, 3 rum, 4 950 000 kr" in body
+    assert body.index("Villa i Nacka") < body.index("Lägenhet i Solna")
+
+
+def test_one_mail_per_user_and_everything_marked(partition):
+    rows = [notification(1, 7), notification(2, 7), notification(3, 8), notification(4, 9, deliver=False)]
+    result, connection, smtp = partition(rows)
+
+    assert [message["To"] for message in smtp.sent] == ["user7@example.com", "user8@example.com"]
+    assert connection.marked() == [[1, 2, 3, 4]]
+    assert result == {"users": 2, "listings": 3, "failed_users": 0}
+    assert connection.closed
+
+
+def test_refused_recipient_stays_pending(partition):
+    rows = [notification(1, 7), notification(2, 8)]
+    result, connection, smtp = partition(rows, FakeSMTP(refused={"user7@example.com"}))
+
+    assert connection.marked() == [[2]]
+    assert result == {"users": 1, "listings": 1, "failed_users": 1}
+
+
+def test_lost_connection_keeps_the_rest_pending(partition):
+    rows = [notification(1, 7), notification(2, 8), notification(3, 9, deliver=False)]
+    result, connection, smtp = partition(rows, FakeSMTP(fail_after=1))
+
+    # undeliverable notifications are marked even when mailing stops
+    assert connection.marked() == [[1, 3]]
+    assert result == {"users": 1, "listings": 1, "failed_users": 1}
+
+
+def test_nothing_pending_sends_and_marks_nothing(partition):
+    result, connection, smtp = partition([])
+
+    assert smtp.sent == []
+    assert connection.marked() == []
+    assert result == {"users": 0, "listings": 0, "failed_users": 0}
@@ -0,0 +1,44 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+import helpers
+from hashing import HashingBusy, PasswordHasher
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(workers=1, max_pending=1)
+    yield hasher
+    hasher.close()
+
+
+def test_hash_and_verify_run_in_the_pool(hasher):
+    hashed = hasher.hash_blocking("secret123")
+
+    assert hasher.verify_blocking("secret123", hashed)
+    assert not hasher.verify_blocking("wrong", hashed)
+    assert asyncio.run(hasher.verify_and_update("secret123", hashed)) == (True, None)
+    stats = hasher.stats()
+    assert stats["pending"] == 0
+    assert stats["completed_total"] == 4
+
+
+def test_full_pool_rejects_instead_of_queueing(hasher):
+    running = hasher._submit(time.sleep, 0.5)
+    with pytest.raises(HashingBusy):
+        hasher.hash_blocking("secret123")
+    running.result()
+    assert hasher.stats()["pending"] == 0
+    assert hasher.stats()["rejected_total"] == 1
+
+
+def test_full_pool_is_a_503_for_requests(monkeypatch):
+    monkeypatch.setattr(helpers, "password_hasher", PasswordHasher(max_pending=0))
+
+    with pytest.raises(HTTPException) as error:
+        helpers.hash_password("secret123")
+    assert error.value.status_code == 503
+    assert error.value.headers == {"Retry-After": "1"}
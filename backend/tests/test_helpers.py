@@ -0,0 +1,87 @@
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException, Response
+from starlette.requests import Request
+
+from helpers import in_request_order, not_modified, parse_ids
+
+VERSION = {"version": "42.1001", "last_modified": datetime(2025, 3, 1, 12, 30, 15, 500, tzinfo=timezone.utc)}
+
+
+def request(query: str = "", **headers) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/listings/1",
+            "query_string": query.encode(),
+            "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+        }
+    )
+
+
+def test_sets_validators_without_conditional_headers():
+    response = Response()
+    assert not_modified(request(), response, VERSION) is None
+    assert response.headers["etag"].startswith('"')
+    assert response.headers["last-modified"] == "Sat, 01 Mar 2025 12:30:15 GMT"
+    assert response.headers["cache-control"] == "no-cache"
+
+
+def test_matching_etag_is_not_modified():
+    response = Response()
+    not_modified(request(), response, VERSION)
+    etag = response.headers["etag"]
+
+    cached = not_modified(request(if_none_match=f'W/{etag}, "other"'), Response(), VERSION)
+    assert cached.status_code == 304
+    assert cached.headers["etag"] == etag
+    assert not_modified(request(if_none_match='"other"'), Response(), VERSION) is None
+
+
+def test_etag_depends_on_version_and_query():
+    etags = set()
+    for query, version in (("", VERSION), ("expand=media", VERSION), ("", {**VERSION, "version": "42.1002"})):
+        response = Response()
+        not_modified(request(query), response, version)
+        etags.add(response.headers["etag"])
+    assert len(etags) == 3
+
+
+def test_if_modified_since():
+    assert not_modified(
+        request(if_modified_since="Sat, 01 Mar 2025 12:30:15 GMT"), Response(), VERSION
+    ).status_code == 304
+    assert not_modified(
+        request(if_modified_since="Sat, 01 Mar 2025 12:30:14 GMT"), Response(), VERSION
+    ) is None
+    assert not_modified(request(if_modified_since="yesterday"), Response(), VERSION) is None
+
+
+def test_if_none_match_wins_over_if_modified_since():
+    response = not_modified(
+        request(if_none_match='"other"', if_modified_since="Sat, 01 Mar 2025 12:30:15 GMT"),
+        Response(),
+        VERSION,
+    )
+    assert response is None
+
+
+def test_missing_row_sets_nothing():
+    response = Response()
+    assert not_modified(request(if_none_match="*"), response, None) is None
+    assert "etag" not in response.headers
+
+
+def test_parse_ids_keeps_order_and_drops_repeats():
+    assert parse_ids("3, 1,3,,2") == [3, 1, 2]
+    for ids in ("", "1,x", ",".join(str(i) for i in range(201))):
+        with pytest.raises(HTTPException) as error:
+            parse_ids(ids)
+        assert error.value.status_code == 400
+
+
+def test_in_request_order_reports_missing_ids():
+    rows = [{"id": 1}, {"id": 3}]
+    assert in_request_order([3, 2, 1], rows) == {"items": [{"id": 3}, {"id": 1}], "missing": [2]}
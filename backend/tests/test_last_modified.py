@@ -0,0 +1,30 @@
+import pytest
+
+
+@pytest.fixture
+def linked_agent(db_cursor):
+    db_cursor.execute("SELECT agent_id, agency_id FROM agent_agencies ORDER BY agent_id LIMIT 1")
+    link = db_cursor.fetchone()
+    if link is None:
+        pytest.skip("no agent with an agency")
+    db_cursor.execute("UPDATE agents SET updated_at = '2000-01-01' WHERE id = %s", (link[0],))
+    return link
+
+
+def touched(cursor, agent_id):
+    cursor.execute("SELECT updated_at = NOW() FROM agents WHERE id = %s", (agent_id,))
+    return cursor.fetchone()[0]
+
+
+def test_changed_agency_link_touches_the_agent(db_cursor, linked_agent):
+    agent_id, _ = linked_agent
+    db_cursor.execute("UPDATE agent_agencies SET agency_id = agency_id WHERE agent_id = %s", (agent_id,))
+
+    assert touched(db_cursor, agent_id)
+
+
+def test_removed_agency_link_touches_the_agent(db_cursor, linked_agent):
+    agent_id, _ = linked_agent
+    db_cursor.execute("DELETE FROM agent_agencies WHERE agent_id = %s", (agent_id,))
+
+    assert touched(db_cursor, agent_id)
@@ -0,0 +1,35 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from helpers import get_async_db, get_db
+from routers import all_routers
+
+# app.py runs the database setup on import, so mount the routers on a bare app
+app = FastAPI()
+for router in all_routers:
+    app.include_router(router)
+
+
+@pytest.fixture
+def client():
+    # validation runs before the endpoint body, so the connection is never used
+    def no_db():
+        yield None
+
+    async def no_async_db():
+        yield None
+
+    app.dependency_overrides[get_db] = no_db
+    app.dependency_overrides[get_async_db] = no_async_db
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+
+
+@pytest.mark.parametrize("path", ["/listings/", "/agents/", "/agencies/", "/users/"])
+@pytest.mark.parametrize("params", [{"limit": 0}, {"limit": -2}, {"offset": -1}])
+def test_list_endpoints_reject_out_of_range_paging(client, path, params):
+    response = client.get(path, params=params)
+    assert response.status_code == 422
@@ -0,0 +1,62 @@
+import io
+import json
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from listing_import import RowError, _convert, read_rows
+
+
+@pytest.mark.parametrize(
+    "name, value, expected",
+    [
+        ("agent_id", " 12 ", 12),
+        ("agent_id", 12, 12),
+        ("floor", "-1", -1),
+        ("list_price", "4950000.50", Decimal("4950000.50")),
+        ("published_at", "2025-03-01T12:00:00+01:00", datetime.fromisoformat("2025-03-01T12:00:00+01:00")),
+        ("description", "", None),
+        ("title", "  Villa  ", "Villa"),
+    ],
+)
+def test_convert(name, value, expected):
+    assert _convert(name, value) == expected
+
+
+@pytest.mark.parametrize(
+    "name, value, error",
+    [
+        ("title", None, "title is required"),
+        ("agent_id", "12.5", "agent_id is not a valid integer"),
+        ("agent_id", 12.0, "agent_id is not a valid integer"),
+        ("agent_id", str(2**31), "agent_id is out of range"),
+        ("year_built", -(2**31) - 1, "year_built is out of range"),
+        ("list_price", "NaN", "list_price is not a valid number"),
+        ("list_price", "1e131072", "list_price is out of range"),
+        ("published_at", "yesterday", "published_at is not a valid ISO 8601 timestamp"),
+        ("title", "x" * 256, "title is longer than 255 characters"),
+    ],
+)
+def test_convert_rejects(name, value, error):
+    with pytest.raises(RowError, match=error):
+        _convert(name, value)
+
+
+def test_read_rows_csv_reports_line_numbers():
+    feed = "external_ref,title\nA-1,Villa\nA-2,Etta\n".encode()
+    assert list(read_rows(io.BytesIO(feed), "csv")) == [
+        (2, {"external_ref": "A-1", "title": "Villa"}, None),
+        (3, {"external_ref": "A-2", "title": "Etta"}, None),
+    ]
+
+
+def test_read_rows_ndjson_reports_bad_lines_and_skips_blank_ones():
+    feed = "\n".join(
+        [json.dumps({"external_ref": "A-1"}), "", "{not json", json.dumps([1, 2])]
+    ).encode()
+    assert list(read_rows(io.BytesIO(feed), "ndjson")) == [
+        (1, {"external_ref": "A-1"}, None),
+        (3, None, "not valid JSON"),
+        (4, None, "expected a JSON object"),
+    ]
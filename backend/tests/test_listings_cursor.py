@@ -0,0 +1,35 @@
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from routers.listings import _decode_cursor, _encode_cursor
+
+
+def test_cursor_round_trip():
+    cursor = _encode_cursor("price_asc", {"sort_key": "4950000.00", "id": 17})
+    assert "=" not in cursor
+    assert _decode_cursor("price_asc", cursor) == ("4950000.00", 17)
+
+
+def test_cursor_from_another_sort_is_rejected():
+    cursor = _encode_cursor("newest", {"sort_key": "2025-01-01", "id": 3})
+    with pytest.raises(HTTPException) as error:
+        _decode_cursor("price_asc", cursor)
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "not base64 !",
+        base64.urlsafe_b64encode(b"not json").decode(),
+        base64.urlsafe_b64encode(json.dumps(["id", 1]).encode()).decode(),
+        base64.urlsafe_b64encode(json.dumps(["id", "1", "2"]).encode()).decode(),
+    ],
+)
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        _decode_cursor("id", cursor)
+    assert error.value.status_code == 400
@@ -0,0 +1,37 @@
+import pytest
+
+from prepared import Statement, statement
+
+
+def test_placeholders_become_numbered_parameters():
+    query = Statement("listing_media", "SELECT * FROM listing_media WHERE listing_id = %s LIMIT %s OFFSET %s")
+    assert query.prepare_sql == (
+        "PREPARE listing_media AS SELECT * FROM listing_media WHERE listing_id = $1 LIMIT $2 OFFSET $3"
+    )
+    assert query.execute_sql == "EXECUTE listing_media(%s, %s, %s)"
+
+
+def test_escaped_percent_is_kept_literal():
+    query = Statement("by_title", "SELECT id FROM listings WHERE title LIKE '%%villa%%' AND id > %s")
+    assert query.prepare_sql == "PREPARE by_title AS SELECT id FROM listings WHERE title LIKE '%villa%' AND id > $1"
+    assert query.execute_sql == "EXECUTE by_title(%s)"
+
+
+def test_statement_without_parameters():
+    assert Statement("all_statuses", "SELECT * FROM listing_status").execute_sql == "EXECUTE all_statuses"
+
+
+def test_registry_returns_the_same_statement():
+    first = statement("test_registry_statement", "SELECT %s")
+    assert statement("test_registry_statement", "SELECT %s") is first
+    with pytest.raises(ValueError):
+        statement("test_registry_statement", "SELECT %s + 1")
+
+
+@pytest.mark.parametrize(
+    "name, sql",
+    [("Bad-Name", "SELECT 1"), ("named_parameters", "SELECT %(id)s")],
+)
+def test_registry_rejects_invalid_statements(name, sql):
+    with pytest.raises(ValueError):
+        statement(name, sql)
@@ -0,0 +1,67 @@
+import pytest
+from fastapi import HTTPException
+
+from helpers import MAX_BATCH_IDS
+from routers.users import delete_saved_listings, save_listings
+from schemas import SavedListingsBulk
+
+USER_ID = 7
+
+
+@pytest.fixture
+def connection(db_cursor):
+    # the endpoints commit, so they write to a temporary copy that goes with the connection
+    db_cursor.execute(
+        "CREATE TEMP TABLE saved_listings (LIKE public.saved_listings INCLUDING ALL)"
+    )
+    db_cursor.connection.commit()
+    return db_cursor.connection
+
+
+@pytest.fixture
+def listing_ids(db_cursor):
+    db_cursor.execute("SELECT id FROM listings ORDER BY id LIMIT 2")
+    ids = [row[0] for row in db_cursor.fetchall()]
+    if len(ids) < 2:
+        pytest.skip("needs two listings")
+    db_cursor.execute("SELECT MAX(id) + 1000 FROM listings")
+    return ids + [db_cursor.fetchone()[0]]
+
+
+def bulk(endpoint, connection, listing_ids):
+    return endpoint(USER_ID, SavedListingsBulk(listing_ids=listing_ids), connection=connection, _=None)
+
+
+@pytest.mark.parametrize("endpoint", [save_listings, delete_saved_listings])
+@pytest.mark.parametrize("listing_ids", [[], list(range(1, MAX_BATCH_IDS + 2))])
+def test_empty_or_oversized_lists_are_rejected(endpoint, listing_ids):
+    with pytest.raises(HTTPException) as error:
+        bulk(endpoint, None, listing_ids)
+    assert error.value.status_code == 400
+
+
+def test_save_reports_every_listing_in_request_order(connection, listing_ids):
+    first, second, missing = listing_ids
+    bulk(save_listings, connection, [second])
+
+    result = bulk(save_listings, connection, [missing, first, second, first])
+
+    assert result == {
+        "changed": 1,
+        "items": [
+            {"listing_id": missing, "result": "not_found"},
+            {"listing_id": first, "result": "saved"},
+            {"listing_id": second, "result": "already_saved"},
+        ],
+    }
+
+
+def test_unsave_reports_what_was_not_saved(connection, listing_ids):
+    first, second, missing = listing_ids
+    bulk(save_listings, connection, [first, second])
+
+    result = bulk(delete_saved_listings, connection, [second, missing, first])
+
+    assert result["changed"] == 2
+    assert [item["result"] for item in result["items"]] == ["removed", "not_saved", "removed"]
+    assert bulk(delete_saved_listings, connection, [first])["changed"] == 0
@@ -0,0 +1,87 @@
+import pytest
+
+from saved_search_matching import match_saved_searches
+
+USER_ID = 1
+
+
+@pytest.fixture
+def cursor(db_cursor):
+    # temporary tables shadow the real ones for this transaction only
+    for table in ["listing_search", "saved_searches", "saved_search_property_type", "saved_search_notifications"]:
+        db_cursor.execute(
+            f"CREATE TEMP TABLE {table} (LIKE public.{table} INCLUDING DEFAULTS "
+            f"INCLUDING GENERATED INCLUDING IDENTITY INCLUDING INDEXES) ON COMMIT DROP"
+        )
+    return db_cursor
+
+
+def add_listing(cursor, listing_id, title, city, list_price=4950000, rooms=3, status="for_sale"):
+    cursor.execute(
+        """
+        INSERT INTO listing_search (
+            id, title, status_id, status, list_price, property_id, property_type_id,
+            property_type, tenure_id, tenure, rooms, street_address, postal_code, city,
+            municipality, search_document
+        )
+        VALUES (
+            %(id)s, %(title)s, 1, %(status)s, %(list_price)s, 1, 1, 'villa', 1, 'freehold',
+            %(rooms)s, 'Storgatan 1', '111 22', %(city)s, %(city)s,
+            setweight(to_tsvector('swedish', %(title)s), 'A')
+            || setweight(to_tsvector('swedish', %(city)s), 'B')
+        )
+        """,
+        {"id": listing_id, "title": title, "status": status, "list_price": list_price, "rooms": rooms, "city": city},
+    )
+
+
+def add_saved_search(cursor, query=None, location=None, price_max=None):
+    cursor.execute(
+        """
+        INSERT INTO saved_searches (user_id, query, location, price_max)
+        VALUES (%s, %s, %s, %s)
+        RETURNING id
+        """,
+        (USER_ID, query, location, price_max),
+    )
+    return cursor.fetchone()[0]
+
+
+def matches(cursor, listing_ids):
+    match_saved_searches(cursor, listing_ids, "created")
+    cursor.execute("SELECT saved_search_id, listing_id FROM saved_search_notifications ORDER BY 1, 2")
+    return cursor.fetchall()
+
+
+def test_query_is_a_prefix_match_on_every_word(cursor):
+    add_listing(cursor, 1, "Rymlig villa vid sjön", "Uppsala")
+    add_listing(cursor, 2, "Ljus lägenhet", "Uppsala")
+    villa = add_saved_search(cursor, query="vill")
+    both_words = add_saved_search(cursor, query="rymlig vill")
+    add_saved_search(cursor, query="radhus")
+
+    assert matches(cursor, [1, 2]) == [(villa, 1), (both_words, 1)]
+
+
+def test_query_without_words_matches_every_listing(cursor):
+    add_listing(cursor, 1, "Rymlig villa", "Uppsala")
+    anything = add_saved_search(cursor, query="!!")
+
+    assert matches(cursor, [1]) == [(anything, 1)]
+
+
+def test_location_matches_part_of_the_city_like_the_list_filter(cursor):
+    add_listing(cursor, 1, "Villa", "Stockholm")
+    add_listing(cursor, 2, "Villa", "Göteborg")
+    stock = add_saved_search(cursor, location="stock")
+    anywhere = add_saved_search(cursor, location="")
+
+    assert matches(cursor, [1, 2]) == [(stock, 1), (anywhere, 1), (anywhere, 2)]
+
+
+def test_other_filters_and_status_still_apply(cursor):
+    add_listing(cursor, 1, "Villa", "Uppsala", list_price=9000000)
+    add_listing(cursor, 2, "Villa", "Uppsala", status="sold")
+    add_saved_search(cursor, query="villa", price_max=5000000)
+
+    assert matches(cursor, [1, 2]) == []
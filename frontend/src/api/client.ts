@@ -261,6 +261,34 @@ export async function fetchProperty(id: string): Promise<Property | null> {
   }
 }
 
+// the backend's MAX_BATCH_IDS, larger lists are fetched in chunks of this size
+const MAX_BATCH_IDS = 200
+
+export async function fetchListingsByIds(ids: string[]): Promise<Property[]> {
+  if (ids.length === 0) {
+    return []
+  }
+
+  const chunks: string[][] = []
+  for (let start = 0; start < ids.length; start += MAX_BATCH_IDS) {
+    chunks.push(ids.slice(start, start + MAX_BATCH_IDS))
+  }
+
+  try {
+    const pages = await Promise.all(
+      chunks.map((chunk) =>
+        fetchJson<{ items?: ApiProperty[]; missing?: number[] }>(
+          `/listings/batch?ids=${chunk.map(encodeURIComponent).join(',')}`,
+        ),
+      ),
+    )
+    return pages.flatMap((data) => (data.items ?? []).map(normalizeProperty))
+  } catch (error) {
+    console.error('Failed to fetch listings', error)
+    return []
+  }
+}
+
 export async function fetchSavedListings(userId: number, token: string): Promise<string[]> {
   if (!token) {
     throw new Error('Missing auth token for fetching saved listings')
@@ -1,6 +1,6 @@
 import { HeartIcon } from '@heroicons/react/24/outline'
 import { useEffect, useState } from 'react'
-import { fetchListingMedia, fetchProperty } from '../api/client'
+import { fetchListingsByIds } from '../api/client'
 import { PropertyCard } from '../components/PropertyCard'
 import { useFavorites } from '../context/FavoritesContext'
 import type { Property } from '../types'
@@ -17,19 +17,10 @@ export function FavoritesPage() {
     }
 
     let cancelled = false
-    Promise.all(
-      Array.from(favorites).map(async (id) => {
-        const property = await fetchProperty(id)
-        if (!property) return null
-        const media = await fetchListingMedia(id)
-        if (media.length > 0) {
-          return { ...property, image: media[0], images: media }
-        }
-        return property
-      }),
-    ).then((items) => {
+    // the batch response carries the images, one request for the whole page
+    fetchListingsByIds(Array.from(favorites)).then((items) => {
       if (cancelled) return
-      setSaved(items.filter(Boolean) as Property[])
+      setSaved(items)
     })
 
     return () => {
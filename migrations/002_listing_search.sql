@@ -0,0 +1,221 @@
+-- ============================================
+-- listing_search: one flat row per listing for the list view
+-- ============================================
+
+-- the primary key leads with property_id, listing_search_source joins on listing_id
+CREATE INDEX IF NOT EXISTS idx_listing_properties_listing ON listing_properties(listing_id);
+
+
+CREATE TABLE IF NOT EXISTS listing_search (
+    id                  INTEGER PRIMARY KEY REFERENCES listings(id) ON DELETE CASCADE,
+    title               VARCHAR(255) NOT NULL,
+    status_id           INTEGER NOT NULL,
+    status              VARCHAR(100) NOT NULL,
+    list_price          NUMERIC,
+    published_at        TIMESTAMPTZ,
+    property_id         INTEGER NOT NULL,
+    property_type_id    INTEGER NOT NULL,
+    property_type       VARCHAR(100) NOT NULL,
+    tenure_id           INTEGER NOT NULL,
+    tenure              VARCHAR(100) NOT NULL,
+    rooms               NUMERIC,
+    living_area_sqm     NUMERIC,
+    price_per_sqm       NUMERIC,
+    street_address      VARCHAR(255) NOT NULL,
+    postal_code         VARCHAR(32) NOT NULL,
+    city                VARCHAR(100) NOT NULL,
+    municipality        VARCHAR(100),
+    latitude            NUMERIC,
+    longitude           NUMERIC,
+    image               TEXT,
+    search_document     TSVECTOR NOT NULL,
+    refreshed_at        TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+
+-- single definition of a listing_search row, used by both the trigger refresh and the rebuild
+CREATE OR REPLACE VIEW listing_search_source AS
+SELECT DISTINCT ON (l.id)
+       l.id,
+       l.title,
+       l.status_id,
+       ls.name AS status,
+       l.list_price,
+       l.published_at,
+       p.id AS property_id,
+       p.property_type_id,
+       pt.name AS property_type,
+       p.tenure_id,
+       t.name AS tenure,
+       p.rooms,
+       p.living_area_sqm,
+       l.list_price / NULLIF(p.living_area_sqm, 0) AS price_per_sqm,
+       loc.street_address,
+       loc.postal_code,
+       loc.city,
+       loc.municipality,
+       loc.latitude,
+       loc.longitude,
+       (
+           SELECT lm.url
+           FROM listing_media lm
+           WHERE lm.listing_id = l.id AND lm.media_type_id = 1
+           ORDER BY lm.id
+           LIMIT 1
+       ) AS image,
+       setweight(to_tsvector('swedish', COALESCE(l.title, '')), 'A') ||
+       setweight(to_tsvector('swedish', concat_ws(' ', loc.city, loc.municipality)), 'B') ||
+       setweight(to_tsvector('swedish', COALESCE(loc.street_address, '')), 'C') ||
+       setweight(to_tsvector('swedish', COALESCE(l.description, '')), 'D') AS search_document
+FROM listings l
+JOIN listing_status ls ON l.status_id = ls.id
+JOIN listing_properties lp ON l.id = lp.listing_id
+JOIN properties p ON lp.property_id = p.id
+JOIN property_types pt ON p.property_type_id = pt.id
+JOIN tenures t ON p.tenure_id = t.id
+JOIN locations loc ON p.location_id = loc.id
+ORDER BY l.id, p.id;
+
+
+CREATE OR REPLACE FUNCTION refresh_listing_search(p_listing_ids INTEGER[])
+RETURNS VOID AS $$
+    DELETE FROM listing_search WHERE id = ANY(p_listing_ids);
+
+    INSERT INTO listing_search (
+        id, title, status_id, status, list_price, published_at, property_id,
+        property_type_id, property_type, tenure_id, tenure, rooms, living_area_sqm,
+        price_per_sqm, street_address, postal_code, city, municipality, latitude,
+        longitude, image, search_document
+    )
+    SELECT id, title, status_id, status, list_price, published_at, property_id,
+           property_type_id, property_type, tenure_id, tenure, rooms, living_area_sqm,
+           price_per_sqm, street_address, postal_code, city, municipality, latitude,
+           longitude, image, search_document
+    FROM listing_search_source
+    WHERE id = ANY(p_listing_ids);
+$$ LANGUAGE sql;
+
+
+CREATE OR REPLACE FUNCTION rebuild_listing_search()
+RETURNS BIGINT AS $$
+    DELETE FROM listing_search;
+
+    INSERT INTO listing_search (
+        id, title, status_id, status, list_price, published_at, property_id,
+        property_type_id, property_type, tenure_id, tenure, rooms, living_area_sqm,
+        price_per_sqm, street_address, postal_code, city, municipality, latitude,
+        longitude, image, search_document
+    )
+    SELECT id, title, status_id, status, list_price, published_at, property_id,
+           property_type_id, property_type, tenure_id, tenure, rooms, living_area_sqm,
+           price_per_sqm, street_address, postal_code, city, municipality, latitude,
+           longitude, image, search_document
+    FROM listing_search_source;
+
+    SELECT COUNT(*) FROM listing_search;
+$$ LANGUAGE sql;
+
+
+-- ============================================
+-- Triggers keeping listing_search current
+-- ============================================
+
+CREATE OR REPLACE FUNCTION listing_search_from_listing_row()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM refresh_listing_search(ARRAY[OLD.listing_id]);
+    ELSIF TG_OP = 'UPDATE' AND OLD.listing_id <> NEW.listing_id THEN
+        PERFORM refresh_listing_search(ARRAY[OLD.listing_id, NEW.listing_id]);
+    ELSE
+        PERFORM refresh_listing_search(ARRAY[NEW.listing_id]);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION listing_search_from_listings()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM refresh_listing_search(ARRAY[NEW.id]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_listing_search_listings ON listings;
+CREATE TRIGGER trg_listing_search_listings
+    AFTER INSERT OR UPDATE ON listings
+    FOR EACH ROW EXECUTE FUNCTION listing_search_from_listings();
+
+
+DROP TRIGGER IF EXISTS trg_listing_search_listing_properties ON listing_properties;
+CREATE TRIGGER trg_listing_search_listing_properties
+    AFTER INSERT OR UPDATE OR DELETE ON listing_properties
+    FOR EACH ROW EXECUTE FUNCTION listing_search_from_listing_row();
+
+
+DROP TRIGGER IF EXISTS trg_listing_search_listing_media ON listing_media;
+CREATE TRIGGER trg_listing_search_listing_media
+    AFTER INSERT OR UPDATE OR DELETE ON listing_media
+    FOR EACH ROW EXECUTE FUNCTION listing_search_from_listing_row();
+
+
+CREATE OR REPLACE FUNCTION listing_search_from_properties()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM refresh_listing_search(ARRAY(
+        SELECT listing_id FROM listing_properties WHERE property_id = NEW.id
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_listing_search_properties ON properties;
+CREATE TRIGGER trg_listing_search_properties
+    AFTER UPDATE ON properties
+    FOR EACH ROW EXECUTE FUNCTION listing_search_from_properties();
+
+
+CREATE OR REPLACE FUNCTION listing_search_from_locations()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM refresh_listing_search(ARRAY(
+        SELECT lp.listing_id
+        FROM listing_properties lp
+        JOIN properties p ON lp.property_id = p.id
+        WHERE p.location_id = NEW.id
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_listing_search_locations ON locations;
+CREATE TRIGGER trg_listing_search_locations
+    AFTER UPDATE ON locations
+    FOR EACH ROW EXECUTE FUNCTION listing_search_from_locations();
+
+
+SELECT rebuild_listing_search();
+
+
+-- ============================================
+-- Indexes, the sort expressions must match SORT_OPTIONS in routers/listings.py
+-- ============================================
+
+CREATE INDEX IF NOT EXISTS idx_listing_search_price_asc
+    ON listing_search ((COALESCE(list_price, 'Infinity'::numeric)), id);
+CREATE INDEX IF NOT EXISTS idx_listing_search_price_desc
+    ON listing_search ((COALESCE(list_price, '-Infinity'::numeric)), id);
+CREATE INDEX IF NOT EXISTS idx_listing_search_newest
+    ON listing_search ((COALESCE(published_at, '-infinity'::timestamptz)), id);
+CREATE INDEX IF NOT EXISTS idx_listing_search_living_area_desc
+    ON listing_search ((COALESCE(living_area_sqm, '-Infinity'::numeric)), id);
+CREATE INDEX IF NOT EXISTS idx_listing_search_price_per_sqm_asc
+    ON listing_search ((COALESCE(price_per_sqm, 'Infinity'::numeric)), id);
+CREATE INDEX IF NOT EXISTS idx_listing_search_document
+    ON listing_search USING GIN (search_document);
+CREATE INDEX IF NOT EXISTS idx_listing_search_status ON listing_search(status);
+CREATE INDEX IF NOT EXISTS idx_listing_search_property_type ON listing_search(property_type);
+CREATE INDEX IF NOT EXISTS idx_listing_search_list_price ON listing_search(list_price);
+CREATE INDEX IF NOT EXISTS idx_listing_search_rooms ON listing_search(rooms);
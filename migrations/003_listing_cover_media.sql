@@ -0,0 +1,62 @@
+-- ============================================
+-- Cover image pointer per listing, honouring listing_media.position
+-- ============================================
+
+ALTER TABLE listings
+    ADD COLUMN IF NOT EXISTS cover_media_id INTEGER REFERENCES listing_media(id) ON DELETE SET NULL;
+
+-- covers the cover lookup: first image of a listing by position, then id
+CREATE INDEX IF NOT EXISTS idx_listing_media_cover
+    ON listing_media(listing_id, media_type_id, position, id);
+
+UPDATE listings l
+SET cover_media_id = (
+    SELECT lm.id
+    FROM listing_media lm
+    WHERE lm.listing_id = l.id AND lm.media_type_id = 1
+    ORDER BY lm.position NULLS LAST, lm.id
+    LIMIT 1
+);
+
+
+-- the media endpoints now maintain listings.cover_media_id, which fires the listings trigger
+DROP TRIGGER IF EXISTS trg_listing_search_listing_media ON listing_media;
+
+CREATE OR REPLACE VIEW listing_search_source AS
+SELECT DISTINCT ON (l.id)
+       l.id,
+       l.title,
+       l.status_id,
+       ls.name AS status,
+       l.list_price,
+       l.published_at,
+       p.id AS property_id,
+       p.property_type_id,
+       pt.name AS property_type,
+       p.tenure_id,
+       t.name AS tenure,
+       p.rooms,
+       p.living_area_sqm,
+       l.list_price / NULLIF(p.living_area_sqm, 0) AS price_per_sqm,
+       loc.street_address,
+       loc.postal_code,
+       loc.city,
+       loc.municipality,
+       loc.latitude,
+       loc.longitude,
+       cover.url AS image,
+       setweight(to_tsvector('swedish', COALESCE(l.title, '')), 'A') ||
+       setweight(to_tsvector('swedish', concat_ws(' ', loc.city, loc.municipality)), 'B') ||
+       setweight(to_tsvector('swedish', COALESCE(loc.street_address, '')), 'C') ||
+       setweight(to_tsvector('swedish', COALESCE(l.description, '')), 'D') AS search_document
+FROM listings l
+JOIN listing_status ls ON l.status_id = ls.id
+JOIN listing_properties lp ON l.id = lp.listing_id
+JOIN properties p ON lp.property_id = p.id
+JOIN property_types pt ON p.property_type_id = pt.id
+JOIN tenures t ON p.tenure_id = t.id
+JOIN locations loc ON p.location_id = loc.id
+LEFT JOIN listing_media cover ON l.cover_media_id = cover.id
+ORDER BY l.id, p.id;
+
+SELECT rebuild_listing_search();
@@ -0,0 +1,93 @@
+-- ============================================
+-- Geospatial search: point (longitude, latitude) per listing with a GiST index
+-- ============================================
+
+ALTER TABLE listing_search
+    ADD COLUMN IF NOT EXISTS geo POINT;
+
+
+-- great-circle distance in km between two (longitude, latitude) points
+CREATE OR REPLACE FUNCTION haversine_km(a POINT, b POINT)
+RETURNS DOUBLE PRECISION AS $$
+    SELECT 2 * 6371.0088 * asin(sqrt(
+        sin(radians(b[1] - a[1]) / 2) ^ 2
+        + cos(radians(a[1])) * cos(radians(b[1])) * sin(radians(b[0] - a[0]) / 2) ^ 2
+    ))
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+
+CREATE OR REPLACE VIEW listing_search_source AS
+SELECT DISTINCT ON (l.id)
+       l.id,
+       l.title,
+       l.status_id,
+       ls.name AS status,
+       l.list_price,
+       l.published_at,
+       p.id AS property_id,
+       p.property_type_id,
+       pt.name AS property_type,
+       p.tenure_id,
+       t.name AS tenure,
+       p.rooms,
+       p.living_area_sqm,
+       l.list_price / NULLIF(p.living_area_sqm, 0) AS price_per_sqm,
+       loc.street_address,
+       loc.postal_code,
+       loc.city,
+       loc.municipality,
+       loc.latitude,
+       loc.longitude,
+       cover.url AS image,
+       setweight(to_tsvector('swedish', COALESCE(l.title, '')), 'A') ||
+       setweight(to_tsvector('swedish', concat_ws(' ', loc.city, loc.municipality)), 'B') ||
+       setweight(to_tsvector('swedish', COALESCE(loc.street_address, '')), 'C') ||
+       setweight(to_tsvector('swedish', COALESCE(l.description, '')), 'D') AS search_document,
+       CASE
+           WHEN loc.longitude IS NOT NULL AND loc.latitude IS NOT NULL
+           THEN point(loc.longitude, loc.latitude)
+       END AS geo
+FROM listings l
+JOIN listing_status ls ON l.status_id = ls.id
+JOIN listing_properties lp ON l.id = lp.listing_id
+JOIN properties p ON lp.property_id = p.id
+JOIN property_types pt ON p.property_type_id = pt.id
+JOIN tenures t ON p.tenure_id = t.id
+JOIN locations loc ON p.location_id = loc.id
+LEFT JOIN listing_media cover ON l.cover_media_id = cover.id
+ORDER BY l.id, p.id;
+
+
+CREATE OR REPLACE FUNCTION refresh_listing_search(p_listing_ids INTEGER[])
+RETURNS VOID AS $$
+    DELETE FROM listing_search WHERE id = ANY(p_listing_ids);
+
+    INSERT INTO listing_search (
+        id, title, status_id, status, list_price, published_at, property_id,
+        property_type_id, property_type, tenure_id, tenure, rooms, living_area_sqm,
+        price_per_sqm, street_address, postal_code, city, municipality, latitude,
+        longitude, image, search_document, geo
+    )
+    SELECT id, title, status_id, status, list_price, published_at, property_id,
+           property_type_id, property_type, tenure_id, tenure, rooms, living_area_sqm,
+           price_per_sqm, street_address, postal_code, city, municipality, latitude,
+           longitude, image, search_document, geo
+    FROM listing_search_source
+    WHERE id = ANY(p_listing_ids);
+$$ LANGUAGE sql;
+
+
+-- rebuild through refresh_listing_search so the column list lives in one place
+CREATE OR REPLACE FUNCTION rebuild_listing_search()
+RETURNS BIGINT AS $$
+    DELETE FROM listing_search;
+
+    SELECT refresh_listing_search(ARRAY(SELECT id FROM listings));
+
+    SELECT COUNT(*) FROM listing_search;
+$$ LANGUAGE sql;
+
+
+SELECT rebuild_listing_search();
+
+CREATE INDEX IF NOT EXISTS idx_listing_search_geo ON listing_search USING GIST (geo);
@@ -0,0 +1,27 @@
+-- ============================================
+-- Timestamps behind the Last-Modified of listing and agent detail
+-- ============================================
+
+ALTER TABLE locations
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+
+
+-- agent_agencies has no timestamp of its own, a changed link touches the agent so
+-- Last-Modified moves together with the ETag
+CREATE OR REPLACE FUNCTION agent_agencies_touch_agents()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE agents SET updated_at = NOW() WHERE id = OLD.agent_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE agents SET updated_at = NOW() WHERE id = NEW.agent_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_agent_agencies_touch_agents ON agent_agencies;
+CREATE TRIGGER trg_agent_agencies_touch_agents
+    AFTER INSERT OR UPDATE OR DELETE ON agent_agencies
+    FOR EACH ROW EXECUTE FUNCTION agent_agencies_touch_agents();
@@ -0,0 +1,9 @@
+-- ============================================
+-- listing_search filters by lookup id, names are resolved in the API
+-- ============================================
+
+DROP INDEX IF EXISTS idx_listing_search_status;
+DROP INDEX IF EXISTS idx_listing_search_property_type;
+
+CREATE INDEX IF NOT EXISTS idx_listing_search_status_id ON listing_search(status_id);
+CREATE INDEX IF NOT EXISTS idx_listing_search_property_type_id ON listing_search(property_type_id);
@@ -0,0 +1,8 @@
+-- ============================================
+-- Per user token cutoff, tokens issued before revoked_before are rejected
+-- ============================================
+
+CREATE TABLE IF NOT EXISTS token_revocations (
+    user_id         INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    revoked_before  TIMESTAMPTZ NOT NULL
+);
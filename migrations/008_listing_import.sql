@@ -0,0 +1,75 @@
+-- ============================================
+-- Bulk listing import: upserts are keyed on external_ref, and the
+-- listing_search triggers can be deferred to one set-based refresh
+-- ============================================
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_listings_external_ref ON listings(external_ref);
+
+
+-- SET LOCAL hemnet.defer_listing_search = 'on' skips the per row refresh, the
+-- transaction then calls refresh_listing_search once for everything it touched
+CREATE OR REPLACE FUNCTION listing_search_deferred()
+RETURNS BOOLEAN AS $$
+    SELECT COALESCE(current_setting('hemnet.defer_listing_search', true), '') = 'on'
+$$ LANGUAGE sql STABLE;
+
+
+CREATE OR REPLACE FUNCTION listing_search_from_listing_row()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF listing_search_deferred() THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        PERFORM refresh_listing_search(ARRAY[OLD.listing_id]);
+    ELSIF TG_OP = 'UPDATE' AND OLD.listing_id <> NEW.listing_id THEN
+        PERFORM refresh_listing_search(ARRAY[OLD.listing_id, NEW.listing_id]);
+    ELSE
+        PERFORM refresh_listing_search(ARRAY[NEW.listing_id]);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION listing_search_from_listings()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF listing_search_deferred() THEN
+        RETURN NULL;
+    END IF;
+    PERFORM refresh_listing_search(ARRAY[NEW.id]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION listing_search_from_properties()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF listing_search_deferred() THEN
+        RETURN NULL;
+    END IF;
+    PERFORM refresh_listing_search(ARRAY(
+        SELECT listing_id FROM listing_properties WHERE property_id = NEW.id
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+
+CREATE OR REPLACE FUNCTION listing_search_from_locations()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF listing_search_deferred() THEN
+        RETURN NULL;
+    END IF;
+    PERFORM refresh_listing_search(ARRAY(
+        SELECT lp.listing_id
+        FROM listing_properties lp
+        JOIN properties p ON lp.property_id = p.id
+        WHERE p.location_id = NEW.id
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
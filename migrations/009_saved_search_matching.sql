@@ -0,0 +1,49 @@
+-- ============================================
+-- Saved search matching: the predicates of a saved search are stored in an
+-- indexable form so a changed listing is only compared with a few candidates
+-- ============================================
+
+-- NULL bounds are unbounded, a min above the max can never match
+ALTER TABLE saved_searches
+    ADD COLUMN IF NOT EXISTS price_range NUMRANGE GENERATED ALWAYS AS (
+        CASE WHEN price_min > price_max THEN 'empty'::numrange
+             ELSE numrange(price_min, price_max, '[]')
+        END
+    ) STORED,
+    ADD COLUMN IF NOT EXISTS rooms_range NUMRANGE GENERATED ALWAYS AS (
+        CASE WHEN rooms_min > rooms_max THEN 'empty'::numrange
+             ELSE numrange(rooms_min, rooms_max, '[]')
+        END
+    ) STORED,
+    -- the query as a prefix match on every word, the same tsquery helpers.to_prefix_tsquery
+    -- builds for GET /listings, e.g. 'villa gö' -> 'villa:* & gö:*'. NULL = any listing
+    ADD COLUMN IF NOT EXISTS query_tsquery TSQUERY GENERATED ALWAYS AS (
+        CASE WHEN query ~ '\w' THEN
+            to_tsquery(
+                'swedish',
+                regexp_replace(btrim(regexp_replace(query, '\W+', ' ', 'g')), ' ', ':* & ', 'g') || ':*'
+            )
+        END
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_saved_searches_price_range ON saved_searches USING gist (price_range);
+CREATE INDEX IF NOT EXISTS idx_saved_searches_rooms_range ON saved_searches USING gist (rooms_range);
+
+-- saved searches without any property type rows match every type
+CREATE INDEX IF NOT EXISTS idx_saved_search_property_type_type
+    ON saved_search_property_type USING hash (property_type_id);
+
+
+CREATE TABLE IF NOT EXISTS saved_search_notifications (
+    id              BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    saved_search_id INTEGER NOT NULL REFERENCES saved_searches(id) ON DELETE CASCADE,
+    listing_id      INTEGER NOT NULL REFERENCES listings(id) ON DELETE CASCADE,
+    user_id         INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    event           VARCHAR(20) NOT NULL,
+    matched_at      TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    -- a listing is reported once per saved search
+    UNIQUE (saved_search_id, listing_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_saved_search_notifications_user
+    ON saved_search_notifications(user_id, matched_at);
@@ -0,0 +1,12 @@
+-- ============================================
+-- Saved search digests are sent from saved_search_notifications: every
+-- notification is mailed once and marked, instead of comparing published_at
+-- with a per search watermark (published_at is set by the business and can be
+-- older than the last digest when the listing is committed)
+-- ============================================
+
+-- NULL = not part of a digest yet
+ALTER TABLE saved_search_notifications ADD COLUMN IF NOT EXISTS digested_at TIMESTAMPTZ;
+
+CREATE INDEX IF NOT EXISTS idx_saved_search_notifications_pending
+    ON saved_search_notifications(user_id) WHERE digested_at IS NULL;
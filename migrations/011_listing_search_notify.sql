@@ -0,0 +1,42 @@
+-- ============================================
+-- Committed listing_search changes are announced on the listing_search
+-- channel, every API worker updates its autocomplete index from them
+-- ============================================
+
+-- the payload is the changed ids comma separated, or '*' when they don't fit in
+-- a notification (8000 bytes). Identical notifications of one transaction are
+-- delivered once, so the delete and insert of a refresh arrive as one
+CREATE OR REPLACE FUNCTION listing_search_notify()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_ids TEXT;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT string_agg(id::text, ',' ORDER BY id) INTO v_ids FROM old_rows;
+    ELSE
+        SELECT string_agg(id::text, ',' ORDER BY id) INTO v_ids FROM new_rows;
+    END IF;
+    IF v_ids IS NOT NULL THEN
+        PERFORM pg_notify('listing_search', CASE WHEN length(v_ids) > 7900 THEN '*' ELSE v_ids END);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_listing_search_notify_insert ON listing_search;
+CREATE TRIGGER trg_listing_search_notify_insert
+    AFTER INSERT ON listing_search
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION listing_search_notify();
+
+DROP TRIGGER IF EXISTS trg_listing_search_notify_update ON listing_search;
+CREATE TRIGGER trg_listing_search_notify_update
+    AFTER UPDATE ON listing_search
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION listing_search_notify();
+
+DROP TRIGGER IF EXISTS trg_listing_search_notify_delete ON listing_search;
+CREATE TRIGGER trg_listing_search_notify_delete
+    AFTER DELETE ON listing_search
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION listing_search_notify();